@@ -1,10 +1,14 @@
-from PyQt5 import uic
 from PyQt5.QtGui import QWindow
 from PyQt5.QtWidgets import QMessageBox
-from Employees import EmployeesDialog
-from ProductLines import ProductLinesDialog
-from Pinnacle_wh import perform_ETL_warehouse
-from mydbutils import executeScriptsFromFile, insert_csv
+from mydbutils import executeScriptsFromFile, insert_csv, load_csv_infile, pooled_connection
+from ui_cache import load_ui
+import etl_log
+
+# The dialogs and the warehouse ETL import pandas and matplotlib, which
+# take long to import, so they are imported when first used.
+
+# Rows per batch when orderdetails.csv is loaded in batches.
+CSV_BATCH_SIZE = 5000
 
 class AppWindow(QWindow):
     """
@@ -17,7 +21,7 @@ class AppWindow(QWindow):
         """
         super().__init__()
         
-        self.ui = uic.loadUi('demo_app.ui')
+        self.ui = load_ui('demo_app.ui')
         self.ui.show()
 
         # ETL for operational schema.
@@ -26,24 +30,32 @@ class AppWindow(QWindow):
         # ETL for warehouse schema.
         self.ui.etl_wh_button.clicked.connect(self._perform_ETL_WH)
         
-        # Employees dialog.
-        self._employees_dialog = EmployeesDialog()
+        # Employees dialog, created when it is first shown.
+        self._employees_dialog = None
         self.ui.employees_button.clicked.connect(self._show_employees_dialog)
         
-        # Product Lines dialog.
-        self._productLines_dialog = ProductLinesDialog()
+        # Product Lines dialog, created when it is first shown.
+        self._productLines_dialog = None
         self.ui.productLines_button.clicked.connect(self._show_productLines_dialog)
 
     def _show_employees_dialog(self):
         """
         Show the eployees dialog.
         """
+        if self._employees_dialog == None:
+            from Employees import EmployeesDialog
+            self._employees_dialog = EmployeesDialog()
+
         self._employees_dialog.show_dialog()
 
     def _show_productLines_dialog(self):
         """
         Show the product lines dialog.
         """
+        if self._productLines_dialog == None:
+            from ProductLines import ProductLinesDialog
+            self._productLines_dialog = ProductLinesDialog()
+
         self._productLines_dialog.show_dialog()
 
     def _perform_ETL_WH(self):
@@ -53,12 +65,17 @@ class AppWindow(QWindow):
         msg = QMessageBox()
         msg.setWindowTitle("Perform ETL For Warehouse:")
 
+        from Pinnacle_wh import perform_ETL_warehouse
+
+        log = etl_log.RunLog('warehouse')
+
         try:
-            perform_ETL_warehouse()
+            perform_ETL_warehouse(log=log)
             msg.setText("Successfully!")
         except:
             msg.setText("Unsuccessfully, please check pinnacle_wh schema or if the schema has been created!")
 
+        msg.setDetailedText(log.summary())
         x = msg.exec_()
 
     def _perform_ETL_DB(self):
@@ -68,16 +85,30 @@ class AppWindow(QWindow):
         msg = QMessageBox()
         msg.setWindowTitle("Perform ETL For Operational Schema:")
 
+        log = etl_log.RunLog('operational')
+
         # Create tables and insert data for operational database
-        check1 = executeScriptsFromFile("pinnacle_db.sql")
+        check1 = executeScriptsFromFile("pinnacle_db.sql", log=log)
+
+        # Isert data for orderdetails from csv file,
+        # row by row, in batches or with LOAD DATA LOCAL INFILE.
+        csv_mode = self.ui.csv_load_cb.currentIndex()
+
+        if csv_mode == 2:
+            check2 = load_csv_infile("orderdetails", "orderdetails.csv", log=log)
+        else:
+            batch_size = CSV_BATCH_SIZE if csv_mode == 1 else 0
+            check2 = insert_csv("INSERT INTO orderdetails VALUES (%s, %s, %s, %s)",
+            "orderdetails.csv", batch_size=batch_size, log=log)
 
-        # Isert data for orderdetails from csv file
-        check2 = insert_csv("INSERT INTO orderdetails VALUES (%s, %s, %s, %s)",
-        "orderdetails.csv")
+        with pooled_connection('pinnacle_db.ini') as conn:
+            if conn != None:
+                log.save_history(conn)
 
         if check1 == 1 and check2 == 1:
             msg.setText("Successfully!")
         else:
             msg.setText("Unsuccessfully, please check pinnacle_db schema or if the schema has been created!")
 
+        msg.setDetailedText(log.summary())
         x = msg.exec_()
\ No newline at end of file
@@ -0,0 +1,33 @@
+from PyQt5.QtWidgets import QGraphicsScene, QGraphicsView
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+
+# Dots per inch of the chart figures.
+CHART_DPI = 100
+
+class ChartView(QGraphicsView):
+    """
+    Window showing one chart of charts.py on a canvas that is kept for
+    the life of the dialog. Each query result updates the chart's
+    artists in place instead of building a new scene, figure and canvas.
+    """
+
+    def __init__(self, chart_class, *args, size=(10, 7), parent=None):
+        self._scene = QGraphicsScene()
+        super().__init__(self._scene, parent)
+
+        self.figure = Figure(figsize=size, dpi=CHART_DPI)
+        self.canvas = FigureCanvas(self.figure)
+        self.chart = chart_class(self.figure, *args)
+        self.figure.subplots_adjust(bottom=0.15)
+
+        self._scene.addWidget(self.canvas)
+        self.resize(int(size[0] * CHART_DPI) + 20, int(size[1] * CHART_DPI) + 20)
+
+    def show_chart(self, title, labels, values):
+        """
+        Update the chart with a query result and show the window.
+        """
+        self.chart.update(title, labels, values)
+        self.chart.refresh()
+        self.show()
@@ -1,8 +1,17 @@
 import sys
 from PyQt5.QtWidgets import QApplication
 from AppWindow import AppWindow
+from mydbutils import set_query_mode
 
 if __name__ == '__main__':
+    # The sales queries of the dashboards are answered from an in-memory
+    # cube, --local answers them from the newest warehouse snapshot and
+    # --server runs every query on the database.
+    if '--local' in sys.argv:
+        set_query_mode('local')
+    elif '--server' not in sys.argv:
+        set_query_mode('cube')
+
     app = QApplication(sys.argv)
     form = AppWindow()
     sys.exit(app.exec_())
\ No newline at end of file
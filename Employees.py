@@ -1,10 +1,16 @@
 import sys
-import pandas as pd
-from PyQt5 import uic
-from PyQt5.QtWidgets import QDialog, QApplication, QGraphicsScene, QGraphicsView
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from mydbutils import do_query, set_data_to_table_cells, adjust_column_widths
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QDialog, QApplication
+import sales_queries
+from functools import partial
+from mydbutils import do_query_cached, adjust_column_widths
+from SalesTableModel import SalesTableModel
+from QueryWorker import QueryExecutor
+from ui_cache import load_ui
+from locations import cities
+
+# matplotlib takes long to import, so the chart window is imported
+# when the first chart is drawn rather than when the dialog is created.
 
 class EmployeesDialog(QDialog):
     '''
@@ -18,16 +24,30 @@ class EmployeesDialog(QDialog):
         super().__init__()
         
         # Load the dialog components.
-        self.ui = uic.loadUi('employees_dialog.ui')
+        self.ui = load_ui('employees_dialog.ui')
 
+        # Runs the sales queries off the GUI thread.
+        self._queries = QueryExecutor(self)
+
+        # Models behind the sales tables, money columns are formatted when shown.
+        self._sales_model = SalesTableModel([5], self)
+        self.ui.sales_table.setModel(self._sales_model)
+        self._sales_model_location = SalesTableModel([7], self)
+        self.ui.sales_table_location.setModel(self._sales_model_location)
+
+        # Window of the sales chart, created with the first chart.
+        self._sales_chart = None
         
         ### PER EMPLOYEE
         # Employees menu and query button event handlers.
         self.ui.employees_cb.currentIndexChanged.connect(self._initialize_table)
         self.ui.query_button.clicked.connect(self._enter_sales_data)
 
+        # Every menu of the dialog is fetched with one query.
+        menus = sales_queries.split_menus(do_query_cached(*sales_queries.menus())[0])
+
         # Initialize the employees menu and sales table.
-        self._initialize_employees_menu()
+        self._initialize_employees_menu(menus['employees'])
         self._initialize_table()
         self.ui.monthly_radio.toggled.connect(self._initialize_table)
         self.ui.quarterly_radio.toggled.connect(self._initialize_table)
@@ -40,7 +60,7 @@ class EmployeesDialog(QDialog):
         self.ui.query_button_location.clicked.connect(self._enter_sales_data_location)
 
         # Initialize the location menu and sales table.
-        self._initialize_country_menu()
+        self._initialize_country_menu(menus['countries'])
         self._initialize_table_location()
         self.ui.monthly_radio_location.toggled.connect(self._initialize_table_location)
         self.ui.quarterly_radio_location.toggled.connect(self._initialize_table_location)
@@ -53,31 +73,19 @@ class EmployeesDialog(QDialog):
         """
         self.ui.show()
     
-    def _initialize_employees_menu(self):
+    def _initialize_employees_menu(self, rows):
         """
         Initialize the salesrepemployee menu with names from the database.
         """
-        sql = """
-            SELECT firstName, lastName FROM pinnacle_wh.salesrepemployee
-            ORDER BY firstName, lastName
-            """
-        rows, _ = do_query(sql)
-
         # Set the menu items to the employees' names.
         for row in rows:
             name = row[0] + ' ' + row[1]
             self.ui.employees_cb.addItem(name, row)
     
-    def _initialize_country_menu(self):
+    def _initialize_country_menu(self, rows_country):
         """
         Initialize the country menu of clients' location from the database.
         """
-        sql = """
-            SELECT distinct country FROM customers
-            ORDER BY country
-            """
-        rows_country, _ = do_query(sql)
-
         # Set the menu items to the country
         for row in rows_country:
             c = row[0]
@@ -85,29 +93,28 @@ class EmployeesDialog(QDialog):
 
     def _initialize_city_menu(self):
         """
-        Initialize the city menu of clients' location from the database.
+        Initialize the city menu of clients' location from the
+        location hierarchy the dialogs share.
         """
         self.ui.city_cb.clear()
         country = self.ui.country_cb.currentData()
         _country = country[0]
-        sql = """
-            SELECT distinct city FROM customers
-            WHERE country = '""" + _country + """' ORDER BY city
-            """ 
-        
-        rows_city, _ = do_query(sql)
 
-        # Set the menu items to the city by selected country
+        rows_city = cities(_country)
+
+        # Set the menu items to the city by selected country,
+        # with their number of customers as tooltip.
         self.ui.city_cb.addItem("All", ("All",))
-        for row in rows_city:
-            c = row[0]
-            self.ui.city_cb.addItem(c, row)
+        self.ui.city_cb.setItemData(0, f"Customers: {sum(n for _, n in rows_city)}", Qt.ToolTipRole)
+        for c, customers in rows_city:
+            self.ui.city_cb.addItem(c, (c,))
+            self.ui.city_cb.setItemData(self.ui.city_cb.count() - 1, f"Customers: {customers}", Qt.ToolTipRole)
         
     def _initialize_table(self):
         """
         Clear the table and set the column headers.
         """
-        self.ui.sales_table.clear()
+        self._sales_model.clear()
 
         if self.ui.monthly_radio.isChecked():
             month_quater = ' Month '
@@ -116,14 +123,14 @@ class EmployeesDialog(QDialog):
 
         col = ['  First Name  ', '  Last Name  ', '  Manager Name  ', month_quater, '  Year End  ', '  Revenue ($000) ']
 
-        self.ui.sales_table.setHorizontalHeaderLabels(col)        
+        self._sales_model.set_headers(col)
         adjust_column_widths(self.ui.sales_table)
 
     def _initialize_table_location(self):
         """
         Clear the table and set the column headers.
         """
-        self.ui.sales_table_location.clear()
+        self._sales_model_location.clear()
 
         if self.ui.monthly_radio_location.isChecked():
             month_quater = ' Month '
@@ -132,7 +139,7 @@ class EmployeesDialog(QDialog):
 
         col = [' Country ', ' City ', ' First Name ', ' Last Name ', ' Manager Name ', month_quater, ' Year End ', ' Revenue ($000) ']
 
-        self.ui.sales_table_location.setHorizontalHeaderLabels(col)        
+        self._sales_model_location.set_headers(col)
         adjust_column_widths(self.ui.sales_table_location)
         
     def _enter_sales_data(self):    
@@ -150,49 +157,28 @@ class EmployeesDialog(QDialog):
         elif self.ui.quarterly_radio.isChecked():
             month_quater = 'qtr'
 
-        sql = ( """
-            SELECT sa.firstName, sa.lastName, sa.managerName, ca."""+ month_quater +""", ca.year, sum(sh.quantityOrdered*sh.priceEach)
-            FROM shippedorders sh
-            JOIN salesrepemployee sa ON sa.employeeNumber = sh.salesRepEmployeeNumber
-            JOIN calendar ca ON ca.calendar_key = sh.calendar_key
-            WHERE sa.firstName = '""" + first_name + """'
-            AND sa.lastName = '""" + last_name + """'
-            GROUP BY sa.firstName, sa.lastName, sa.managerName, """+ month_quater +""", ca.year
-            ORDER BY sa.firstName, sa.lastName, ca.year, """+ month_quater +"""
-            """ 
-              )
-
         # Return data from database
-        rows, count = do_query(sql)
-
-        # Plot the sales performance
-        df = pd.DataFrame(rows,columns=['First Name', 'Last Name', 'Manager Name', 'M/Q', 'Year', 'Revenue ($000)'])
-        df['Time'] = pd.to_datetime(df['Year'].astype(str) + df['M/Q'].astype(str), format='%Y%m').dt.strftime('%m-%Y')
-
-        # print(df)
-
-        X = df['Revenue ($000)']
-        Y = df['Time']
-        # self.ui.graphicsView.clear()
-        scene = QGraphicsScene()
-        self.ui.label = QGraphicsView(scene)
-        figure = Figure()
-        figure.set_size_inches(len(X), 7)
-        axes = figure.gca()
-        axes.set_title(f"Sales Performance Of {first_name} {last_name}")
-        axes.plot(Y, X, "-k", color="red", label="Revenue Made ($000)")
-        axes.legend()
-        axes.grid(True)
-        axes.xaxis.label.set_size(5)
-
-        canvas = FigureCanvas(figure)
-        proxy_widget = scene.addWidget(canvas)
-
-        self.ui.label.resize(100*len(X), 700)
-        self.ui.label.show()
-        
+        self._queries.submit('sales', sales_queries.employee_sales(first_name, last_name, month_quater),
+                             partial(self._show_sales_data, first_name, last_name, month_quater),
+                             [self.ui.query_button])
+
+    def _show_sales_data(self, first_name, last_name, period, rows):
+        """
+        Plot the sales of an employee and set them into the table.
+        """
+        from ChartView import ChartView
+        from charts import LineChart, period_labels
+
+        # Plot the sales performance on the chart kept for the dialog.
+        if self._sales_chart == None:
+            self._sales_chart = ChartView(LineChart, "Revenue Made ($000)")
+
+        labels = period_labels([row[3] for row in rows], [row[4] for row in rows], period)
+        self._sales_chart.show_chart(f"Sales Performance Of {first_name} {last_name}",
+                                     labels, [row[5] for row in rows])
+
         # Set the sales data into the table cells.
-        set_data_to_table_cells(self.ui.sales_table, rows, [5])
+        self._sales_model.set_rows(rows)
                 
         adjust_column_widths(self.ui.sales_table)
 
@@ -213,29 +199,17 @@ class EmployeesDialog(QDialog):
         elif self.ui.quarterly_radio_location.isChecked():
             month_quater = 'qtr'
 
-        if _city == 'All':
-            _city = (f"cu.city")
-        else:
-            _city = (f"\'{_city}\'")
-        
-        sql = ( """
-            SELECT cu.country, cu.city, sa.firstName, sa.lastName, sa.managerName, ca."""+ month_quater +""", ca.year, sum(sh.quantityOrdered*sh.priceEach)
-            FROM shippedorders sh
-            JOIN salesrepemployee sa ON sa.employeeNumber = sh.salesRepEmployeeNumber
-            JOIN calendar ca ON ca.calendar_key = sh.calendar_key
-            JOIN customers cu on cu.customerNumber = sh.customerNumber
-            WHERE cu.country = '""" + _country + """'
-            AND cu.city = """ + _city + """
-            GROUP BY cu.country, cu.city, sa.firstName, sa.lastName, sa.managerName, ca."""+ month_quater +""", ca.year
-            ORDER BY cu.country, cu.city, sa.firstName, sa.lastName, ca.year, ca."""+ month_quater +"""
-            """ 
-            )
-
         # Return data from database
-        rows, count = do_query(sql)
-        
+        self._queries.submit('sales_location', sales_queries.employee_sales_location(_country, _city, month_quater),
+                             self._show_sales_data_location,
+                             [self.ui.query_button_location])
+
+    def _show_sales_data_location(self, rows):
+        """
+        Set the sales per location into the table.
+        """
         # Set the sales data into the table cells.
-        set_data_to_table_cells(self.ui.sales_table_location, rows, [7])
+        self._sales_model_location.set_rows(rows)
                 
         adjust_column_widths(self.ui.sales_table_location)
         
@@ -1,212 +1,1058 @@
-from mydbutils import make_connection, do_query_return_all, do_query
-from pandas import DataFrame
-import mysql.connector
+from mydbutils import get_pool, pooled_connection, bump_warehouse_version, Error
+from etl_dag import run_dag
+from etl_frames import calendar_frame, frame_rows
+import etl_frames
+import etl_log
+import warehouse_snapshot
+from functools import partial
+import datetime
+import decimal
+import re
 import pandas as pd
+import time
 
-def perform_ETL_warehouse():
-    conn_warehouse = make_connection(config_file = 'pinnacle_wh.ini')
-    cursor_warehouse = conn_warehouse.cursor()
-    conn = make_connection(config_file = 'pinnacle_db.ini')
-    cursor = conn.cursor()
-
-    def make_table(table, sql):
-        cursor_warehouse.execute(f"DROP TABLE IF EXISTS {table}")
-        cursor_warehouse.execute(sql)
-
-    # Calendar dimension
-    sql =   ("""
-            CREATE TABLE calendar
-            (
-                calendar_key INT NOT NULL AUTO_INCREMENT,
-                full_date DATE,
-                day_of_week VARCHAR(9),
-                day_of_month INT,
-                month INT,
-                qtr INT,
-                year INT,
-                PRIMARY KEY (calendar_key)
-            )
-            """
-            )
-
-    make_table('calendar', sql)
-
-    sql = ( """
-            INSERT INTO pinnacle_wh.calendar(full_date, day_of_week, 
-                                                day_of_month, month, 
-                                                qtr, year)
-                SELECT DISTINCT requiredDate, dayname(requiredDate), 
-                                day(requiredDate), month(requiredDate), 
-                                quarter(requiredDate), year(requiredDate)
-                FROM pinnacle_db.orders
-                WHERE status = 'Shipped'
-            """
+# Warehouse tables in load order, with their definitions. The names
+# in braces are filled in with the table a load writes to.
+TABLES = {
+    # Calendar dimension, keyed by the date as a YYYYMMDD number
+    'calendar': """
+        CREATE TABLE {calendar}
+        (
+            calendar_key INT NOT NULL,
+            full_date DATE,
+            day_of_week VARCHAR(9),
+            day_of_month INT,
+            month INT,
+            qtr INT,
+            year INT,
+            PRIMARY KEY (calendar_key)
         )
-
-    cursor_warehouse.execute(sql)
-    conn_warehouse.commit()
+        """,
 
     # Sales Rep Emplpoyee dimension
-    sql = ( """
-            CREATE TABLE salesrepemployee
-            (
-                employeeNumber INT NOT NULL,
-                lastName VARCHAR(50),
-                firstName VARCHAR(50),
-                email VARCHAR(100),
-                managerName VARCHAR(100),
-                managerEmail VARCHAR(100),
-                PRIMARY KEY(employeeNumber)
-            )
-            """
+    'salesrepemployee': """
+        CREATE TABLE {salesrepemployee}
+        (
+            employeeNumber INT NOT NULL,
+            lastName VARCHAR(50),
+            firstName VARCHAR(50),
+            email VARCHAR(100),
+            managerName VARCHAR(100),
+            managerEmail VARCHAR(100),
+            PRIMARY KEY(employeeNumber)
         )
-    make_table('salesrepemployee', sql)
-
-    sql = ( """
-            INSERT INTO pinnacle_wh.salesrepemployee(employeeNumber, 
-                                                    lastName,
-                                                    firstName,
-                                                    email,
-                                                    managerName,
-                                                    managerEmail)
-                SELECT em1.employeeNumber, em1.lastName, em1.firstName, em1.email, concat(em2.firstName, ' ', em2.lastName) as managerName, em2.email as managerEmail
-                FROM pinnacle_db.employees em1
-                LEFT JOIN pinnacle_db.employees em2 ON em1.reportsTo = em2.employeeNumber
-                WHERE em1.jobTitle = 'Sales Rep'
-            """
-            )
-
-    cursor.execute(sql)
-    conn.commit()
+        """,
 
     # Product Line Dimension
-
-    sql = ( """
-            CREATE TABLE productline
-            (
-                productLineID INT NOT NULL AUTO_INCREMENT,
-                productLineName VARCHAR(100),
-                PRIMARY KEY(productLineID)
-            )
-            """
+    'productline': """
+        CREATE TABLE {productline}
+        (
+            productLineID INT NOT NULL AUTO_INCREMENT,
+            productLineName VARCHAR(100),
+            PRIMARY KEY(productLineID)
         )
-    make_table('productline', sql)
+        """,
 
-    sql = ( """
-            INSERT INTO pinnacle_wh.productline(productLineName)
-                SELECT distinct productLine FROM pinnacle_db.products
-            """
+    # Product Dimension
+    'products': """
+        CREATE TABLE {products}
+        (
+            productCode varchar(15) NOT NULL,
+            productName VARCHAR(100),
+            buyPrice decimal(10,2) NOT NULL,
+            PRIMARY KEY(productCode)
         )
+        """,
 
-    cursor.execute(sql)
-    conn.commit()
+    # Customer Dimension
+    'customers': """
+        CREATE TABLE {customers}
+        (
+            customerNumber INT NOT NULL,
+            customerName VARCHAR(100),
+            contactLastName VARCHAR(100),
+            contactFirstName VARCHAR(100),
+            phone VARCHAR(50),
+            city VARCHAR(50),
+            country VARCHAR(50),
+            PRIMARY KEY(customerNumber)
+        )
+        """,
 
-    # Product Dimension
+    # Sales Fact Table
+    'shippedorders': """
+        CREATE TABLE {shippedorders}
+        (
+            orderNumber INT NOT NULL,
+            calendar_key INT NOT NULL,
+            customerNumber INT NOT NULL,
+            salesRepEmployeeNumber INT NOT NULL,
+            productCode varchar(15) NOT NULL,
+            productLineID INT NOT NULL,
+            quantityOrdered INT NOT NULL,
+            priceEach decimal(10,2) NOT NULL,
+            PRIMARY KEY(orderNumber, calendar_key, customerNumber, salesRepEmployeeNumber, productCode, productLineID)
+        )
+        """,
 
-    sql = ( """
-            CREATE TABLE products
-            (
-                productCode varchar(15) NOT NULL,
-                productName VARCHAR(100),
-                buyPrice decimal(10,2) NOT NULL,
-                PRIMARY KEY(productCode)
-            )
-            """
+    # Monthly sales aggregates. priceEachSum and lineCount give the
+    # average price of any rollup of the months.
+    'sales_productline_month': """
+        CREATE TABLE {sales_productline_month}
+        (
+            productLineID INT NOT NULL,
+            year INT NOT NULL,
+            qtr INT NOT NULL,
+            month INT NOT NULL,
+            quantityOrdered INT NOT NULL,
+            priceEachSum decimal(14,2) NOT NULL,
+            lineCount INT NOT NULL,
+            revenue decimal(16,2) NOT NULL,
+            PRIMARY KEY(productLineID, year, month)
+        )
+        """,
+    'sales_salesrep_month': """
+        CREATE TABLE {sales_salesrep_month}
+        (
+            salesRepEmployeeNumber INT NOT NULL,
+            year INT NOT NULL,
+            qtr INT NOT NULL,
+            month INT NOT NULL,
+            quantityOrdered INT NOT NULL,
+            priceEachSum decimal(14,2) NOT NULL,
+            lineCount INT NOT NULL,
+            revenue decimal(16,2) NOT NULL,
+            PRIMARY KEY(salesRepEmployeeNumber, year, month)
         )
-    make_table('products', sql)
-
-    sql = ( """
-            INSERT INTO pinnacle_wh.products(productCode,
-                                                productName,
-                                                buyPrice)
-                SELECT productCode, productName, buyPrice 
-                FROM pinnacle_db.products
-                WHERE productCode in (Select productCode from pinnacle_db.orderdetails)
-            """
+        """,
+    'sales_location_month': """
+        CREATE TABLE {sales_location_month}
+        (
+            country VARCHAR(50) NOT NULL,
+            city VARCHAR(50) NOT NULL,
+            productLineID INT NOT NULL,
+            year INT NOT NULL,
+            qtr INT NOT NULL,
+            month INT NOT NULL,
+            quantityOrdered INT NOT NULL,
+            priceEachSum decimal(14,2) NOT NULL,
+            lineCount INT NOT NULL,
+            revenue decimal(16,2) NOT NULL,
+            PRIMARY KEY(country, city, productLineID, year, month)
         )
+        """,
+}
 
-    cursor.execute(sql)
+# The columns each aggregate is grouped by besides the month, the
+# joins they come from and the tables it is built from.
+AGGREGATES = {
+    'sales_productline_month': ('sh.productLineID', '', ('shippedorders', 'calendar')),
+    'sales_salesrep_month': ('sh.salesRepEmployeeNumber', '', ('shippedorders', 'calendar')),
+    'sales_location_month': ('cu.country, cu.city, sh.productLineID',
+                             'JOIN pinnacle_wh.{customers} cu ON cu.customerNumber = sh.customerNumber',
+                             ('shippedorders', 'calendar', 'customers')),
+}
+
+# Aggregates the fact rows of a range of calendar keys into an
+# aggregate table.
+AGGREGATE_LOAD = """
+    INSERT INTO pinnacle_wh.{aggregate}({columns}, year, qtr, month,
+                                        quantityOrdered, priceEachSum, lineCount, revenue)
+        SELECT {grain}, ca.year, ca.qtr, ca.month,
+            sum(sh.quantityOrdered), sum(sh.priceEach), count(*), sum(sh.quantityOrdered*sh.priceEach)
+        FROM pinnacle_wh.{shippedorders} sh
+        JOIN pinnacle_wh.{calendar} ca ON ca.calendar_key = sh.calendar_key
+        {join}
+        WHERE sh.calendar_key BETWEEN %s AND %s
+        GROUP BY {grain}, ca.year, ca.qtr, ca.month
+    """
+
+# Restricts FACT_LOAD to the orders required in a range of dates.
+FACT_REQUIRED_BETWEEN = """
+            AND o.requiredDate >= %s AND o.requiredDate < %s
+    """
+
+# The months of the fact rows an incremental load appends.
+AGGREGATE_MONTHS = """
+    SELECT DISTINCT year(requiredDate), month(requiredDate) FROM pinnacle_db.orders
+    WHERE status = 'Shipped' AND shippedDate >= %s AND shippedDate <= %s
+    """
+
+# Secondary indexes for the dashboard queries, created after the bulk
+# load of their table. The fact table ones lead with the dialog filters
+# and include the measures, so the sales sums are read from the index.
+INDEXES = {
+    'shippedorders': (
+        ('productline', 'productLineID, calendar_key, quantityOrdered, priceEach'),
+        ('salesrep', 'salesRepEmployeeNumber, calendar_key, quantityOrdered, priceEach'),
+        ('customer', 'customerNumber, productLineID, salesRepEmployeeNumber, calendar_key, quantityOrdered, priceEach'),
+        ('calendar', 'calendar_key'),
+    ),
+    'customers': (
+        ('location', 'country, city'),
+    ),
+    'salesrepemployee': (
+        ('name', 'firstName, lastName'),
+    ),
+}
+
+# ETL bookkeeping: the high-water mark of each table's last load.
+ETL_CONTROL = """
+    CREATE TABLE IF NOT EXISTS etl_control
+    (
+        table_name VARCHAR(64) NOT NULL,
+        last_value VARCHAR(64),
+        rows_loaded INT,
+        loaded_at DATETIME,
+        PRIMARY KEY(table_name)
+    )
+    """
+
+# Tables whose loads are recorded in etl_control.
+ETL_CONTROL_TABLES = ('salesrepemployee', 'products', 'customers', 'shippedorders')
+
+# Columns of the dimensions loaded from DIMENSION_SOURCES.
+TABLE_COLUMNS = {
+    'salesrepemployee': ('employeeNumber', 'lastName', 'firstName', 'email',
+                         'managerName', 'managerEmail'),
+    'products': ('productCode', 'productName', 'buyPrice'),
+    'customers': ('customerNumber', 'customerName', 'contactLastName',
+                  'contactFirstName', 'phone', 'city', 'country'),
+}
+
+# Source rows of each dimension, in the column order of its table.
+DIMENSION_SOURCES = {
+    'salesrepemployee': """
+        SELECT em1.employeeNumber, em1.lastName, em1.firstName, em1.email, concat(em2.firstName, ' ', em2.lastName) as managerName, em2.email as managerEmail
+        FROM pinnacle_db.employees em1
+        LEFT JOIN pinnacle_db.employees em2 ON em1.reportsTo = em2.employeeNumber
+        WHERE em1.jobTitle = 'Sales Rep'
+        """,
+    'products': """
+        SELECT productCode, productName, buyPrice
+        FROM pinnacle_db.products
+        WHERE productCode in (Select productCode from pinnacle_db.orderdetails)
+        """,
+    'customers': """
+        SELECT customerNumber, customerName, contactLastName, contactFirstName, phone, city, country
+        FROM pinnacle_db.customers
+        WHERE salesRepEmployeeNumber is not NULL
+        """,
+}
+
+# The dates the calendar has to cover. It spans whole years so that
+# month and quarter rollups include the days without orders.
+CALENDAR_RANGE = """
+    SELECT min(orderDate), max(requiredDate) FROM pinnacle_db.orders
+    """
+
+CALENDAR_INSERT = """
+    INSERT INTO pinnacle_wh.{calendar}(calendar_key, full_date, day_of_week,
+                                        day_of_month, month, qtr, year)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """
+
+PRODUCTLINE_LOAD = """
+    INSERT INTO pinnacle_wh.{productline}(productLineName)
+        SELECT distinct productLine FROM pinnacle_db.products pro
+    """
+PRODUCTLINE_NEW_LINES = """
+        WHERE NOT EXISTS (SELECT 1 FROM pinnacle_wh.{productline} pl
+                          WHERE pl.productLineName = pro.productLine)
+    """
+
+# Fact rows of shipped orders. The calendar key is computed from the
+# required date, the calendar covers every day of the order years.
+# The incremental load appends orders shipped on or after the
+# watermark that are not in the table yet.
+FACT_LOAD = """
+    INSERT INTO pinnacle_wh.{shippedorders}(orderNumber,
+                                            calendar_key,
+                                            customerNumber,
+                                            salesRepEmployeeNumber,
+                                            productCode,
+                                            productLineID,
+                                            quantityOrdered,
+                                            priceEach)
+        SELECT o.orderNumber,
+            year(o.requiredDate) * 10000 + month(o.requiredDate) * 100 + day(o.requiredDate),
+            cus.customerNumber, cus.salesRepEmployeeNumber,
+            od.productCode, pl.productLineID, od.quantityOrdered, od.priceEach FROM pinnacle_db.orders o
+            JOIN pinnacle_db.orderdetails od on od.orderNumber = o.orderNumber
+            JOIN pinnacle_db.products pro on pro.productCode = od.productCode
+            JOIN pinnacle_wh.{productline} pl on pl.productLineName = pro.productLine
+            JOIN pinnacle_db.customers cus on cus.customerNumber = o.customerNumber
+            WHERE o.status = 'Shipped'
+    """
+FACT_NEW_ORDERS = """
+            AND o.shippedDate >= %s AND o.shippedDate <= %s
+            AND NOT EXISTS (SELECT 1 FROM pinnacle_wh.{shippedorders} sh
+                            WHERE sh.orderNumber = o.orderNumber)
+    """
+
+# The dimension keys a fact row takes from the source when it is
+# loaded, by fact column: the column they are looked up by and the
+# current source values. An incremental load sets them again on the
+# fact rows loaded before, as a full load would.
+FACT_KEYS = {
+    'salesRepEmployeeNumber': ('customerNumber', """
+        SELECT customerNumber, salesRepEmployeeNumber FROM pinnacle_db.customers
+        """),
+    'productLineID': ('productCode', """
+        SELECT pro.productCode, pl.productLineID FROM pinnacle_db.products pro
+        JOIN pinnacle_wh.{productline} pl ON pl.productLineName = pro.productLine
+        """),
+}
+
+# Customer columns the location aggregate is grouped by.
+LOCATION_COLUMNS = ('city', 'country')
+
+# A full load builds the tables under staging names and then renames
+# them all at once, so the dashboards see either the old or the new
+# warehouse. The replaced tables are kept under previous names until
+# the next full load, for rollback_warehouse.
+STAGING_SUFFIX = '__staging'
+PREVIOUS_SUFFIX = '__previous'
+ROLLBACK_SUFFIX = '__rollback'
+
+# reload_warehouse_year loads a year into this copy of the fact table.
+EXCHANGE_SUFFIX = '__exchange'
+
+# The newest ship date of the source.
+FACT_HIGH_WATER = """
+    SELECT max(shippedDate) FROM pinnacle_db.orders
+    WHERE status = 'Shipped'
+    """
+
+# How the warehouse tables are built: 'sql' runs INSERT ... SELECT
+# statements across the two schemas, which must be on one server,
+# 'frames' transforms the operational tables in memory.
+ENGINES = ('sql', 'frames')
+
+# Rows per executemany when the frames engine loads a table.
+FRAME_BATCH_SIZE = 5000
+
+def perform_ETL_warehouse(db_config = 'pinnacle_db.ini', wh_config = 'pinnacle_wh.ini',
+                          incremental = False, workers = None, engine = 'sql', log = None,
+                          snapshot_dir = None):
+    """
+    Load the warehouse from the operational database.
+
+    The full load builds every warehouse table into a staging copy and
+    swaps the copies in with one rename when all of them are loaded,
+    keeping the replaced tables for rollback_warehouse. With
+    incremental=True, and a previous load recorded in etl_control,
+    only new and changed dimension rows are upserted in place and
+    orders shipped since the last run are appended to the fact table.
+
+    The loads run as a task graph on workers threads, each task on its
+    own connection from the pinnacle_db pool: the dimensions load side
+    by side and the fact table once productline is done.
+
+    With engine='frames' the operational tables are read into pandas
+    DataFrames, each on its own pinnacle_db connection, the warehouse
+    tables are built from them in memory by etl_frames.transform and
+    loaded through pinnacle_wh connections only, so the two databases
+    can be on different servers. This engine always does a full load.
+
+    Every step is recorded in log, an etl_log.RunLog, which is saved to
+    the etl_run_history table of the warehouse when the run ends, also
+    when it fails.
+
+    With a snapshot_dir, the published warehouse is exported there as
+    a Parquet snapshot by warehouse_snapshot.export_snapshot.
+
+    Return the run report of etl_dag.run_dag.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown ETL engine {engine}, expected one of {ENGINES}')
+
+    if log == None:
+        log = etl_log.RunLog('warehouse')
+
+    try:
+        report = _load_warehouse(db_config, wh_config, incremental, workers, engine, log)
+
+        if snapshot_dir != None:
+            with log.step('snapshot'):
+                warehouse_snapshot.export_snapshot(wh_config, snapshot_dir)
+
+        return report
+    finally:
+        with pooled_connection(wh_config) as conn_warehouse:
+            if conn_warehouse != None:
+                log.save_history(conn_warehouse)
+
+def _load_warehouse(db_config, wh_config, incremental, workers, engine, log):
+    run_start = time.perf_counter()
+    pool = get_pool(db_config)
+    pool_warehouse = get_pool(wh_config)
+    report = []
+
+    if engine == 'frames':
+        incremental = False
+        source, report = _extract_frames(pool, workers, run_start, log)
+
+    with pooled_connection(wh_config) as conn_warehouse:
+        if conn_warehouse == None:
+            raise Exception('Could not connect to pinnacle_wh')
+
+        cursor_warehouse = conn_warehouse.cursor()
+        cursor_warehouse.execute(ETL_CONTROL)
+        watermark = _read_watermark(cursor_warehouse, 'shippedorders')
+
+        if incremental and watermark != None and _published(cursor_warehouse):
+            names = {table: table for table in TABLES}
+            generation = None
+        else:
+            incremental = False
+            names = {table: table + STAGING_SUFFIX for table in TABLES}
+            generation = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+            for table, sql in TABLES.items():
+                sql = sql.format(**names)
+                if table == 'shippedorders' and pool_warehouse.backend == 'mysql':
+                    if engine == 'frames':
+                        years = etl_frames.order_years(source['orders'])
+                    else:
+                        years = _order_years(cursor_warehouse)
+                    sql += _year_partitions(years)
+
+                with log.step('create_' + table):
+                    cursor_warehouse.execute(f"DROP TABLE IF EXISTS {names[table]}")
+                    cursor_warehouse.execute(sql)
+        cursor_warehouse.close()
+
+    if engine == 'frames':
+        start = time.perf_counter()
+        with log.step('transform'):
+            tables = etl_frames.transform(source)
+            high_water = etl_frames.high_water(source['orders'])
+        report.append({'task': 'transform', 'start': round(start - run_start, 6),
+                       'seconds': round(time.perf_counter() - start, 6), 'rows': None})
+
+        tasks = {table: (partial(_insert_frame, names[table], tables[table]), ())
+                 for table in TABLES}
+        task_pool = pool_warehouse
+    else:
+        tasks, high_water = _sql_tasks(pool, names, incremental, watermark)
+        task_pool = pool
+
+    if not incremental:
+        # Indexes slow down the bulk inserts, so each table is
+        # indexed once it is loaded.
+        for table, indexes in INDEXES.items():
+            tasks[table + '_indexes'] = (partial(_create_indexes, names[table], generation, indexes),
+                                         (table,))
+
+    report += run_dag(tasks, task_pool, workers, run_start, log)
+
+    with pooled_connection(wh_config) as conn_warehouse:
+        if conn_warehouse == None:
+            raise Exception('Could not connect to pinnacle_wh')
+
+        if not incremental:
+            with log.step('publish'):
+                _publish(conn_warehouse, pool_warehouse.backend)
+            with log.step('analyze'):
+                _analyze(conn_warehouse)
+
+        for entry in report:
+            if entry['task'] in ETL_CONTROL_TABLES:
+                value = high_water if entry['task'] == 'shippedorders' else None
+                _write_watermark(conn_warehouse, entry['task'], value, entry['rows'])
+
+    # Cached dashboard results are stale now.
+    bump_warehouse_version()
+
+    return report
+
+def _sql_tasks(pool, names, incremental, watermark):
+    """
+    Return the tasks of the sql engine and the high-water mark
+    of the fact load.
+    """
+    # What the dimension upserts and the fact keys task changed, which
+    # the aggregate refreshes read.
+    changes = {}
+
+    if incremental:
+        tasks = _incremental_tasks(names, changes)
+    else:
+        tasks = _full_load_tasks(names)
+
+    # The high-water mark is read before the fact load so that orders
+    # shipped while it runs are picked up by the next incremental run.
+    with pooled_connection(pool.config_file, pool.section) as conn:
+        if conn == None:
+            raise Exception('Could not connect to pinnacle_db')
+        high_water = _high_water(conn)
+
+    if not (incremental and high_water == None):
+        tasks['shippedorders'] = (partial(_load_facts, names, incremental, watermark, high_water),
+                                  ('productline',))
+
+        if incremental:
+            tasks['shippedorders_keys'] = (partial(_update_fact_keys, names, changes),
+                                           ('shippedorders',))
+
+        for aggregate, (_, _, sources) in AGGREGATES.items():
+            if incremental:
+                task = partial(_refresh_aggregate, names, aggregate, watermark, high_water, changes)
+                sources = sources + ('shippedorders_keys',)
+            else:
+                task = partial(_load_aggregate, names, aggregate, 0, 99999999)
+            tasks[aggregate] = (task, sources)
+
+    return tasks, high_water
+
+def _extract_frames(pool, workers, run_start, log):
+    """
+    Read the operational tables of etl_frames.SOURCE_TABLES into
+    DataFrames. Return the frames by table and the run report.
+    """
+    source = {}
+
+    def extract(table, sql, conn):
+        source[table] = etl_frames.read_frame(conn, sql)
+        etl_log.add(bytes_read = int(source[table].memory_usage(deep=True).sum()))
+        return len(source[table])
+
+    tasks = {'extract_' + table: (partial(extract, table, sql), ())
+             for table, sql in etl_frames.SOURCE_TABLES.items()}
+
+    return source, run_dag(tasks, pool, workers, run_start, log)
+
+def _insert_frame(table, frame, conn):
+    """
+    Insert the rows of a frame into a warehouse table and return
+    how many there were.
+    """
+    columns = ', '.join(frame.columns)
+    placeholders = ', '.join(['%s'] * len(frame.columns))
+    sql = f"INSERT INTO {table}({columns}) VALUES ({placeholders})"
+
+    cursor = conn.cursor()
+    for start in range(0, len(frame), FRAME_BATCH_SIZE):
+        cursor.executemany(sql, frame_rows(frame.iloc[start:start + FRAME_BATCH_SIZE]))
+        etl_log.add(warnings = conn.warning_count)
+        conn.commit()
+    cursor.close()
+
+    return len(frame)
+
+def _full_load_tasks(names):
+    """
+    Return the tasks of a full load into the tables in names,
+    except the fact table.
+    """
+    tasks = {
+        'calendar': (partial(_load_calendar, names), ()),
+        'productline': (partial(_execute, PRODUCTLINE_LOAD.format(**names)), ()),
+    }
+
+    for table, sql in DIMENSION_SOURCES.items():
+        columns = ', '.join(TABLE_COLUMNS[table])
+        tasks[table] = (partial(_execute, f"INSERT INTO pinnacle_wh.{names[table]}({columns}) {sql}"), ())
+
+    return tasks
+
+def _incremental_tasks(names, changes):
+    """
+    Return the tasks of an incremental load, except the fact table.
+    The dimension upserts record the rows they changed in changes.
+    """
+    tasks = {
+        'calendar': (partial(_load_calendar, names), ()),
+        'productline': (partial(_execute, (PRODUCTLINE_LOAD + PRODUCTLINE_NEW_LINES).format(**names)), ()),
+    }
+
+    for table, sql in DIMENSION_SOURCES.items():
+        tasks[table] = (partial(_upsert_dimension, table, sql, changes=changes), ())
+
+    return tasks
+
+def _create_indexes(table, generation, indexes, conn):
+    """
+    Create the secondary indexes of a loaded table. SQLite index names
+    are unique per database and follow their table when it is renamed,
+    so the names carry the generation of the load.
+    """
+    cursor = conn.cursor()
+    for name, columns in indexes:
+        cursor.execute(f"CREATE INDEX ix_{generation}_{name} ON pinnacle_wh.{table} ({columns})")
+    cursor.close()
+
+def _execute(sql, conn, params = None):
+    """
+    Run one INSERT ... SELECT and return the number of rows it added.
+    """
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    rows = cursor.rowcount
+    etl_log.add(warnings = conn.warning_count)
     conn.commit()
+    cursor.close()
+    return rows
 
-    # Customer Dimension
+def _load_calendar(names, conn):
+    """
+    Add the days of the order date range that the calendar does not
+    have yet and return how many were added.
+    """
+    cursor = conn.cursor()
+    cursor.execute(CALENDAR_RANGE)
+    first, last = cursor.fetchall()[0]
+    if first == None:
+        cursor.close()
+        return 0
 
-    sql = ( """
-            CREATE TABLE customers
-            (
-                customerNumber INT NOT NULL,
-                customerName VARCHAR(100),
-                contactLastName VARCHAR(100),
-                contactFirstName VARCHAR(100),
-                phone VARCHAR(50),
-                city VARCHAR(50),
-                country VARCHAR(50),
-                PRIMARY KEY(customerNumber)
-            )
-            """
-        )
-    make_table('customers', sql)
-
-    sql = ( """
-            INSERT INTO pinnacle_wh.customers(customerNumber,
-                                                customerName,
-                                                contactLastName,
-                                                contactFirstName,
-                                                phone,
-                                                city,
-                                                country)
-                SELECT customerNumber, customerName, contactLastName, contactFirstName, phone, city, country
-                FROM pinnacle_db.customers
-                WHERE salesRepEmployeeNumber is not NULL
-            """
-        )
+    frame = calendar_frame(pd.Timestamp(first), pd.Timestamp(last))
+
+    cursor.execute(f"SELECT calendar_key FROM pinnacle_wh.{names['calendar']}")
+    loaded = [row[0] for row in cursor.fetchall()]
+    frame = frame[~frame['calendar_key'].isin(loaded)]
+
+    rows = frame_rows(frame)
+    if rows:
+        cursor.executemany(CALENDAR_INSERT.format(**names), rows)
+        etl_log.add(warnings = conn.warning_count)
+        conn.commit()
+
+    cursor.close()
+    return len(rows)
+
+def _load_facts(names, incremental, watermark, high_water, conn):
+    if incremental:
+        return _execute((FACT_LOAD + FACT_NEW_ORDERS).format(**names), conn,
+                        (watermark, high_water))
+    return _execute(FACT_LOAD.format(**names), conn)
+
+def _aggregate_load(names, aggregate):
+    """
+    Return the statement that aggregates a range of calendar keys
+    of the fact table into aggregate.
+    """
+    grain, join, _ = AGGREGATES[aggregate]
+    columns = ', '.join(column.split('.')[1] for column in grain.split(', '))
+
+    return AGGREGATE_LOAD.format(aggregate=names[aggregate], columns=columns, grain=grain,
+                                 join=join.format(**names), **names)
+
+def _load_aggregate(names, aggregate, first_key, last_key, conn):
+    """
+    Aggregate the fact rows from first_key to last_key into aggregate.
+    """
+    return _execute(_aggregate_load(names, aggregate), conn, (first_key, last_key))
+
+def _refresh_aggregate(names, aggregate, watermark, high_water, changes, conn):
+    """
+    Recompute the months of an aggregate that an incremental
+    load added fact rows to. If the load changed a key the aggregate
+    is grouped by for fact rows of any month, the aggregate is
+    rebuilt in full instead.
+    """
+    cursor = conn.cursor()
+
+    if _regrouped(aggregate, changes):
+        cursor.execute(f"DELETE FROM pinnacle_wh.{names[aggregate]}")
+        rows = _load_aggregate(names, aggregate, 0, 99999999, conn)
+        conn.commit()
+        cursor.close()
+        return rows
+
+    cursor.execute(AGGREGATE_MONTHS, (watermark, high_water))
+    months = cursor.fetchall()
+
+    rows = 0
+    for year, month in months:
+        cursor.execute(f"DELETE FROM pinnacle_wh.{names[aggregate]} WHERE year = %s AND month = %s",
+                       (year, month))
+        first_key = year * 10000 + month * 100
+        rows += _load_aggregate(names, aggregate, first_key, first_key + 99, conn)
 
-    cursor.execute(sql)
     conn.commit()
+    cursor.close()
+    return rows
 
-    # Sales Fact Table
+def _regrouped(aggregate, changes):
+    """
+    Return whether the fact rows of an aggregate moved to other groups:
+    their sales rep or product line was set again, or, for an aggregate
+    of the customers' locations, a customer moved.
+    """
+    grain, _, sources = AGGREGATES[aggregate]
+    if any('sh.' + column in grain for column in changes.get('shippedorders', ())):
+        return True
 
-    sql = ( """
-            CREATE TABLE shippedorders
-            (
-                orderNumber INT NOT NULL,
-                calendar_key INT NOT NULL,
-                customerNumber INT NOT NULL,
-                salesRepEmployeeNumber INT NOT NULL,
-                productCode varchar(15) NOT NULL,
-                productLineID INT NOT NULL,
-                quantityOrdered INT NOT NULL,
-                priceEach decimal(10,2) NOT NULL,
-                PRIMARY KEY(orderNumber, calendar_key, customerNumber, salesRepEmployeeNumber, productCode, productLineID)
-            )
-            """
-        )
+    if 'customers' in sources:
+        location = [TABLE_COLUMNS['customers'].index(column) for column in LOCATION_COLUMNS]
+        return any(old[i] != new[i] for old, new in changes.get('customers', ()) for i in location)
 
-    make_table('shippedorders', sql)
-
-    sql = ( """
-            INSERT INTO pinnacle_wh.shippedorders(orderNumber,
-                                                    calendar_key,
-                                                    customerNumber,
-                                                    salesRepEmployeeNumber,
-                                                    productCode,
-                                                    productLineID,
-                                                    quantityOrdered,
-                                                    priceEach)
-                SELECT o.orderNumber, ca.calendar_key, cus.customerNumber, cus.salesRepEmployeeNumber, 
-                    od.productCode, pl.productLineID, od.quantityOrdered, od.priceEach FROM pinnacle_db.orders o
-                    JOIN pinnacle_db.orderdetails od on od.orderNumber = o.orderNumber
-                    JOIN pinnacle_db.products pro on pro.productCode = od.productCode
-                    JOIN pinnacle_wh.productline pl on pl.productLineName = pro.productLine
-                    JOIN pinnacle_db.customers cus on cus.customerNumber = o.customerNumber
-                    JOIN pinnacle_wh.calendar ca on ca.full_date = o.requiredDate
-                    WHERE o.status = 'Shipped'
-            """
-        )
+    return False
+
+def _update_fact_keys(names, changes, conn):
+    """
+    Set the sales rep and product line of the fact rows loaded before
+    to the current ones of their customer and product in the source,
+    as a full load would, and record the fact columns that changed in
+    changes['shippedorders']. Return the number of keys set.
+    """
+    cursor = conn.cursor()
+    changed = set()
+    keys = 0
+
+    for column, (key, sql) in FACT_KEYS.items():
+        cursor.execute(sql.format(**names))
+        source = dict(cursor.fetchall())
+
+        # A key with several values in the fact table changed before.
+        cursor.execute(f"SELECT DISTINCT {key}, {column} FROM pinnacle_wh.{names['shippedorders']}")
+        loaded = {}
+        for value, current in cursor.fetchall():
+            loaded.setdefault(value, set()).add(current)
+
+        updates = [(source[value], value) for value, current in loaded.items()
+                   if value in source and current != {source[value]}]
+
+        if updates:
+            cursor.executemany(f"UPDATE pinnacle_wh.{names['shippedorders']} SET {column} = %s "
+                               f"WHERE {key} = %s", updates)
+            conn.commit()
+            changed.add(column)
+            keys += len(updates)
+
+    changes['shippedorders'] = changed
+    cursor.close()
+    return keys
 
+def _upsert_dimension(table, sql, conn, changes = None):
+    """
+    Compare the source rows of a dimension with the warehouse copy
+    and REPLACE the rows that are new or changed. Dimensions are small,
+    so this is done in Python, which works the same on every backend.
+    The (old, new) normalized rows that existed before are recorded in
+    changes[table], if changes is given. Return the number of rows
+    written.
+    """
+    cursor = conn.cursor()
     cursor.execute(sql)
-    conn.commit()
+    source = cursor.fetchall()
 
-    cursor_warehouse.close()
-    conn_warehouse.close()
+    columns = ', '.join(TABLE_COLUMNS[table])
+    cursor.execute(f"SELECT {columns} FROM pinnacle_wh.{table}")
+    current = {row[0]: _normalize(row) for row in cursor.fetchall()}
+
+    changed = [row for row in source if current.get(row[0]) != _normalize(row)]
+
+    if changes != None:
+        changes[table] = [(current[row[0]], _normalize(row))
+                          for row in changed if row[0] in current]
+
+    if changed:
+        placeholders = ', '.join(['%s'] * len(TABLE_COLUMNS[table]))
+        cursor.executemany(
+            f"REPLACE INTO pinnacle_wh.{table}({columns}) VALUES ({placeholders})",
+            changed)
+        etl_log.add(warnings = conn.warning_count)
+        conn.commit()
+
+    cursor.close()
+    return len(changed)
+
+def _normalize(row):
+    # Compare as text so that e.g. Decimal('10.50') and 10.5 are equal.
+    return tuple(None if value == None
+                 else str(float(value)) if isinstance(value, (int, float, decimal.Decimal))
+                 else str(value) for value in row)
+
+def _high_water(conn):
+    cursor = conn.cursor()
+    cursor.execute(FACT_HIGH_WATER)
+    value = cursor.fetchall()[0][0]
     cursor.close()
-    conn.close()
\ No newline at end of file
+    return None if value == None else str(value)
+
+def _read_watermark(cursor_warehouse, table):
+    """
+    Return the last value loaded into table, or None if the table
+    has not been loaded or no longer exists.
+    """
+    cursor_warehouse.execute("SELECT last_value FROM etl_control WHERE table_name = %s",
+                             (table,))
+    rows = cursor_warehouse.fetchall()
+    if not rows or rows[0][0] == None:
+        return None
+
+    if not _table_exists(cursor_warehouse, table):
+        return None
+
+    return rows[0][0]
+
+def _published(cursor_warehouse):
+    """
+    Return whether every warehouse table exists, for warehouses
+    loaded before a table was added.
+    """
+    return all(_table_exists(cursor_warehouse, table) for table in TABLES)
+
+def _table_exists(cursor_warehouse, table):
+    # Qualified, as SQLite would also find a table of that name in
+    # pinnacle_db.
+    try:
+        cursor_warehouse.execute(f"SELECT 1 FROM pinnacle_wh.{table} WHERE 1 = 0")
+        cursor_warehouse.fetchall()
+    except Error:
+        return False
+    return True
+
+def _write_watermark(conn_warehouse, table, value, rows):
+    cursor_warehouse = conn_warehouse.cursor()
+    cursor_warehouse.execute("REPLACE INTO etl_control VALUES (%s, %s, %s, %s)",
+                             (table, value, rows,
+                              datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    conn_warehouse.commit()
+    cursor_warehouse.close()
+
+def _publish(conn_warehouse, backend):
+    """
+    Replace the warehouse tables with their staging copies in one step.
+    The replaced tables become the previous generation.
+    """
+    cursor_warehouse = conn_warehouse.cursor()
+
+    renames = []
+    for table in TABLES:
+        cursor_warehouse.execute(f"DROP TABLE IF EXISTS {table + PREVIOUS_SUFFIX}")
+        if _table_exists(cursor_warehouse, table):
+            renames.append((table, table + PREVIOUS_SUFFIX))
+    renames += [(table + STAGING_SUFFIX, table) for table in TABLES]
+
+    cursor_warehouse.close()
+    _rename_tables(conn_warehouse, backend, renames)
+
+def _analyze(conn_warehouse):
+    """
+    Update the query planner statistics of the published tables.
+    This is done after the swap, SQLite keeps them by table name.
+    """
+    cursor_warehouse = conn_warehouse.cursor()
+    for table in TABLES:
+        cursor_warehouse.execute(f"ANALYZE TABLE pinnacle_wh.{table}")
+        cursor_warehouse.fetchall()
+    conn_warehouse.commit()
+    cursor_warehouse.close()
+
+def _rename_tables(conn_warehouse, backend, renames):
+    """
+    Apply a list of (old name, new name) renames atomically.
+    MySQL renames in one RENAME TABLE statement, SQLite in a
+    transaction, as its DDL is transactional.
+    """
+    cursor_warehouse = conn_warehouse.cursor()
+
+    try:
+        if backend == 'sqlite':
+            cursor_warehouse.execute("BEGIN")
+            for old, new in renames:
+                cursor_warehouse.execute(f"ALTER TABLE {old} RENAME TO {new}")
+            conn_warehouse.commit()
+        else:
+            cursor_warehouse.execute("RENAME TABLE " + ", ".join(f"{old} TO {new}" for old, new in renames))
+    except Error:
+        conn_warehouse.rollback()
+        raise
+    finally:
+        cursor_warehouse.close()
+
+def rollback_warehouse(wh_config = 'pinnacle_wh.ini', log = None):
+    """
+    Swap the warehouse tables back to the generation the last full load
+    replaced, which in turn becomes the previous generation. The ETL
+    watermarks are cleared, so the next incremental load is a full one.
+
+    The rollback is recorded in log, an etl_log.RunLog, with the fact
+    rows it restored, and saved to etl_run_history as a load is.
+    """
+    if log == None:
+        log = etl_log.RunLog('rollback')
+
+    try:
+        with pooled_connection(wh_config) as conn_warehouse:
+            if conn_warehouse == None:
+                raise Exception('Could not connect to pinnacle_wh')
+
+            with log.step('rollback'):
+                cursor_warehouse = conn_warehouse.cursor()
+                for table in TABLES:
+                    if not _table_exists(cursor_warehouse, table + PREVIOUS_SUFFIX):
+                        cursor_warehouse.close()
+                        raise Exception(f'No previous generation of {table} to roll back to')
+
+                renames = []
+                for table in TABLES:
+                    renames += [(table, table + ROLLBACK_SUFFIX),
+                                (table + PREVIOUS_SUFFIX, table),
+                                (table + ROLLBACK_SUFFIX, table + PREVIOUS_SUFFIX)]
+                _rename_tables(conn_warehouse, get_pool(wh_config).backend, renames)
+
+                cursor_warehouse.execute("DELETE FROM etl_control")
+                conn_warehouse.commit()
+
+                cursor_warehouse.execute("SELECT count(*) FROM pinnacle_wh.shippedorders")
+                etl_log.add(rows = cursor_warehouse.fetchall()[0][0])
+                cursor_warehouse.close()
+    finally:
+        with pooled_connection(wh_config) as conn_warehouse:
+            if conn_warehouse != None:
+                log.save_history(conn_warehouse)
+
+    bump_warehouse_version()
+
+def _order_years(cursor):
+    """
+    Return the years of the orders in pinnacle_db.
+    """
+    cursor.execute(CALENDAR_RANGE)
+    first, last = cursor.fetchall()[0]
+    if first == None:
+        return []
+    return list(range(pd.Timestamp(first).year, pd.Timestamp(last).year + 1))
+
+def _year_partitions(years):
+    """
+    Return the clause that range partitions the fact table by year of
+    calendar_key, one partition for each of years and one for the years
+    after them. Queries on a range of calendar keys only read the
+    partitions of those years.
+    """
+    partitions = [f"PARTITION p{year} VALUES LESS THAN ({(year + 1) * 10000})" for year in years]
+    partitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+
+    return "\n        PARTITION BY RANGE (calendar_key) (" + ", ".join(partitions) + ")"
+
+def _fact_partitions(cursor):
+    """
+    Return the names of the partitions of the published fact table,
+    empty if it is not partitioned.
+    """
+    cursor.execute("""
+        SELECT partition_name FROM information_schema.partitions
+        WHERE table_schema = 'pinnacle_wh' AND table_name = 'shippedorders'
+            AND partition_name IS NOT NULL
+        """)
+    return [row[0] for row in cursor.fetchall()]
+
+def _add_year_partitions(cursor, partitions, year):
+    """
+    Give year a partition of its own, splitting the years up to it
+    out of pmax, one partition each. Return False if it cannot have
+    one: the table is not partitioned as _year_partitions does, or the
+    year is before its first partition.
+    """
+    years = [int(name[1:]) for name in partitions if re.fullmatch(r'p\d{4}', name)]
+    if f'p{year}' in partitions:
+        return True
+    if 'pmax' not in partitions or not years or year < max(years):
+        return False
+
+    split = [f"PARTITION p{y} VALUES LESS THAN ({(y + 1) * 10000})"
+             for y in range(max(years) + 1, year + 1)]
+    cursor.execute("ALTER TABLE pinnacle_wh.shippedorders REORGANIZE PARTITION pmax INTO ("
+                   + ", ".join(split) + ", PARTITION pmax VALUES LESS THAN MAXVALUE)")
+    return True
+
+def reload_warehouse_year(year, db_config = 'pinnacle_db.ini', wh_config = 'pinnacle_wh.ini', log = None):
+    """
+    Reload the fact rows and the aggregate months of one year of
+    required dates from the operational database, leaving the other
+    years as they are. Return the number of fact rows loaded.
+
+    On MySQL the year is loaded into a copy of the fact table that is
+    exchanged with the year's partition, which is split out of pmax
+    first for a year after the partitioned ones. Otherwise, and on
+    SQLite, it is deleted and inserted again in one transaction.
+    The reload is recorded in etl_control, as a load is, so other
+    processes see it, and its steps in log, an etl_log.RunLog, which
+    is saved to etl_run_history.
+    """
+    if log == None:
+        log = etl_log.RunLog('reload_year')
+
+    try:
+        rows = _reload_year(year, db_config, wh_config, log)
+    finally:
+        with pooled_connection(wh_config) as conn_warehouse:
+            if conn_warehouse != None:
+                log.save_history(conn_warehouse)
+
+    bump_warehouse_version()
+    return rows
+
+def _reload_year(year, db_config, wh_config, log):
+    first_key, last_key = year * 10000, year * 10000 + 9999
+    dates = (f'{year}-01-01', f'{year + 1}-01-01')
+    names = {table: table for table in TABLES}
+    exchange = dict(names, shippedorders = 'shippedorders' + EXCHANGE_SUFFIX)
+    backend = get_pool(db_config).backend
+
+    with pooled_connection(db_config) as conn:
+        if conn == None:
+            raise Exception('Could not connect to pinnacle_db')
+
+        cursor = conn.cursor()
+
+        try:
+            with log.step(f'reload_shippedorders_{year}'):
+                if backend == 'mysql' and _add_year_partitions(cursor, _fact_partitions(cursor), year):
+                    cursor.execute(f"DROP TABLE IF EXISTS pinnacle_wh.{exchange['shippedorders']}")
+                    cursor.execute(f"CREATE TABLE pinnacle_wh.{exchange['shippedorders']} LIKE pinnacle_wh.shippedorders")
+                    cursor.execute(f"ALTER TABLE pinnacle_wh.{exchange['shippedorders']} REMOVE PARTITIONING")
+
+                    cursor.execute((FACT_LOAD + FACT_REQUIRED_BETWEEN).format(**exchange), dates)
+                    rows = cursor.rowcount
+                    conn.commit()
+
+                    cursor.execute(f"ALTER TABLE pinnacle_wh.shippedorders EXCHANGE PARTITION p{year} "
+                                   f"WITH TABLE pinnacle_wh.{exchange['shippedorders']}")
+                    cursor.execute(f"DROP TABLE pinnacle_wh.{exchange['shippedorders']}")
+                else:
+                    if backend == 'sqlite':
+                        cursor.execute("BEGIN")
+                    cursor.execute("DELETE FROM pinnacle_wh.shippedorders WHERE calendar_key BETWEEN %s AND %s",
+                                   (first_key, last_key))
+                    cursor.execute((FACT_LOAD + FACT_REQUIRED_BETWEEN).format(**names), dates)
+                    rows = cursor.rowcount
+                etl_log.add(rows = rows)
+
+            for aggregate in AGGREGATES:
+                with log.step(f'reload_{aggregate}_{year}'):
+                    cursor.execute(f"DELETE FROM pinnacle_wh.{aggregate} WHERE year = %s", (year,))
+                    cursor.execute(_aggregate_load(names, aggregate), (first_key, last_key))
+                    etl_log.add(rows = cursor.rowcount)
+
+            conn.commit()
+        except Error:
+            conn.rollback()
+            if backend == 'mysql':
+                try:
+                    cursor.execute(f"DROP TABLE IF EXISTS pinnacle_wh.{exchange['shippedorders']}")
+                except Error as e:
+                    print('Could not drop the exchange table')
+                    print(e)
+            raise
+        finally:
+            cursor.close()
+
+    with pooled_connection(wh_config) as conn_warehouse:
+        if conn_warehouse == None:
+            raise Exception('Could not connect to pinnacle_wh')
+
+        # Keep the watermark, the reload does not change what the next
+        # incremental load starts from.
+        cursor_warehouse = conn_warehouse.cursor()
+        cursor_warehouse.execute(ETL_CONTROL)
+        watermark = _read_watermark(cursor_warehouse, 'shippedorders')
+        cursor_warehouse.close()
+        _write_watermark(conn_warehouse, 'shippedorders', watermark, rows)
+
+    return rows
@@ -1,11 +1,16 @@
 import sys
-import pandas as pd
-from PyQt5 import uic
-from PyQt5.QtWidgets import QDialog, QApplication, QGraphicsScene, QGraphicsView
-from matplotlib.figure import Figure
-from matplotlib import pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from mydbutils import do_query, set_data_to_table_cells, adjust_column_widths
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QDialog, QApplication
+import sales_queries
+from functools import partial
+from mydbutils import do_query_cached, adjust_column_widths
+from SalesTableModel import SalesTableModel
+from QueryWorker import QueryExecutor
+from ui_cache import load_ui
+from locations import cities
+
+# matplotlib takes long to import, so the chart windows are imported
+# when the first chart is drawn rather than when the dialog is created.
 
 class ProductLinesDialog(QDialog):
     """
@@ -19,15 +24,31 @@ class ProductLinesDialog(QDialog):
         super().__init__()
         
         # Load the dialog components.
-        self.ui = uic.loadUi('productLines_dialog.ui')
+        self.ui = load_ui('productLines_dialog.ui')
+
+        # Runs the sales queries off the GUI thread.
+        self._queries = QueryExecutor(self)
+
+        # Models behind the sales tables, money columns are formatted when shown.
+        self._sales_model = SalesTableModel([4, 5], self)
+        self.ui.sales_table.setModel(self._sales_model)
+        self._sales_model_location = SalesTableModel([6, 7], self)
+        self.ui.sales_table_location.setModel(self._sales_model_location)
+
+        # Windows of the sales and pie charts, created with the first chart.
+        self._sales_chart = None
+        self._pie_chart = None
 
         ### PER PRODUCT LINE
         # Product lines menu and query button event handlers.
         self.ui.product_lines_cb.currentIndexChanged.connect(self._initialize_table)
         self.ui.query_button.clicked.connect(self._enter_product_lines_data)
         
+        # Every menu of the dialog is fetched with one query.
+        menus = sales_queries.split_menus(do_query_cached(*sales_queries.menus())[0])
+
         # Initialize the product lines menu and the sales table.
-        self._initialize_product_lines_menu()
+        self._initialize_product_lines_menu(menus['product_lines'])
         self._initialize_table()
         self.ui.monthly_radio.toggled.connect(self._initialize_table)
         self.ui.quarterly_radio.toggled.connect(self._initialize_table)
@@ -39,7 +60,7 @@ class ProductLinesDialog(QDialog):
         self.ui.query_button_location.clicked.connect(self._enter_product_lines_data_location)
 
         # Initialize the location menu and sales table.
-        self._initialize_country_menu()
+        self._initialize_country_menu(menus['countries'])
         self._initialize_table_location()
         self.ui.monthly_radio_location.toggled.connect(self._initialize_table_location)
         self.ui.quarterly_radio_location.toggled.connect(self._initialize_table_location)
@@ -47,7 +68,7 @@ class ProductLinesDialog(QDialog):
         self.ui.city_cb.currentIndexChanged.connect(self._initialize_table_location)
 
         # Initialize years menu and draw pie chart
-        self._initialize_years_menu()
+        self._initialize_years_menu(menus['years'])
         self.ui.query_button_location_pie.clicked.connect(self._draw_pie_chart)
         
     def show_dialog(self):
@@ -56,44 +77,28 @@ class ProductLinesDialog(QDialog):
         """
         self.ui.show()
     
-    def _initialize_years_menu(self):
+    def _initialize_years_menu(self, rows):
         """
         Initialize the years of sales menu from the database.
         """
-        sql = """
-            SELECT distinct year FROM calendar
-            """
-        rows, _ = do_query(sql)
-
         # Set the menu items to the teacher names.
         for row in rows:
             year = str(row[0])
             self.ui.year_cb.addItem(year, row)
     
-    def _initialize_product_lines_menu(self):
+    def _initialize_product_lines_menu(self, rows):
         """
         Initialize the product lines menu with product lines from the database.
         """
-        sql = """
-            SELECT productLineName FROM productline
-            """
-        rows, _ = do_query(sql)
-
         # Set the menu items to the teacher names.
         for row in rows:
             name = row[0]
             self.ui.product_lines_cb.addItem(name, row)
     
-    def _initialize_country_menu(self):
+    def _initialize_country_menu(self, rows_country):
         """
         Initialize the country menu of clients' location from the database.
         """
-        sql = """
-            SELECT distinct country FROM customers
-            ORDER BY country
-            """
-        rows_country, _ = do_query(sql)
-
         # Set the menu items to the country
         for row in rows_country:
             c = row[0]
@@ -101,29 +106,28 @@ class ProductLinesDialog(QDialog):
 
     def _initialize_city_menu(self):
         """
-        Initialize the city menu of clients' location from the database.
+        Initialize the city menu of clients' location from the
+        location hierarchy the dialogs share.
         """
         self.ui.city_cb.clear()
         country = self.ui.country_cb.currentData()
         _country = country[0]
-        sql = """
-            SELECT distinct city FROM customers
-            WHERE country = '""" + _country + """' ORDER BY city
-            """ 
-        
-        rows_city, _ = do_query(sql)
 
-        # Set the menu items to the city by selected country
+        rows_city = cities(_country)
+
+        # Set the menu items to the city by selected country,
+        # with their number of customers as tooltip.
         self.ui.city_cb.addItem("All", ("All",))
-        for row in rows_city:
-            c = row[0]
-            self.ui.city_cb.addItem(c, row)
+        self.ui.city_cb.setItemData(0, f"Customers: {sum(n for _, n in rows_city)}", Qt.ToolTipRole)
+        for c, customers in rows_city:
+            self.ui.city_cb.addItem(c, (c,))
+            self.ui.city_cb.setItemData(self.ui.city_cb.count() - 1, f"Customers: {customers}", Qt.ToolTipRole)
         
     def _initialize_table(self):
         """
         Clear the table and set the column headers.
         """
-        self.ui.sales_table.clear()
+        self._sales_model.clear()
 
         if self.ui.monthly_radio.isChecked():
             month_quater = ' Month '
@@ -133,14 +137,14 @@ class ProductLinesDialog(QDialog):
         col = ['  Product Line  ', month_quater, '  Year End  ', '  Quantity  ',
         '  Average Price Each ($000)  ', '  Total Sales ($000) ']
 
-        self.ui.sales_table.setHorizontalHeaderLabels(col)        
+        self._sales_model.set_headers(col)
         adjust_column_widths(self.ui.sales_table)
 
     def _initialize_table_location(self):
         """
         Clear the table and set the column headers.
         """
-        self.ui.sales_table_location.clear()
+        self._sales_model_location.clear()
 
         if self.ui.monthly_radio_location.isChecked():
             month_quater = ' Month '
@@ -150,7 +154,7 @@ class ProductLinesDialog(QDialog):
         col = [' Country ', ' City ', ' Product Line ', month_quater, ' Year End ', ' Quantity ',
         'Average Price Each ($000)', 'Total Sales ($000)']
 
-        self.ui.sales_table_location.setHorizontalHeaderLabels(col)        
+        self._sales_model_location.set_headers(col)
         adjust_column_widths(self.ui.sales_table_location)
         
     def _enter_product_lines_data(self):    
@@ -167,46 +171,28 @@ class ProductLinesDialog(QDialog):
         elif self.ui.quarterly_radio.isChecked():
             month_quater = 'qtr'
         
-        sql = ( """
-            SELECT pl.productLineName, ca."""+ month_quater +""", ca.year, sum(sh.quantityOrdered), ROUND(avg(sh.priceEach), 2), sum(sh.quantityOrdered*sh.priceEach)
-            FROM pinnacle_wh.shippedorders sh
-            JOIN pinnacle_wh.productline pl ON pl.productLineID = sh.productLineID
-            JOIN pinnacle_wh.calendar ca ON ca.calendar_key = sh.calendar_key
-            WHERE pl.productLineName = '""" + product_line + """' 
-            GROUP BY pl.productLineName, ca."""+ month_quater +""", ca.year
-            ORDER BY pl.productLineName, ca.year, ca."""+ month_quater +"""
-            """ 
-              )
-
-        # Return sales data from database         
-        rows, _ = do_query(sql)
-        
-        # Plot the sales performance
-        df = pd.DataFrame(rows,columns=['Product Line', 'M/Q', 'Year End', 'Quantity', 'Average Price Each ($000)', 'Total Sales ($000)'])
-        df['Time'] = pd.to_datetime(df['Year End'].astype(str) + df['M/Q'].astype(str), format='%Y%m').dt.strftime('%m-%Y')
-
-        X = df['Quantity']
-        Y = df['Time']
-        # self.ui.graphicsView.clear()
-        scene = QGraphicsScene()
-        self.ui.label = QGraphicsView(scene)
-        figure = Figure()
-        figure.set_size_inches(len(X), 7)
-        axes = figure.gca()
-        axes.set_title(f"Sales Of {product_line}")
-        axes.plot(Y, X, "-k", color="red", label="Quantity Sold")
-        axes.legend()
-        axes.grid(True)
-
-        canvas = FigureCanvas(figure)
-        proxy_widget = scene.addWidget(canvas)
-
-        self.ui.label.resize(90*len(X), 700)
-        self.ui.label.show()
+        # Return sales data from database
+        self._queries.submit('sales', sales_queries.product_line_sales(product_line, month_quater),
+                             partial(self._show_product_lines_data, product_line, month_quater),
+                             [self.ui.query_button])
+
+    def _show_product_lines_data(self, product_line, period, rows):
+        """
+        Plot the sales of a product line and set them into the table.
+        """
+        from ChartView import ChartView
+        from charts import LineChart, period_labels
+
+        # Plot the sales performance on the chart kept for the dialog.
+        if self._sales_chart == None:
+            self._sales_chart = ChartView(LineChart, "Quantity Sold")
+
+        labels = period_labels([row[1] for row in rows], [row[2] for row in rows], period)
+        self._sales_chart.show_chart(f"Sales Of {product_line}", labels, [row[3] for row in rows])
 
         # Set the sales data into the table cells.
         # print(rows)
-        set_data_to_table_cells(self.ui.sales_table, rows, [4, 5])
+        self._sales_model.set_rows(rows)
                 
         adjust_column_widths(self.ui.sales_table)
 
@@ -227,30 +213,18 @@ class ProductLinesDialog(QDialog):
         elif self.ui.quarterly_radio_location.isChecked():
             month_quater = 'qtr'
 
-        if _city == 'All':
-            _city = (f"cu.city")
-        else:
-            _city = (f"\'{_city}\'")
-        
-        sql = ( """
-            SELECT cu.country, cu.city, pl.productLineName, ca."""+ month_quater +""", ca.year, sum(sh.quantityOrdered), ROUND(avg(sh.priceEach), 2), sum(sh.quantityOrdered*sh.priceEach)
-            FROM pinnacle_wh.shippedorders sh
-            JOIN pinnacle_wh.productline pl ON pl.productLineID = sh.productLineID
-            JOIN pinnacle_wh.calendar ca ON ca.calendar_key = sh.calendar_key
-            JOIN customers cu on cu.customerNumber = sh.customerNumber
-            WHERE cu.country = '""" + _country + """' 
-            AND cu.city = """ + _city + """
-            GROUP BY cu.country, cu.city, pl.productLineName, ca."""+ month_quater +""", ca.year
-            ORDER BY cu.country, cu.city, pl.productLineName, ca.year, ca."""+ month_quater +"""
-            """ 
-              )
-        
-        # Return sales data from database             
-        rows, _ = do_query(sql)
-        
+        # Return sales data from database
+        self._queries.submit('sales_location', sales_queries.product_line_sales_location(_country, _city, month_quater),
+                             self._show_product_lines_data_location,
+                             [self.ui.query_button_location])
+
+    def _show_product_lines_data_location(self, rows):
+        """
+        Set the sales per location into the table.
+        """
         # Set the sales data into the table cells.
         # print(rows)
-        set_data_to_table_cells(self.ui.sales_table_location, rows, [6, 7])
+        self._sales_model_location.set_rows(rows)
                 
         adjust_column_widths(self.ui.sales_table_location)
 
@@ -263,40 +237,25 @@ class ProductLinesDialog(QDialog):
         year = self.ui.year_cb.currentData()
         _year = str(year[0])
 
-        sql = ( """
-            SELECT cu.country, pl.productLineName, ca.year, sum(sh.quantityOrdered), ROUND(avg(sh.priceEach), 2), sum(sh.quantityOrdered*sh.priceEach)
-            FROM pinnacle_wh.shippedorders sh
-            JOIN pinnacle_wh.productline pl ON pl.productLineID = sh.productLineID
-            JOIN pinnacle_wh.calendar ca ON ca.calendar_key = sh.calendar_key
-            JOIN customers cu on cu.customerNumber = sh.customerNumber
-            WHERE cu.country = '""" + _country + """'
-            AND ca.year = '""" + _year + """'
-            GROUP BY cu.country, pl.productLineName, ca.year
-            ORDER BY cu.country, pl.productLineName, ca.year
-            """ 
-              )
-        
         # Return sales data from database
-        rows, _ = do_query(sql)
-              
-        # Creating dataset
-        df = pd.DataFrame(rows,columns=['Country', 'Product Line', 'Year', 'Quantity', 'Average Price Each ($000)', 'Total Sales ($000)'])
-        print(df)
-        product_lines = df['Product Line']
-        
-        revenues = df['Total Sales ($000)']
-        scene = QGraphicsScene()
-        self.ui.label_year = QGraphicsView(scene)
-        # Creating plot
-        fig = plt.figure(figsize =(7, 7))
-        plt.pie(revenues, labels = product_lines, autopct='%1.0f%%', pctdistance=1.1, labeldistance=1.2)
-        plt.title(f"Pie Chart Of {_year} Total Sales ($000) Per Product Line In {_country}")
-
-        canvas = FigureCanvas(fig)
-        proxy_widget = scene.addWidget(canvas)
-
-        self.ui.label_year.resize(700, 700)
-        self.ui.label_year.show()
+        self._queries.submit('pie', sales_queries.product_line_share(_country, _year),
+                             partial(self._show_pie_chart, _country, _year),
+                             [self.ui.query_button_location_pie])
+
+    def _show_pie_chart(self, _country, _year, rows):
+        """
+        Draw the share of each product line in the yearly sales.
+        """
+        from ChartView import ChartView
+        from charts import PieChart
+
+        # The pie is drawn on a figure of its own rather than pyplot's,
+        # which would keep every figure ever drawn.
+        if self._pie_chart == None:
+            self._pie_chart = ChartView(PieChart, size=(7, 7))
+
+        self._pie_chart.show_chart(f"Pie Chart Of {_year} Total Sales ($000) Per Product Line In {_country}",
+                                   [row[1] for row in rows], [row[5] for row in rows])
         
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -0,0 +1,85 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, Qt
+from PyQt5.QtWidgets import QApplication
+from mydbutils import do_query_cached, POOL_SIZE
+
+class QuerySignals(QObject):
+    """
+    Signals of a query worker, a QRunnable cannot emit them itself.
+    """
+    finished = pyqtSignal(int, object)
+
+class QueryWorker(QRunnable):
+    """
+    Run one (sql, params) query on a thread pool thread.
+    """
+
+    def __init__(self, ticket, query):
+        super().__init__()
+
+        self.ticket = ticket
+        self.query = query
+        self.signals = QuerySignals()
+
+    def run(self):
+        # finished is always emitted, with no rows if the query failed,
+        # so the executor restores the cursor and the widgets.
+        rows = []
+        try:
+            rows, _ = do_query_cached(*self.query)
+        except Exception as e:
+            print('Query failed')
+            print(e)
+        finally:
+            self.signals.finished.emit(self.ticket, rows)
+
+class QueryExecutor(QObject):
+    """
+    Run dashboard queries off the GUI thread and deliver their rows
+    to a callback on the GUI thread. While queries are running the
+    busy cursor is shown and the widgets passed with them are disabled.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        # No more threads than pooled connections to run them on.
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(POOL_SIZE)
+
+        self._next_ticket = 0
+        self._latest = {}    # tag -> newest ticket submitted for it
+        self._pending = {}   # ticket -> (tag, callback, busy widgets, signals)
+
+    def submit(self, tag, query, on_result, busy_widgets=()):
+        """
+        Run query and call on_result(rows) when it is done. Only the
+        newest query submitted with the same tag delivers its result,
+        older ones still running are dropped when they finish.
+        """
+        self._next_ticket += 1
+        ticket = self._next_ticket
+        self._latest[tag] = ticket
+
+        worker = QueryWorker(ticket, query)
+        worker.signals.finished.connect(self._on_finished)
+        self._pending[ticket] = (tag, on_result, busy_widgets, worker.signals)
+
+        for widget in busy_widgets:
+            widget.setEnabled(False)
+        if len(self._pending) == 1:
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+
+        self._thread_pool.start(worker)
+
+    def _on_finished(self, ticket, rows):
+        tag, on_result, busy_widgets, _ = self._pending.pop(ticket)
+
+        if not self._pending:
+            QApplication.restoreOverrideCursor()
+
+        # Re-enable the widgets unless a newer query is using them.
+        if self._latest.get(tag) == ticket:
+            for widget in busy_widgets:
+                widget.setEnabled(True)
+
+            on_result(rows)
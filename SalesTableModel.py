@@ -0,0 +1,106 @@
+import numpy as np
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+class SalesTableModel(QAbstractTableModel):
+    """
+    Table model for query results, stored column by column in NumPy
+    arrays. The view only asks for the cells it shows, and money
+    columns are kept as floats and formatted when they are displayed.
+    """
+
+    def __init__(self, money_index=(), parent=None):
+        super().__init__(parent)
+
+        self._money_index = set(money_index)
+        self._headers = []
+        self._columns = []
+        self._row_count = 0
+
+    def set_headers(self, headers):
+        """
+        Set the column headers, which also sets the number of columns.
+        """
+        self.beginResetModel()
+        self._headers = list(headers)
+        self._columns = []
+        self._row_count = 0
+        self.endResetModel()
+
+    def clear(self):
+        """
+        Remove all rows, keeping the headers.
+        """
+        self.beginResetModel()
+        self._columns = []
+        self._row_count = 0
+        self.endResetModel()
+
+    def set_rows(self, rows):
+        """
+        Replace the rows with a list of tuples.
+        """
+        self.beginResetModel()
+        self._columns = self._to_columns(rows)
+        self._row_count = len(rows)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.column() >= len(self._columns):
+            return None
+
+        column = index.column()
+
+        if role == Qt.DisplayRole:
+            value = self._columns[column][index.row()]
+
+            if column in self._money_index:
+                if np.isnan(value):
+                    return ''
+                return "${:,.2f}".format(value)
+
+            return str(value)
+
+        if role == Qt.TextAlignmentRole and column in self._money_index:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+
+        if orientation == Qt.Horizontal:
+            if section < len(self._headers):
+                return self._headers[section]
+            return None
+
+        return str(section + 1)
+
+    def _to_columns(self, rows):
+        """
+        Transpose a list of row tuples into one array per column.
+        """
+        if not rows:
+            return []
+
+        columns = []
+        for i, values in enumerate(zip(*rows)):
+            if i in self._money_index:
+                values = [np.nan if v == None else float(v) for v in values]
+                columns.append(np.array(values, dtype=np.float64))
+            else:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+                columns.append(column)
+
+        return columns
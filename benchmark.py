@@ -0,0 +1,348 @@
+"""
+End-to-end benchmark of the operational load, the warehouse ETL and
+the dashboard queries on synthetic pinnacle_db data.
+
+    python benchmark.py --scale 10000 100000 1000000 --output bench.jsonl
+
+Each scale is the number of order lines to generate. By default every
+scale runs on fresh SQLite databases in a temporary directory. With
+--db-config and --wh-config it runs against those databases instead,
+which DROPS and recreates the pinnacle_db tables.
+
+One JSON object is appended to the output per timed step, with the
+code version, backend, scale, wall time, rows and peak memory, so runs
+of different versions can be compared.
+"""
+import argparse
+import datetime
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import sales_queries
+from mydbutils import (pooled_connection, iter_sql_statements, insert_csv,
+                       do_query, close_pools, get_pool, set_query_mode)
+from Pinnacle_wh import perform_ETL_warehouse
+from warehouse_snapshot import export_snapshot
+
+SCHEMA_FILE = 'pinnacle_db.sql'
+
+PRODUCT_LINES = ['Classic Cars', 'Motorcycles', 'Planes', 'Ships',
+                 'Trains', 'Trucks and Buses', 'Vintage Cars']
+COUNTRIES = {
+    'USA': ['NYC', 'San Francisco', 'Boston', 'Los Angeles', 'Philadelphia'],
+    'France': ['Paris', 'Nantes', 'Lyon', 'Marseille'],
+    'Germany': ['Berlin', 'Frankfurt', 'Munich'],
+    'Spain': ['Madrid', 'Barcelona'],
+    'Japan': ['Tokyo', 'Osaka'],
+    'Australia': ['Melbourne', 'Sydney'],
+    'UK': ['London', 'Manchester'],
+}
+FIRST_DATE = datetime.date(2003, 1, 1)
+DAYS = 3 * 365
+LINES_PER_ORDER = 9
+STATUSES = ['Shipped', 'Shipped', 'Shipped', 'Shipped', 'Shipped',
+            'Shipped', 'Shipped', 'Shipped', 'Cancelled', 'In Process']
+
+def _code_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'],
+                              capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except OSError:
+        return 'unknown'
+
+def _write_sqlite_configs(workdir):
+    """
+    Write SQLite configs for both schemas into workdir
+    and return their paths.
+    """
+    db_path = os.path.join(workdir, 'pinnacle_db.sqlite')
+    wh_path = os.path.join(workdir, 'pinnacle_wh.sqlite')
+    configs = []
+
+    for name, path, other, other_path in [
+            ('pinnacle_db', db_path, 'pinnacle_wh', wh_path),
+            ('pinnacle_wh', wh_path, 'pinnacle_db', db_path)]:
+        config_file = os.path.join(workdir, name + '.ini')
+        with open(config_file, 'w') as fd:
+            fd.write('[mysql]\n' +
+                     'backend = sqlite\n' +
+                     f'database = {name}\n' +
+                     f'path = {path}\n' +
+                     f'attach = {other}:{other_path}\n')
+        configs.append(config_file)
+
+    return configs
+
+def _create_schema(db_config):
+    """
+    Create the empty pinnacle_db tables from the DDL in SCHEMA_FILE.
+    """
+    with pooled_connection(db_config) as conn:
+        cursor = conn.cursor()
+
+        with open(SCHEMA_FILE) as fd:
+            for statement in iter_sql_statements(fd):
+                if statement[:6].upper() != 'INSERT':
+                    cursor.execute(statement)
+
+        conn.commit()
+        cursor.close()
+
+def _insert_rows(db_config, table, rows, batch_size=10000):
+    with pooled_connection(db_config) as conn:
+        cursor = conn.cursor()
+        sql = f"INSERT INTO {table} VALUES ({', '.join(['%s'] * len(rows[0]))})"
+
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+            conn.commit()
+
+        cursor.close()
+
+def generate_data(db_config, order_lines, csv_file, seed=0):
+    """
+    Fill pinnacle_db with consistent synthetic offices, employees,
+    customers, products and orders for about order_lines order lines,
+    and write the order lines to csv_file for the CSV load step.
+    Returns the number of order lines written.
+    """
+    rng = np.random.default_rng(seed)
+
+    orders_count = max(order_lines // LINES_PER_ORDER, 1)
+    customers_count = max(orders_count // 25, 50)
+    reps_count = max(customers_count // 8, 5)
+    products_count = 110
+
+    # Offices and employees: a president, one manager per office
+    # and sales reps spread over the offices.
+    offices = [(str(i + 1), city, '+1 555 0100', f'{i + 1} Main Street', None,
+                None, country, '00000', 'NA')
+               for i, (country, city) in enumerate(
+                   (country, cities[0]) for country, cities in COUNTRIES.items())]
+    employees = [(1000, 'Boss', 'Diane', 'dboss@pinnacle.com', '1', None, 'President')]
+    for i, office in enumerate(offices):
+        employees.append((1100 + i, f'Manager{i}', 'Mary', f'manager{i}@pinnacle.com',
+                          office[0], 1000, 'Sales Manager'))
+    for i in range(reps_count):
+        office = i % len(offices)
+        employees.append((2000 + i, f'Rep{i}', f'Sam{i}', f'rep{i}@pinnacle.com',
+                          offices[office][0], 1100 + office, 'Sales Rep'))
+
+    # Customers in the cities of COUNTRIES, each with a sales rep.
+    locations = [(country, city) for country, cities in COUNTRIES.items() for city in cities]
+    customer_location = rng.integers(0, len(locations), customers_count)
+    customer_rep = rng.integers(0, reps_count, customers_count)
+    customers = [(100 + i, f'Customer {i}', f'Last{i}', f'First{i}', '555-0100',
+                  f'{i} Market Street', None, locations[loc][1], None, '00000',
+                  locations[loc][0], 2000 + int(rep))
+                 for i, (loc, rep) in enumerate(zip(customer_location, customer_rep))]
+
+    products = [(f'S{i:04d}', f'Model {i}', PRODUCT_LINES[i % len(PRODUCT_LINES)],
+                 '1:18', 'Vendor', 1000, round(20 + (i * 7) % 80, 2),
+                 round(60 + (i * 13) % 140, 2))
+                for i in range(products_count)]
+
+    # Orders, most of them shipped.
+    order_numbers = np.arange(orders_count) + 10100
+    order_days = np.sort(rng.integers(0, DAYS, orders_count))
+    order_customers = rng.integers(0, customers_count, orders_count) + 100
+    order_status = rng.integers(0, len(STATUSES), orders_count)
+    orders = []
+    for number, day, customer, status in zip(order_numbers.tolist(), order_days.tolist(),
+                                             order_customers.tolist(), order_status.tolist()):
+        ordered = FIRST_DATE + datetime.timedelta(days=day)
+        required = ordered + datetime.timedelta(days=7)
+        shipped = ordered + datetime.timedelta(days=3) if STATUSES[status] == 'Shipped' else None
+        orders.append((number, ordered.isoformat(), required.isoformat(),
+                       None if shipped == None else shipped.isoformat(),
+                       STATUSES[status], customer))
+
+    # Order lines: consecutive, so distinct, products per order.
+    lines = rng.integers(1, 2 * LINES_PER_ORDER, orders_count)
+    lines = np.minimum(lines, products_count)
+    line_order = np.repeat(order_numbers, lines)
+    line_index = np.arange(len(line_order)) - np.repeat(np.cumsum(lines) - lines, lines)
+    first_product = np.repeat(rng.integers(0, products_count, orders_count), lines)
+    line_product = (first_product + line_index) % products_count
+    details = pd.DataFrame({
+        'orderNumber': line_order,
+        'productCode': [products[i][0] for i in line_product],
+        'quantityOrdered': rng.integers(20, 50, len(line_order)),
+        'priceEach': np.round(rng.uniform(30, 200, len(line_order)), 2),
+    })
+    details.to_csv(csv_file, index=False)
+
+    for table, rows in [('offices', offices), ('employees', employees),
+                        ('customers', customers), ('products', products),
+                        ('orders', orders)]:
+        _insert_rows(db_config, table, rows)
+
+    return len(details)
+
+def _dialog_queries(wh_config):
+    """
+    Return (name, query) for every query the two dialogs can run
+    with the menu values in the warehouse.
+    """
+    def values(query):
+        rows, _ = do_query(*query, config_file=wh_config)
+        return list(rows)
+
+    reps = values(sales_queries.employees_menu())
+    countries = [row[0] for row in values(sales_queries.countries_menu())]
+    product_lines = [row[0] for row in values(sales_queries.product_lines_menu())]
+    years = [row[0] for row in values(sales_queries.years_menu())]
+
+    queries = [('cities_menu', sales_queries.cities_menu(c)) for c in countries]
+    for period in sales_queries.PERIODS:
+        queries += [('employee_sales', sales_queries.employee_sales(first, last, period))
+                    for first, last in reps]
+        queries += [('product_line_sales', sales_queries.product_line_sales(line, period))
+                    for line in product_lines]
+        for country in countries:
+            cities = ['All'] + [row[0] for row in values(sales_queries.cities_menu(country))]
+            queries += [('employee_sales_location',
+                         sales_queries.employee_sales_location(country, city, period))
+                        for city in cities]
+            queries += [('product_line_sales_location',
+                         sales_queries.product_line_sales_location(country, city, period))
+                        for city in cities]
+    queries += [('product_line_share', sales_queries.product_line_share(country, year))
+                for country in countries for year in years]
+
+    return queries
+
+class Recorder:
+    """
+    Time benchmark steps and append one JSON line per step.
+    """
+
+    def __init__(self, output, run_info, trace_memory):
+        self.output = output
+        self.run_info = run_info
+        self.trace_memory = trace_memory
+
+    def measure(self, step, function, *args):
+        """
+        Run function(*args), record it as step and return its result.
+        If the result is an int it is recorded as the row count.
+        """
+        if self.trace_memory:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start
+
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            # ru_maxrss is in kilobytes on Linux.
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+        self.record(step, seconds, result if isinstance(result, int) else None,
+                    peak_memory_mb=round(peak / 2**20, 2),
+                    memory='traced' if self.trace_memory else 'max_rss')
+        return result
+
+    def record(self, step, seconds, rows, **fields):
+        """
+        Append one step that was timed elsewhere.
+        """
+        record = dict(self.run_info, step=step, seconds=round(seconds, 6),
+                      rows=rows, **fields)
+
+        with open(self.output, 'a') as fd:
+            fd.write(json.dumps(record) + '\n')
+
+        print(f"{record['scale']:>10,} {step:<44} {seconds:9.3f}s")
+
+def _run_queries(queries, wh_config):
+    rows = 0
+    for _, query in queries:
+        rows += len(do_query(*query, config_file=wh_config)[0])
+    return rows
+
+def run_scale(order_lines, recorder, db_config, wh_config, workdir, seed):
+    csv_file = os.path.join(workdir, 'orderdetails.csv')
+
+    recorder.measure('create_schema', _create_schema, db_config)
+    recorder.measure('generate_data', generate_data, db_config, order_lines, csv_file, seed)
+    recorder.measure('insert_csv', insert_csv,
+                     'INSERT INTO orderdetails VALUES (%s, %s, %s, %s)',
+                     csv_file, db_config, 10000)
+    for step, incremental, engine in (('etl_warehouse_frames', False, 'frames'),
+                                      ('etl_warehouse', False, 'sql'),
+                                      ('etl_warehouse_incremental', True, 'sql')):
+        report = recorder.measure(step, perform_ETL_warehouse,
+                                  db_config, wh_config, incremental, None, engine)
+        for entry in report:
+            recorder.record(f"{step}:{entry['task']}", entry['seconds'], entry['rows'],
+                            start=entry['start'])
+
+    queries = _dialog_queries(wh_config)
+    for name in sorted(set(name for name, _ in queries)):
+        selected = [q for q in queries if q[0] == name]
+        recorder.measure(f'query:{name}', _run_queries, selected, wh_config)
+
+    snapshot_dir = os.path.join(workdir, 'snapshots')
+    recorder.measure('snapshot_export', export_snapshot, wh_config, snapshot_dir)
+    for mode in ('local', 'cube'):
+        set_query_mode(mode, snapshot_dir, wh_config)
+        try:
+            if mode == 'cube':
+                recorder.measure('cube_load', _run_queries, queries[-1:], wh_config)
+            for name in sorted(set(name for name, _ in queries)):
+                selected = [q for q in queries if q[0] == name]
+                recorder.measure(f'query_{mode}:{name}', _run_queries, selected, wh_config)
+        finally:
+            set_query_mode('server')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=int, nargs='+', default=[10000],
+                        help='order lines to generate, one run per value')
+    parser.add_argument('--output', default='bench_results.jsonl',
+                        help='JSON lines file the results are appended to')
+    parser.add_argument('--db-config', help='pinnacle_db config, SQLite if omitted')
+    parser.add_argument('--wh-config', help='pinnacle_wh config, SQLite if omitted')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='measure the Python heap peak per step (slower)')
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:12]
+    version = _code_version()
+
+    for order_lines in args.scale:
+        with tempfile.TemporaryDirectory() as workdir:
+            if args.db_config and args.wh_config:
+                db_config, wh_config = args.db_config, args.wh_config
+            else:
+                db_config, wh_config = _write_sqlite_configs(workdir)
+
+            run_info = {'run': run_id, 'version': version,
+                        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                        'backend': get_pool(db_config).backend,
+                        'scale': order_lines}
+            recorder = Recorder(args.output, run_info, args.trace_memory)
+
+            try:
+                run_scale(order_lines, recorder, db_config, wh_config, workdir, args.seed)
+            finally:
+                close_pools()
+
+if __name__ == '__main__':
+    main()
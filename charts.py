@@ -0,0 +1,238 @@
+"""
+Sales charts that are built once and updated in place.
+
+A chart creates its matplotlib artists on a figure once; update() sets
+their data for a new query result instead of creating new ones, and
+refresh() redraws the figure. The artists that change with the data
+are animated: when nothing else changed, refresh() restores the saved
+background and blits just those artists, otherwise it draws the whole
+figure and saves its background again. Series longer than MAX_POINTS
+are reduced to the lowest and highest value of each bucket of points.
+
+Nothing here depends on Qt, so the charts work on any canvas, such as
+the Qt canvas of ChartView or the Agg canvas sales_report saves to files.
+"""
+import math
+
+import numpy as np
+
+# Most points a line is drawn with.
+MAX_POINTS = 400
+
+# Most labelled ticks on an x axis.
+MAX_TICKS = 24
+
+# The y axis is rescaled when the data leaves it or uses less than
+# this share of it, so similar series keep the background.
+Y_SHRINK = 0.5
+
+def period_labels(periods, years, period):
+    """
+    Return the x axis labels of monthly ('month') or quarterly ('qtr')
+    sales, such as 03-2004 or Q1-2004.
+    """
+    if period == 'qtr':
+        return [f'Q{quarter}-{year}' for quarter, year in zip(periods, years)]
+
+    return [f'{month:02d}-{year}' for month, year in zip(periods, years)]
+
+def downsample(values, max_points = MAX_POINTS):
+    """
+    Return the positions and values of at most max_points points of
+    a series: all of them if there are few enough, otherwise the
+    lowest and highest of each of max_points // 2 buckets, in order,
+    so peaks and dips stay visible.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) <= max_points:
+        return np.arange(len(values)), values
+
+    edges = np.linspace(0, len(values), max_points // 2 + 1).astype(int)
+    positions = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        bucket = values[start:end]
+        positions += sorted({start + int(bucket.argmin()), start + int(bucket.argmax())})
+
+    positions = np.array(positions)
+    return positions, values[positions]
+
+class Chart:
+    """
+    The drawing shared by the charts: the figure is drawn in full when
+    update() changed its layout, otherwise only the animated artists
+    are blitted onto the saved background.
+    """
+
+    def __init__(self, figure):
+        self.figure = figure
+        self.axes = figure.add_subplot()
+        self._background = None
+        self._stale = True
+        self._connection = None
+
+    def animated(self):
+        """
+        Return the artists update() changes without changing the layout.
+        """
+        return []
+
+    def refresh(self):
+        """
+        Redraw the chart on its figure's canvas.
+        """
+        canvas = self.figure.canvas
+
+        if self._connection == None:
+            # The background is saved on every full draw, including
+            # the ones the canvas does by itself, such as on a resize.
+            self._connection = canvas.mpl_connect('draw_event', self._on_draw)
+
+        if self._stale or self._background is None or not canvas.supports_blit:
+            canvas.draw()
+            self._stale = False
+        else:
+            canvas.restore_region(self._background)
+            self._draw_animated()
+            canvas.blit(self.figure.bbox)
+
+    def save(self, filename):
+        """
+        Write the chart to an image file in the format of its extension,
+        such as .png or .svg.
+        """
+        # Animated artists are left out of a plain draw, and other file
+        # formats have no background to blit onto.
+        if self._connection != None:
+            self.figure.canvas.mpl_disconnect(self._connection)
+            self._connection = None
+        self._background = None
+
+        artists = self.animated()
+        for artist in artists:
+            artist.set_animated(False)
+        try:
+            self.figure.savefig(filename)
+        finally:
+            for artist in artists:
+                artist.set_animated(True)
+
+    def _on_draw(self, event):
+        self._background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in self.animated():
+            self.figure.draw_artist(artist)
+
+class LineChart(Chart):
+    """
+    One series over time, such as the monthly revenue of a sales rep.
+    """
+
+    def __init__(self, figure, label, color = 'red'):
+        super().__init__(figure)
+
+        self.line, = self.axes.plot([], [], '-', color=color, label=label, animated=True)
+        self.title = self.axes.set_title('', animated=True)
+        self.axes.legend(loc='upper left')
+        self.axes.grid(True)
+        self._labels = None
+
+    def animated(self):
+        return [self.line, self.title]
+
+    def update(self, title, labels, values):
+        """
+        Show values, one per label of the x axis, under title.
+        """
+        positions, points = downsample(values)
+        self.line.set_data(positions, points)
+        self.title.set_text(title)
+
+        labels = list(labels)
+        if labels != self._labels:
+            step = max(1, math.ceil(len(labels) / MAX_TICKS))
+            ticks = range(0, len(labels), step)
+            self.axes.set_xticks(list(ticks))
+            self.axes.set_xticklabels([labels[i] for i in ticks], rotation=45, ha='right')
+            self.axes.set_xlim(-0.5, max(len(labels), 1) - 0.5)
+            self._labels = labels
+            self._stale = True
+
+        self._fit_y(points)
+
+    def _fit_y(self, points):
+        low = min(0.0, float(points.min())) if len(points) else 0.0
+        high = float(points.max()) if len(points) else 1.0
+        bottom, top = self.axes.get_ylim()
+
+        if low < bottom or high > top or high - low < Y_SHRINK * (top - bottom):
+            margin = (high - low) * 0.05 or 1.0
+            self.axes.set_ylim(low - (margin if low < 0 else 0), high + margin)
+            self._stale = True
+
+class PieChart(Chart):
+    """
+    The shares of a few categories, such as the product lines of the
+    yearly sales. With the same categories as before, the wedges and
+    their texts are moved in place.
+    """
+
+    def __init__(self, figure, label_distance = 1.2, pct_distance = 1.1):
+        super().__init__(figure)
+
+        self.label_distance = label_distance
+        self.pct_distance = pct_distance
+        self.title = self.axes.set_title('', animated=True)
+        self.axes.set_aspect('equal')
+        self.axes.set_xlim(-1.5, 1.5)
+        self.axes.set_ylim(-1.5, 1.5)
+        self.axes.axis('off')
+        self._labels = None
+        self._wedges = []
+        self._texts = []
+        self._pcts = []
+
+    def animated(self):
+        return self._wedges + self._texts + self._pcts + [self.title]
+
+    def update(self, title, labels, values):
+        """
+        Show the shares of values, one wedge per label, under title.
+        """
+        labels = list(labels)
+        values = np.asarray(values, dtype=float)
+        total = values.sum()
+        shares = values / total if total > 0 else np.zeros(len(values))
+        self.title.set_text(title)
+
+        if labels != self._labels:
+            for artist in self._wedges + self._texts + self._pcts:
+                artist.remove()
+
+            self._wedges, self._texts, self._pcts = self.axes.pie(
+                np.maximum(shares, 1e-12), labels=labels, autopct='%1.0f%%',
+                pctdistance=self.pct_distance, labeldistance=self.label_distance)
+            for artist in self._wedges + self._texts + self._pcts:
+                artist.set_animated(True)
+
+            # The pie resets the limits and turns the axes on again.
+            self.axes.set_xlim(-1.5, 1.5)
+            self.axes.set_ylim(-1.5, 1.5)
+            self.axes.axis('off')
+            self._labels = labels
+            self._stale = True
+
+        start = 0.0
+        for wedge, text, pct, share in zip(self._wedges, self._texts, self._pcts, shares):
+            end = start + 360.0 * share
+            wedge.set_theta1(start)
+            wedge.set_theta2(end)
+
+            angle = math.radians((start + end) / 2)
+            x, y = math.cos(angle), math.sin(angle)
+            text.set_position((self.label_distance * x, self.label_distance * y))
+            text.set_horizontalalignment('left' if x >= 0 else 'right')
+            pct.set_position((self.pct_distance * x, self.pct_distance * y))
+            pct.set_text(f'{100 * share:.0f}%')
+            start = end
@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import time
+import etl_log
+
+def default_workers(pool):
+    """
+    Return the number of tasks to run at once on pool's connections.
+    SQLite allows one writer per database file, so its tasks run one
+    at a time, MySQL ones get a worker per pooled connection.
+    """
+    if pool.backend == 'sqlite':
+        return 1
+    return pool.size
+
+def run_dag(tasks, pool, workers=None, run_start=None, log=None):
+    """
+    Run a graph of ETL tasks on a pool of worker threads.
+
+    tasks maps a task name to (function, dependencies), where function
+    is called with a connection checked out of pool for that task alone
+    and returns the number of rows it loaded, or None. A task is
+    started as soon as every task it depends on has finished.
+
+    Return the run report, a list of dicts with the task name, its
+    start time in seconds from the start of the run, its duration, its
+    row count and the warnings and bytes read it reported with
+    etl_log.add, in the order the tasks started. If a task fails, no
+    further tasks are started and its exception is raised once the
+    running ones have finished. Start times are measured from
+    run_start, a time.perf_counter() value, if it is given. Each task
+    is also recorded as a step of log, an etl_log.RunLog, if given.
+    """
+    for name, (_, dependencies) in tasks.items():
+        for dependency in dependencies:
+            if dependency not in tasks:
+                raise ValueError(f"Task {name} depends on unknown task {dependency}")
+
+    if workers == None:
+        workers = default_workers(pool)
+
+    report = []
+    done = set()
+    running = {}
+    failure = None
+    if run_start == None:
+        run_start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='etl') as executor:
+        while True:
+            if failure == None:
+                for name, (function, dependencies) in tasks.items():
+                    if (name not in done and name not in running.values()
+                            and all(d in done for d in dependencies)):
+                        future = executor.submit(_run_task, name, function, pool, run_start, log)
+                        running[future] = name
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    if failure == None:
+                        failure = e
+                    continue
+
+                done.add(name)
+                report.append(entry)
+
+    if failure != None:
+        raise failure
+
+    if len(done) < len(tasks):
+        raise ValueError('Circular task dependencies: '
+                         + ', '.join(name for name in tasks if name not in done))
+
+    report.sort(key=lambda entry: entry['start'])
+    return report
+
+def _run_task(name, function, pool, run_start, log):
+    start = time.perf_counter()
+
+    with (log.step(name) if log != None else etl_log.counting()) as stats:
+        conn = pool.get_connection()
+        if conn == None:
+            raise Exception(f'Could not get a connection from {pool.config_file}')
+
+        try:
+            rows = function(conn)
+        finally:
+            pool.release(conn)
+
+        if rows != None:
+            stats['rows'] = rows
+
+    return {'task': name, 'start': round(start - run_start, 6),
+            'seconds': round(time.perf_counter() - start, 6), 'rows': stats['rows'],
+            'warnings': stats['warnings'], 'bytes_read': stats['bytes_read']}
+
+def print_report(report):
+    """
+    Print a run report returned by run_dag.
+    """
+    for entry in report:
+        rows = '' if entry['rows'] == None else f"{entry['rows']:,} rows"
+        print(f"{entry['task']:<24} {entry['start']:8.3f}s +{entry['seconds']:8.3f}s  {rows}")
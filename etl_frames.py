@@ -0,0 +1,178 @@
+"""
+Columnar transforms of the warehouse ETL.
+
+The frames engine of perform_ETL_warehouse reads the operational tables
+into pandas DataFrames, builds every warehouse table from them in
+memory and loads the results through the warehouse connection, so the
+two schemas can live on different servers.
+"""
+import pandas as pd
+
+# Operational tables the warehouse is built from.
+SOURCE_TABLES = {
+    'employees': """
+        SELECT employeeNumber, lastName, firstName, email, reportsTo, jobTitle
+        FROM employees
+        """,
+    'products': """
+        SELECT productCode, productName, productLine, buyPrice
+        FROM products
+        """,
+    'customers': """
+        SELECT customerNumber, customerName, contactLastName, contactFirstName,
+               phone, city, country, salesRepEmployeeNumber
+        FROM customers
+        """,
+    'orders': """
+        SELECT orderNumber, orderDate, requiredDate, shippedDate, status, customerNumber
+        FROM orders
+        """,
+    'orderdetails': """
+        SELECT orderNumber, productCode, quantityOrdered, priceEach
+        FROM orderdetails
+        """,
+}
+
+# The columns each monthly aggregate is grouped by besides the month.
+AGGREGATE_GRAINS = {
+    'sales_productline_month': ['productLineID'],
+    'sales_salesrep_month': ['salesRepEmployeeNumber'],
+    'sales_location_month': ['country', 'city', 'productLineID'],
+}
+
+def calendar_frame(first, last):
+    """
+    Return the calendar rows for every day of the years from first to
+    last as a DataFrame in the column order of the calendar table.
+    """
+    dates = pd.date_range(f'{first.year}-01-01', f'{last.year}-12-31', freq='D')
+
+    return pd.DataFrame({
+        'calendar_key': dates.year * 10000 + dates.month * 100 + dates.day,
+        'full_date': dates.strftime('%Y-%m-%d'),
+        'day_of_week': dates.day_name(),
+        'day_of_month': dates.day,
+        'month': dates.month,
+        'qtr': dates.quarter,
+        'year': dates.year,
+    })
+
+def read_frame(conn, sql):
+    """
+    Run a query and return its rows as a DataFrame.
+    """
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    rows = cursor.fetchall()
+    columns = [c[0] for c in cursor.description]
+    cursor.close()
+
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+def order_years(orders):
+    """
+    Return the years the calendar has to cover for the orders frame.
+    """
+    if orders.empty:
+        return []
+
+    first = pd.Timestamp(orders['orderDate'].min())
+    last = pd.Timestamp(orders['requiredDate'].max())
+    return list(range(first.year, last.year + 1))
+
+def high_water(orders):
+    """
+    Return the newest ship date of the shipped orders, as a string.
+    """
+    shipped = orders.loc[orders['status'] == 'Shipped', 'shippedDate'].dropna()
+    if shipped.empty:
+        return None
+    return str(shipped.max())
+
+def transform(source):
+    """
+    Build the warehouse tables from the frames of SOURCE_TABLES, as the
+    SQL engine would. Return a dict of DataFrames by warehouse table,
+    each with the columns of its table.
+    """
+    employees = source['employees']
+    products = source['products']
+    customers = source['customers']
+    orders = source['orders']
+    orderdetails = source['orderdetails']
+
+    tables = {}
+
+    years = order_years(orders)
+    if years:
+        tables['calendar'] = calendar_frame(pd.Timestamp(f'{years[0]}-01-01'),
+                                            pd.Timestamp(f'{years[-1]}-01-01'))
+    else:
+        tables['calendar'] = calendar_frame(pd.Timestamp.now(), pd.Timestamp.now()).iloc[:0]
+
+    managers = employees[['employeeNumber', 'firstName', 'lastName', 'email']].rename(
+        columns={'employeeNumber': 'reportsTo', 'firstName': 'managerFirstName',
+                 'lastName': 'managerLastName', 'email': 'managerEmail'})
+    reps = employees[employees['jobTitle'] == 'Sales Rep'].merge(managers, on='reportsTo', how='left')
+    reps['managerName'] = reps['managerFirstName'] + ' ' + reps['managerLastName']
+    tables['salesrepemployee'] = reps[['employeeNumber', 'lastName', 'firstName', 'email',
+                                       'managerName', 'managerEmail']]
+
+    # IDs in the order the lines first appear, like the AUTO_INCREMENT
+    # key of the SQL engine.
+    lines = pd.unique(products['productLine'])
+    productline = pd.DataFrame({'productLineID': range(1, len(lines) + 1),
+                                'productLineName': lines})
+    tables['productline'] = productline
+
+    ordered = products['productCode'].isin(orderdetails['productCode'].unique())
+    tables['products'] = products.loc[ordered, ['productCode', 'productName', 'buyPrice']]
+
+    dimension = customers[customers['salesRepEmployeeNumber'].notna()]
+    tables['customers'] = dimension[['customerNumber', 'customerName', 'contactLastName',
+                                     'contactFirstName', 'phone', 'city', 'country']]
+
+    facts = (orders.loc[orders['status'] == 'Shipped', ['orderNumber', 'requiredDate', 'customerNumber']]
+             .merge(orderdetails, on='orderNumber')
+             .merge(products[['productCode', 'productLine']], on='productCode')
+             .merge(productline, left_on='productLine', right_on='productLineName')
+             .merge(customers[['customerNumber', 'salesRepEmployeeNumber']], on='customerNumber'))
+
+    required = pd.to_datetime(facts['requiredDate'])
+    facts['calendar_key'] = required.dt.year * 10000 + required.dt.month * 100 + required.dt.day
+    facts['salesRepEmployeeNumber'] = facts['salesRepEmployeeNumber'].astype('int64')
+    tables['shippedorders'] = facts[['orderNumber', 'calendar_key', 'customerNumber',
+                                     'salesRepEmployeeNumber', 'productCode', 'productLineID',
+                                     'quantityOrdered', 'priceEach']]
+
+    tables.update(aggregate(tables['shippedorders'], tables['calendar'], tables['customers']))
+
+    return tables
+
+def aggregate(facts, calendar, customers):
+    """
+    Return the monthly aggregate tables of the fact rows.
+    """
+    facts = facts.merge(calendar[['calendar_key', 'year', 'qtr', 'month']], on='calendar_key')
+    facts = facts.merge(customers[['customerNumber', 'country', 'city']], on='customerNumber')
+    facts['priceEach'] = facts['priceEach'].astype(float)
+    facts['revenue'] = facts['quantityOrdered'] * facts['priceEach']
+
+    aggregates = {}
+    for table, grain in AGGREGATE_GRAINS.items():
+        frame = facts.groupby(grain + ['year', 'qtr', 'month'], as_index=False).agg(
+            quantityOrdered=('quantityOrdered', 'sum'),
+            priceEachSum=('priceEach', 'sum'),
+            lineCount=('priceEach', 'size'),
+            revenue=('revenue', 'sum'))
+        aggregates[table] = frame.round({'priceEachSum': 2, 'revenue': 2})
+
+    return aggregates
+
+def frame_rows(frame):
+    """
+    Return the rows of a frame as tuples of Python values, with None
+    for missing ones, as the database drivers expect.
+    """
+    frame = frame.astype(object).where(frame.notna(), None)
+    return list(frame.itertuples(index=False, name=None))
@@ -0,0 +1,173 @@
+"""
+Structured log of ETL runs.
+
+Each step of a run, such as a table load, an INSERT ... SELECT or a CSV
+ingest, is appended to RUN_LOG as one JSON line when it finishes, with
+its wall time, rows affected, server warnings and bytes read. The steps
+of a run can also be saved to the etl_run_history table of the database
+the run wrote to, so runs can be compared over time.
+"""
+from contextlib import contextmanager
+import datetime
+import json
+import threading
+import time
+import uuid
+
+# JSON lines file every run appends its steps to.
+RUN_LOG = 'etl_run_log.jsonl'
+
+ETL_RUN_HISTORY = """
+    CREATE TABLE IF NOT EXISTS etl_run_history
+    (
+        run_id VARCHAR(32) NOT NULL,
+        step_no INT NOT NULL,
+        run VARCHAR(32),
+        step VARCHAR(128),
+        started_at DATETIME,
+        seconds DOUBLE,
+        rows_affected BIGINT,
+        warnings INT,
+        bytes_read BIGINT,
+        status VARCHAR(16),
+        error VARCHAR(255),
+        PRIMARY KEY(run_id, step_no)
+    )
+    """
+
+HISTORY_INSERT = """
+    INSERT INTO etl_run_history(run_id, step_no, run, step, started_at, seconds,
+                                rows_affected, warnings, bytes_read, status, error)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+
+# The counters of the step running in each thread.
+_current = threading.local()
+
+@contextmanager
+def counting():
+    """
+    Collect the counts that add() reports in this thread, and yield
+    them as a dict of rows, warnings and bytes_read. Counts nothing
+    reported stay None.
+    """
+    outer = getattr(_current, 'stats', None)
+    stats = {'rows': None, 'warnings': None, 'bytes_read': None}
+    _current.stats = stats
+
+    try:
+        yield stats
+    finally:
+        _current.stats = outer
+
+def add(rows = 0, warnings = 0, bytes_read = 0):
+    """
+    Add to the counters of the step running in this thread, if any.
+    """
+    stats = getattr(_current, 'stats', None)
+    if stats == None:
+        return
+
+    for key, value in (('rows', rows), ('warnings', warnings), ('bytes_read', bytes_read)):
+        if value:
+            stats[key] = (stats[key] or 0) + value
+
+class RunLog:
+    """
+    The steps of one ETL run.
+    """
+
+    def __init__(self, run, path = RUN_LOG):
+        self.run = run
+        self.run_id = uuid.uuid4().hex
+        self.path = path
+        self.steps = []
+        self._lock = threading.Lock()
+
+    def record(self, step, started_at, seconds, rows = None, warnings = None,
+               bytes_read = None, status = 'ok', error = None):
+        """
+        Add a finished step and append it to the log file.
+        started_at is a datetime.datetime.
+        """
+        entry = {
+            'run_id': self.run_id,
+            'run': self.run,
+            'step': step,
+            'started_at': started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'seconds': round(seconds, 6),
+            'rows': rows,
+            'warnings': warnings,
+            'bytes_read': bytes_read,
+            'status': status,
+            'error': None if error == None else str(error)[:255],
+        }
+
+        with self._lock:
+            self.steps.append(entry)
+            if self.path != None:
+                with open(self.path, 'a') as fd:
+                    fd.write(json.dumps(entry) + '\n')
+
+        return entry
+
+    @contextmanager
+    def step(self, name):
+        """
+        Time the block as step name and record it with the counts
+        reported with add(), or set in the yielded dict. A step that
+        raises is recorded as failed and the exception propagates.
+        """
+        started_at = datetime.datetime.now()
+        start = time.perf_counter()
+
+        with counting() as stats:
+            try:
+                yield stats
+            except Exception as e:
+                self.record(name, started_at, time.perf_counter() - start,
+                            status = 'failed', error = e, **stats)
+                raise
+
+            self.record(name, started_at, time.perf_counter() - start, **stats)
+
+    def failed(self):
+        return any(entry['status'] != 'ok' for entry in self.steps)
+
+    def summary(self):
+        """
+        Return the steps as text, one line per step.
+        """
+        lines = []
+        for entry in self.steps:
+            line = f"{entry['step']:<32} {entry['seconds']:9.3f}s"
+            if entry['rows'] != None:
+                line += f"  {entry['rows']:,} rows"
+            if entry['warnings']:
+                line += f"  {entry['warnings']:,} warnings"
+            if entry['status'] != 'ok':
+                line += f"  {entry['status'].upper()}: {entry['error']}"
+            lines.append(line)
+
+        return '\n'.join(lines)
+
+    def save_history(self, conn):
+        """
+        Save the steps to the etl_run_history table on conn, creating
+        the table if needed. Errors are printed, not raised, so that
+        the history never fails a run.
+        """
+        rows = [(self.run_id, i, self.run, e['step'], e['started_at'], e['seconds'],
+                 e['rows'], e['warnings'], e['bytes_read'], e['status'], e['error'])
+                for i, e in enumerate(self.steps)]
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute(ETL_RUN_HISTORY)
+            if rows:
+                cursor.executemany(HISTORY_INSERT, rows)
+            conn.commit()
+            cursor.close()
+        except Exception as e:
+            print('Could not save the ETL run history')
+            print(e)
@@ -0,0 +1,44 @@
+"""
+The country and city hierarchy of the customers, shared by the dialogs.
+"""
+import threading
+
+import sales_queries
+from mydbutils import do_query_cached, warehouse_version
+
+_hierarchy = None
+_version = None
+_lock = threading.Lock()
+
+def location_hierarchy(config_file = 'pinnacle_wh.ini'):
+    """
+    Return a dict from each country, in order, to its cities in order
+    as (city, number of customers) pairs. It is loaded with one query
+    and kept until the warehouse version changes, so every dialog of
+    the process shares it.
+    """
+    global _hierarchy, _version
+
+    with _lock:
+        version = warehouse_version()
+        if _hierarchy != None and version == _version:
+            return _hierarchy
+
+        rows, _ = do_query_cached(*sales_queries.locations(), config_file=config_file)
+
+        hierarchy = {}
+        for country, city, customers in rows:
+            hierarchy.setdefault(country, []).append((city, customers))
+
+        # A failed query is not kept, the next call tries again.
+        if rows:
+            _hierarchy = hierarchy
+            _version = version
+
+        return hierarchy
+
+def cities(country, config_file = 'pinnacle_wh.ini'):
+    """
+    Return the (city, number of customers) pairs of country.
+    """
+    return location_hierarchy(config_file).get(country, [])
@@ -1,8 +1,33 @@
-from mysql.connector import MySQLConnection, Error
+try:
+    from mysql.connector import MySQLConnection, Error as MySQLError
+except ImportError:
+    # Without mysql-connector only the SQLite backend can be used.
+    MySQLConnection = None
+
+    class MySQLError(Exception):
+        pass
 from configparser import ConfigParser
+from contextlib import contextmanager
+from collections import deque, OrderedDict
 import sqlite3
-from sqlite3 import OperationalError
+from sqlite_backend import SQLiteConnection
+import etl_log
+import threading
+import atexit
+import re
+import time
 import csv
+import os
+
+# Connection pool settings.
+POOL_SIZE = 5               # maximum open connections per config file/section
+POOL_IDLE_TIMEOUT = 300     # seconds an idle connection is kept open
+POOL_PING_AFTER = 5         # seconds idle before a checkout pings the server
+POOL_CHECKOUT_TIMEOUT = 30  # seconds to wait for a free connection
+PREPARED_PER_CONNECTION = 32  # prepared statements kept open per connection
+
+# Errors raised by either database backend.
+Error = (MySQLError, sqlite3.Error)
 
 def read_config(config_file = 'pinnacle_wh.ini', section = 'mysql'):
     parser = ConfigParser()
@@ -24,9 +49,18 @@ def read_config(config_file = 'pinnacle_wh.ini', section = 'mysql'):
     
     return config
         
-def make_connection(config_file = 'pinnacle_wh.ini', section = 'mysql'):
+def _connect(db_config):
+    """
+    Open a connection with the backend named in the config,
+    MySQL unless it says backend = sqlite.
+    """
+    db_config = dict(db_config)
+    backend = db_config.pop('backend', 'mysql')
+
     try:
-        db_config = read_config(config_file, section)
+        if backend == 'sqlite':
+            return SQLiteConnection(db_config)
+
         conn = MySQLConnection(**db_config)
 
         if conn.is_connected():
@@ -38,6 +72,229 @@ def make_connection(config_file = 'pinnacle_wh.ini', section = 'mysql'):
         
         return None
 
+def make_connection(config_file = 'pinnacle_wh.ini', section = 'mysql'):
+    """
+    Open a new, unpooled connection. Prefer pooled_connection()
+    unless the caller needs a connection of its own.
+    """
+    db_config = read_config(config_file, section)
+    return _connect(db_config)
+
+class ConnectionPool:
+    """
+    A bounded pool of open connections for one config file and section.
+    Connections are health-checked when checked out and closed once
+    they have been idle for longer than idle_timeout seconds.
+    """
+
+    def __init__(self, config_file, section, size=POOL_SIZE,
+                 idle_timeout=POOL_IDLE_TIMEOUT):
+        self.config_file = config_file
+        self.section = section
+        self.size = size
+        self.idle_timeout = idle_timeout
+
+        # The config file is parsed once per pool, not once per query.
+        self._config = read_config(config_file, section)
+        self.backend = self._config.get('backend', 'mysql')
+        self._idle = deque()  # (connection, time it was released)
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def get_connection(self, timeout=POOL_CHECKOUT_TIMEOUT):
+        """
+        Check out a connection, waiting up to timeout seconds for one
+        to be released if the pool is at its size limit.
+        Return None if no connection could be made.
+        """
+        deadline = time.monotonic() + timeout
+        conn = None
+        idle_since = None
+        expired = []
+
+        with self._cond:
+            while True:
+                expired += self._evict_idle()
+                if self._idle:
+                    # Most recently released first, it is the least likely
+                    # to have been dropped by the server.
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._in_use < self.size:
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            exhausted = conn == None and self._in_use >= self.size
+
+            if not exhausted:
+                self._in_use += 1
+
+        for stale in expired:
+            _close_quietly(stale)
+
+        if exhausted:
+            print('Connection pool exhausted.')
+            return None
+
+        # Ping connections that have been sitting idle for a while.
+        if conn != None and time.monotonic() - idle_since >= POOL_PING_AFTER:
+            if not _is_healthy(conn):
+                _close_quietly(conn)
+                conn = None
+
+        if conn == None:
+            conn = _connect(self._config)
+
+            if conn == None:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+
+        return conn
+
+    def release(self, conn):
+        """
+        Return a checked out connection to the pool.
+        Any open transaction is rolled back first.
+        """
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Error:
+            _close_quietly(conn)
+            conn = None
+
+        with self._cond:
+            self._in_use -= 1
+            if conn != None and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+
+        # Released after close().
+        if conn != None:
+            _close_quietly(conn)
+
+    def close(self):
+        """
+        Close all idle connections. Checked out connections are
+        closed when they are released afterwards, as are the ones
+        checked out later.
+        """
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+
+        for conn in idle:
+            _close_quietly(conn)
+
+    def _evict_idle(self):
+        """
+        Remove connections idle for longer than idle_timeout and
+        return them so they can be closed outside the lock.
+        """
+        expired = []
+        now = time.monotonic()
+
+        # The oldest connections are at the left end of the deque.
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+
+        return expired
+
+def _is_healthy(conn):
+    try:
+        return conn.is_connected()
+    except Error:
+        return False
+
+def _close_quietly(conn):
+    _statements.pop(id(conn), None)
+
+    try:
+        conn.close()
+    except Error:
+        pass
+
+# Prepared statement cursors of each pooled connection, by statement text.
+_statements = {}
+
+def _prepared_cursor(conn, sql):
+    """
+    Return a prepared statement cursor for sql on conn. The server
+    only parses and plans the statement the first time; later calls
+    with the same sql on the same connection reuse it.
+    """
+    statements = _statements.setdefault(id(conn), OrderedDict())
+    cursor = statements.get(sql)
+
+    if cursor != None:
+        statements.move_to_end(sql)
+        return cursor
+
+    cursor = conn.cursor(prepared=True)
+    statements[sql] = cursor
+
+    # Close the least recently used statement when over the limit.
+    if len(statements) > PREPARED_PER_CONNECTION:
+        _, oldest = statements.popitem(last=False)
+        try:
+            oldest.close()
+        except Error:
+            pass
+
+    return cursor
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(config_file = 'pinnacle_wh.ini', section = 'mysql'):
+    """
+    Return the shared connection pool for a config file and section,
+    creating it on first use.
+    """
+    key = (os.path.abspath(config_file), section)
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool == None:
+            pool = ConnectionPool(config_file, section)
+            _pools[key] = pool
+
+    return pool
+
+@atexit.register
+def close_pools():
+    """
+    Close every pool. get_pool creates new ones afterwards.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+
+    for pool in pools:
+        pool.close()
+
+@contextmanager
+def pooled_connection(config_file = 'pinnacle_wh.ini', section = 'mysql'):
+    """
+    Check out a pooled connection for the duration of a with block.
+    The connection is None if the database could not be reached.
+    """
+    pool = get_pool(config_file, section)
+    conn = pool.get_connection()
+
+    try:
+        yield conn
+    finally:
+        if conn != None:
+            pool.release(conn)
+
 def do_query_multi(sql):
     cursor = None
     
@@ -68,35 +325,338 @@ def do_query_multi(sql):
     else:
         return [(), 0]
     
-def do_query(sql):
-    cursor = None
-    
-    # Connect to the database.
-    conn = make_connection()
-        
-    if conn != None:
+def _run_query(conn, sql, params=None):
+    """
+    Run sql on conn and return [rows, count]. Queries with
+    parameters go through the connection's prepared statements.
+    Database errors are left to the caller.
+    """
+    if params != None:
+        cursor = _prepared_cursor(conn, sql)
+
         try:
-            cursor = conn.cursor()
-            cursor.execute(sql)
-            
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            return [rows, cursor.rowcount]
+
+        except Error:
+            # Do not reuse a statement that failed.
+            _statements[id(conn)].pop(sql, None)
+            try:
+                cursor.close()
+            except Error:
+                pass
+            raise
+
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(sql)
+
+        # Return the fetched data as a list of tuples,
+        # one tuple per table row.
+        rows = cursor.fetchall()
+        count = cursor.rowcount
+        return [rows, count]
+
+    finally:
+        cursor.close()
+
+def do_query(sql, params=None, config_file = 'pinnacle_wh.ini'):
+    if _query_mode != 'server':
+        result = _run_engine(sql, params)
+        if result != None:
+            return result
+
+    # Check out a connection from the pool.
+    with pooled_connection(config_file) as conn:
+        if conn == None:
+            return [(), 0]
+
+        try:
+            return _run_query(conn, sql, params)
+
         except Error as e:
             print('Query failed')
             print(e)
-            
+
             return [(), 0]
 
-    # Return the fetched data as a list of tuples,
-    # one tuple per table row.
-    if conn != None:
-        rows = cursor.fetchall()
-        count = cursor.rowcount
-            
-        conn.close()
-        return [rows, count]
-    else:
+# Result cache settings.
+CACHE_SIZE = 256    # maximum number of cached results
+CACHE_TTL = None    # seconds a result stays valid, None for no limit
+
+# Whitespace outside of quoted strings and identifiers.
+_SQL_WHITESPACE = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)|\s+""")
+
+def normalize_sql(sql):
+    """
+    Collapse runs of whitespace outside of quotes so that
+    the same query formatted differently has the same text.
+    """
+    return _SQL_WHITESPACE.sub(lambda m: m.group(1) or ' ', sql).strip()
+
+class QueryCache:
+    """
+    A size-bounded LRU cache of query results with an optional TTL.
+    Results are tagged with the warehouse version they were read at
+    and are dropped as soon as an ETL run bumps the version.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (result, version, stored at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the cached result for key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry != None:
+                result, version, stored_at = entry
+                expired = self.ttl != None and time.monotonic() - stored_at > self.ttl
+
+                if version == _warehouse_version and not expired:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+
+                del self._entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, result, version):
+        """
+        Cache result for key unless the warehouse has changed
+        since version was read.
+        """
+        with self._lock:
+            if version != _warehouse_version:
+                return
+
+            self._entries[key] = (result, version, time.monotonic())
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return the hit/miss counters and the current size.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries)}
+
+_warehouse_version = 0
+query_cache = QueryCache()
+
+# Where the dashboard queries are answered: 'server' runs them on the
+# database, 'local' on the newest Parquet snapshot of the warehouse and
+# 'cube' the sales queries on an in-memory sales_cube.SalesCube, the
+# others on the database.
+QUERY_MODES = ('server', 'local', 'cube')
+
+_query_mode = 'server'
+
+# The LocalWarehouse or SalesCube answering queries, created on the
+# first query so that setting the mode does not import pandas, and
+# the arguments it is created with.
+_query_engine = None
+_query_engine_args = None
+_query_engine_lock = threading.Lock()
+
+def warehouse_version():
+    """
+    Return the warehouse version, which every ETL run bumps.
+    """
+    return _warehouse_version
+
+def bump_warehouse_version():
+    """
+    Mark the warehouse as changed, invalidating every cached result.
+    Called when an ETL run completes.
+    """
+    global _warehouse_version
+
+    with query_cache._lock:
+        _warehouse_version += 1
+    query_cache.clear()
+
+def do_query_cached(sql, params=None, config_file = 'pinnacle_wh.ini'):
+    """
+    Same as do_query, but results are served from query_cache when the
+    same normalized query and parameters ran since the last ETL run.
+    Failed queries are not cached. The returned rows are shared with
+    the cache and must not be modified.
+    """
+    if _query_mode != 'server':
+        # The engine bumps the version, dropping the cache, when the
+        # warehouse was loaded by another process since.
+        _check_engine()
+
+    key = (config_file, normalize_sql(sql),
+           tuple(params) if params != None else None)
+    result = query_cache.get(key)
+    if result != None:
+        return result
+
+    version = _warehouse_version
+    result = None
+
+    if _query_mode != 'server':
+        result = _run_engine(sql, params)
+        if result != None and result[1] == 0 and not result[0]:
+            # Failed or empty, do not cache either.
+            return result
+
+    if result == None:
+        with pooled_connection(config_file) as conn:
+            if conn == None:
+                return [(), 0]
+
+            try:
+                result = _run_query(conn, sql, params)
+
+            except Error as e:
+                print('Query failed')
+                print(e)
+
+                return [(), 0]
+
+    query_cache.put(key, result, version)
+    return result
+
+def set_query_mode(mode, snapshot_dir = None, config_file = 'pinnacle_wh.ini'):
+    """
+    Answer do_query and do_query_cached from the database server
+    (mode 'server'), from the newest warehouse snapshot in snapshot_dir
+    (mode 'local'), which only answers the dialog queries of
+    sales_queries, or the sales queries from a cube of the warehouse
+    on config_file and the others from the server (mode 'cube').
+    Cached results are dropped.
+    """
+    global _query_mode, _query_engine, _query_engine_args
+
+    if mode not in QUERY_MODES:
+        raise ValueError(f'Unknown query mode {mode}, expected one of {QUERY_MODES}')
+
+    with _query_engine_lock:
+        _query_engine = None
+        _query_engine_args = (snapshot_dir, config_file)
+        _query_mode = mode
+
+    bump_warehouse_version()
+
+def _engine():
+    """
+    Return the engine of the query mode, creating it on first use.
+    """
+    global _query_engine
+
+    with _query_engine_lock:
+        if _query_engine == None:
+            snapshot_dir, config_file = _query_engine_args
+
+            # Both modules import this one.
+            if _query_mode == 'local':
+                from warehouse_snapshot import LocalWarehouse, SNAPSHOT_DIR
+                _query_engine = LocalWarehouse(snapshot_dir or SNAPSHOT_DIR)
+            else:
+                from sales_cube import SalesCube
+                _query_engine = SalesCube(config_file)
+
+        return _query_engine
+
+def _check_engine():
+    try:
+        _engine().check()
+
+    except Exception as e:
+        print('Warehouse check failed')
+        print(e)
+
+def _run_engine(sql, params):
+    """
+    Answer a query with the engine of the query mode. Return None if
+    the cube cannot answer it, so it goes to the server instead.
+    """
+    try:
+        return _engine().query(sql, params)
+
+    except LookupError as e:
+        if _query_mode == 'cube':
+            return None
+
+        print('Query failed')
+        print(e)
+
+        return [(), 0]
+
+    except Exception as e:
+        print('Query failed')
+        print(e)
+
         return [(), 0]
 
-def do_query_return_all(conn, sql):
+def iter_query(sql, params=None, batch_size=1000, config_file = 'pinnacle_wh.ini'):
+    """
+    Generator that runs sql on a pooled connection and yields its rows
+    one at a time. The rows are streamed from the server with an
+    unbuffered cursor, batch_size rows per fetchmany, so only one batch
+    is held in memory. The connection stays checked out until the
+    generator is exhausted or closed.
+    """
+    with pooled_connection(config_file) as conn:
+        if conn == None:
+            return
+
+        cursor = conn.cursor(buffered=False)
+
+        try:
+            cursor.execute(sql, params)
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+
+                for row in rows:
+                    yield row
+
+        except Error as e:
+            print('Query failed')
+            print(e)
+
+        finally:
+            # Discard rows the caller did not read so the
+            # connection can be reused.
+            conn.consume_results()
+            cursor.close()
+
+def do_query_return_all(conn, sql, config_file = 'pinnacle_wh.ini'):
+    """
+    Run sql on conn, or on a pooled connection
+    for config_file if conn is None.
+    """
+    if conn == None:
+        with pooled_connection(config_file) as conn:
+            if conn == None:
+                return [(), 0]
+
+            return do_query_return_all(conn, sql)
+
     cursor = None
 
     try:
@@ -115,7 +675,8 @@ def do_query_return_all(conn, sql):
         print('Query failed')
         print(e)
 
-        cursor.close()
+        if cursor != None:
+            cursor.close()
         return [(), 0]
 
 def set_data_to_table_cells(ui_table, rows, money_index):
@@ -146,8 +707,8 @@ def adjust_column_widths(ui_table):
     be stretched
     """
     from PyQt5.QtWidgets import QHeaderView
-    columns_count = ui_table.columnCount()
     header = ui_table.horizontalHeader()
+    columns_count = header.count()
     i = 0
     while i < columns_count:
         if i < columns_count - 1:
@@ -156,54 +717,346 @@ def adjust_column_widths(ui_table):
             header.setSectionResizeMode(i, QHeaderView.Stretch)
         i += 1
 
-def executeScriptsFromFile(filename, config_file='pinnacle_db.ini'):
+# Characters that change the tokenizer state outside of quotes,
+# and inside single, double and backtick quotes.
+_SQL_SPECIAL = re.compile(r"""['"`#]|--|/\*""")
+_SQL_QUOTE_END = {
+    "'": re.compile(r"[\\']"),
+    '"': re.compile(r'[\\"]'),
+    '`': re.compile(r'`'),
+}
+
+def iter_sql_statements(fd, delimiter=';'):
+    """
+    Read a SQL script from the file object fd line by line and yield
+    one statement at a time, without the delimiter. Delimiters inside
+    quoted strings, identifiers and comments are ignored, backslash
+    escapes and doubled quotes are respected, and mysql client
+    DELIMITER lines change the delimiter.
+    """
+    pieces = []
+    # Whether pieces hold more than whitespace, so the statement has
+    # started, kept instead of joining the pieces on every line.
+    started = False
+    quote = None
+    in_comment = False
+
+    for line in fd:
+        if quote == None and not in_comment and not started:
+            words = line.split()
+            if len(words) == 2 and words[0].upper() == 'DELIMITER':
+                delimiter = words[1]
+                pieces = []
+                continue
+
+        start = 0
+        i = 0
+        # The next delimiter at or after i, only searched for again once
+        # i has passed it, -1 if there is none on the rest of the line.
+        j = None
+        while i < len(line):
+            if in_comment:
+                # Block comments are kept, /*!...*/ ones are executable.
+                k = line.find('*/', i)
+                if k < 0:
+                    break
+                in_comment = False
+                i = k + 2
+
+            elif quote != None:
+                m = _SQL_QUOTE_END[quote].search(line, i)
+                if m == None:
+                    break
+                i = m.end()
+                if m.group() == '\\':
+                    # Skip the escaped character.
+                    i += 1
+                elif line.startswith(quote, i):
+                    # A doubled quote stands for the quote character.
+                    i += 1
+                else:
+                    quote = None
+
+            else:
+                if j == None or 0 <= j < i:
+                    j = line.find(delimiter, i)
+                m = _SQL_SPECIAL.search(line, i, j if j >= 0 else len(line))
+
+                if m == None:
+                    if j < 0:
+                        break
+                    piece = line[start:j]
+                    pieces.append(piece)
+                    if started or piece.strip():
+                        yield ''.join(pieces).strip()
+                    pieces = []
+                    started = False
+                    i = start = j + len(delimiter)
+                    continue
+
+                token = m.group()
+                i = m.end()
+                if token == '/*':
+                    in_comment = True
+                elif token == '#' or (token == '--' and line[i:i + 1] in ' \t\r\n'):
+                    # Line comments are dropped.
+                    piece = line[start:m.start()]
+                    pieces.append(piece + '\n')
+                    started = started or piece.strip() != ''
+                    start = i = len(line)
+                elif token != '--':
+                    quote = token
+
+        piece = line[start:]
+        pieces.append(piece)
+        started = started or piece.strip() != ''
+
+    if started:
+        yield ''.join(pieces).strip()
+
+@contextmanager
+def _logged_step(log, step, config_file):
+    """
+    Record a with block as a step of log, an etl_log.RunLog. Without a
+    log the step gets a run of its own, which is saved to the
+    etl_run_history table of config_file's database afterwards.
+    """
+    own_log = log == None
+    if own_log:
+        log = etl_log.RunLog('operational')
+
+    try:
+        with log.step(step) as stats:
+            yield stats
+    finally:
+        if own_log:
+            with pooled_connection(config_file) as conn:
+                if conn != None:
+                    log.save_history(conn)
+
+def executeScriptsFromFile(filename, config_file='pinnacle_db.ini', commit_every=100, log=None):
     """
     filename = "pinnacle_db.sql"
+
+    Execute the statements of a SQL script as they are read, so the
+    whole file is never held in memory. Runs of consecutive INSERT
+    statements are committed together, every commit_every statements.
+    The script is recorded as one step of log.
     """
-    conn = make_connection(config_file)
-    # Open and read the file as a single buffer
-    fd = open(filename, 'r')
-    sqlFile = fd.read()
-    fd.close()
     check = 0
+    pending = 0
 
-    # all SQL commands (split on ';')
-    sqlCommands = sqlFile.split(';')
+    with _logged_step(log, 'script_' + os.path.basename(filename), config_file), \
+         pooled_connection(config_file) as conn:
+        if conn == None:
+            return check
+
+        cursor = conn.cursor()
+        etl_log.add(bytes_read = os.path.getsize(filename))
+
+        with open(filename, 'r') as fd:
+            for command in iter_sql_statements(fd):
+                is_insert = command[:6].upper() == 'INSERT'
+
+                # Commit a run of inserts before any other statement.
+                if pending > 0 and not is_insert:
+                    conn.commit()
+                    pending = 0
 
-    # Execute every command from the input file
-    if conn != None:
-        try:
-            cursor = conn.cursor()
-            for command in sqlCommands:
                 try:
                     cursor.execute(command)
                     check = 1
-                except OperationalError:
+                except Error as e:
                     print("Command skipped: ")
+                    print(e)
+                    continue
+
+                etl_log.add(rows = max(cursor.rowcount, 0), warnings = conn.warning_count)
+
+                if is_insert:
+                    pending += 1
+                    if pending >= commit_every:
+                        conn.commit()
+                        pending = 0
+
+        conn.commit()
+        cursor.close()
+    
+    return check
+
+def insert_csv(sql_insert, filename, config_file='pinnacle_db.ini', batch_size=0, log=None):
+    """
+    Insert the rows of a CSV file (after its header line) with sql_insert.
+    With batch_size > 0 the rows are sent in batches of that size with
+    executemany, which sends one multi-row INSERT per batch, and each
+    batch is committed on its own. Otherwise one INSERT is sent per row.
+    The load is recorded as one step of log.
+    """
+    with _logged_step(log, 'insert_csv_' + os.path.basename(filename), config_file):
+        etl_log.add(bytes_read = os.path.getsize(filename))
+
+        if batch_size > 0:
+            return _insert_csv_batches(sql_insert, filename, config_file, batch_size)
+
+        check = 0
+        with pooled_connection(config_file) as conn:
+            if conn == None:
+                return check
+
+            cursor = conn.cursor()
+            with open(filename, newline='') as csv_file:
+                data = csv.reader(csv_file, delimiter=',', quotechar='"')
+                next(data, None)
+
+                for row in data:
+                    # Skip blank trailing rows such as ",,,".
+                    if not any(row):
+                        continue
 
+                    try:
+                        cursor.execute(sql_insert, row)
+                        etl_log.add(rows = 1, warnings = conn.warning_count)
+                        check = 1
+                    except Error as e:
+                        print(f'Row skipped: {row}')
+                        print(e)
+                conn.commit()
+        
             cursor.close()
+        return check
+
+def _insert_csv_batches(sql_insert, filename, config_file, batch_size):
+    check = 0
+    inserted = 0
+    start = time.perf_counter()
+
+    with pooled_connection(config_file) as conn:
+        if conn == None:
+            return check
+
+        cursor = conn.cursor()
+        with open(filename, newline='') as csv_file:
+            data = csv.reader(csv_file, delimiter=',', quotechar='"')
+            next(data, None)
+
+            batch = []
+            for row in data:
+                # Skip blank trailing rows such as ",,,".
+                if not any(row):
+                    continue
+
+                batch.append(row)
+                if len(batch) == batch_size:
+                    inserted += _insert_batch(conn, cursor, sql_insert, batch)
+                    batch = []
+
+            if batch:
+                inserted += _insert_batch(conn, cursor, sql_insert, batch)
+
+        cursor.close()
+
+    if inserted > 0:
+        check = 1
+
+    _report_load(filename, inserted, time.perf_counter() - start)
+    return check
+
+def _insert_batch(conn, cursor, sql_insert, batch):
+    """
+    Insert and commit one batch of rows, and return the number of rows
+    inserted. If the batch fails it is retried row by row so that one
+    bad row does not lose the rest of the batch.
+    """
+    try:
+        cursor.executemany(sql_insert, batch)
+        etl_log.add(rows = len(batch), warnings = conn.warning_count)
+        conn.commit()
+        return len(batch)
+
+    except Error as e:
+        conn.rollback()
+        print('Batch failed, retrying row by row')
+        print(e)
+
+    inserted = 0
+    for row in batch:
+        try:
+            cursor.execute(sql_insert, row)
+            etl_log.add(rows = 1, warnings = conn.warning_count)
+            inserted += 1
         except Error as e:
-            print('Query failed')
+            print(f'Row skipped: {row}')
             print(e)
-    
-    return check
 
-def insert_csv(sql_insert, filename, config_file='pinnacle_db.ini'):
-    conn = make_connection(config_file)
-    cursor = conn.cursor()
-    first = True
+    conn.commit()
+    return inserted
+
+def load_csv_infile(table, filename, config_file='pinnacle_db.ini', log=None):
+    """
+    Bulk load a CSV file (with a header line) into table with
+    LOAD DATA LOCAL INFILE. The server must have local_infile enabled.
+    Rows the server rejects are skipped with a warning.
+    The load is recorded as one step of log.
+    """
+    with _logged_step(log, 'load_csv_infile_' + os.path.basename(filename), config_file):
+        etl_log.add(bytes_read = os.path.getsize(filename))
+        return _load_csv_infile(table, filename, config_file)
+
+def _load_csv_infile(table, filename, config_file):
     check = 0
-    with open(filename, newline='') as csv_file:
-        data = csv.reader(csv_file, delimiter=',', quotechar='"')
-        for row in data:
-            if not first:
-                try:
-                    cursor.execute(sql_insert, row)
-                    check = 1
-                except Error:
-                    print("ERROR: could be end of file")
-            first = False
+    start = time.perf_counter()
+
+    # Local infile has to be allowed when the connection is opened,
+    # so this uses a dedicated connection rather than a pooled one.
+    db_config = read_config(config_file)
+
+    if db_config.get('backend', 'mysql') != 'mysql':
+        # Only MySQL has LOAD DATA, insert in batches instead.
+        with open(filename, newline='') as csv_file:
+            columns = len(next(csv.reader(csv_file)))
+
+        sql_insert = f"INSERT INTO {table} VALUES ({', '.join(['%s'] * columns)})"
+        return _insert_csv_batches(sql_insert, filename, config_file, 5000)
+
+    db_config['allow_local_infile'] = True
+    conn = _connect(db_config)
+
+    if conn == None:
+        return check
+
+    sql = (f"""
+        LOAD DATA LOCAL INFILE %s INTO TABLE {table}
+        FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+        LINES TERMINATED BY '\\n'
+        IGNORE 1 LINES
+        """
+        )
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, (os.path.abspath(filename),))
+        inserted = cursor.rowcount
+        warnings = conn.warning_count
+        etl_log.add(rows = inserted, warnings = warnings)
         conn.commit()
-    
-    cursor.close()
+        cursor.close()
+
+        if warnings > 0:
+            print(f'{warnings} warnings while loading {filename}')
+
+        _report_load(filename, inserted, time.perf_counter() - start)
+        check = 1
+
+    except Error as e:
+        print('Load failed')
+        print(e)
+
+    finally:
+        conn.close()
+
     return check
+
+def _report_load(filename, rows, seconds):
+    rate = rows / seconds if seconds > 0 else 0
+    print(f'Loaded {rows:,} rows from {filename} in {seconds:.2f}s ' +
+          f'({rate:,.0f} rows/sec)')
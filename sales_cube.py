@@ -0,0 +1,371 @@
+"""
+An in-memory sales cube for the dashboard queries.
+
+SalesCube reads the shippedorders fact rows and their dimensions from
+the warehouse once and keeps them as NumPy arrays: the sales rep,
+customer location and product line of every row as integer codes into
+small dictionaries of names, its month, quarter and year as integer
+codes, and the quantity, price and revenue as measures. The sales
+queries of both dialogs are answered by selecting rows with array
+comparisons and summing them by group code with np.bincount, in a few
+milliseconds instead of a multi-join GROUP BY on the server.
+
+The cube is loaded on the first query and again after each ETL run,
+which bumps the warehouse version. A load by another process is seen
+in etl_control and bumps the version too, which also drops the cached
+results. It is used by mydbutils.set_query_mode('cube').
+"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import sales_queries
+from etl_frames import read_frame
+from mydbutils import (pooled_connection, normalize_sql, warehouse_version,
+                       bump_warehouse_version, Error)
+
+CUBE_FACTS = """
+    SELECT calendar_key, customerNumber, salesRepEmployeeNumber, productLineID,
+           quantityOrdered, priceEach
+    FROM shippedorders
+    """
+
+CUBE_REPS = """
+    SELECT employeeNumber, firstName, lastName, managerName FROM salesrepemployee
+    """
+
+CUBE_CUSTOMERS = """
+    SELECT customerNumber, country, city FROM customers
+    """
+
+CUBE_PRODUCT_LINES = """
+    SELECT productLineID, productLineName FROM productline
+    ORDER BY productLineID
+    """
+
+# When the last load of the warehouse finished, from any process.
+CUBE_STAMP = """
+    SELECT max(loaded_at) FROM etl_control
+    """
+
+# Seconds between checks for a load by another process.
+CUBE_STAMP_INTERVAL = 30
+
+# Most groups summed with dense bincounts, more are sorted first.
+DENSE_GROUPS = 1 << 22
+
+# Codes per year of each period.
+PERIOD_CODES = {'month': 12, 'qtr': 4}
+
+# The dashboard queries the cube answers.
+CUBE_QUERIES = ('employee_sales', 'employee_sales_location', 'product_line_sales',
+                'product_line_sales_location', 'product_line_share')
+
+class SalesCube:
+    """
+    The sales of the warehouse on config_file, coded as NumPy arrays.
+    """
+
+    def __init__(self, config_file = 'pinnacle_wh.ini'):
+        self.config_file = config_file
+        self._queries = {normalize_sql(sql): entry
+                         for sql, entry in sales_queries.dialog_queries().items()
+                         if entry[0] in CUBE_QUERIES}
+        self._data = None
+        self._version = None
+        self._stamp = None
+        self._stamp_version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def query(self, sql, params = None):
+        """
+        Answer a sales query of sales_queries and return [rows, count]
+        as do_query does. Raise LookupError for any other query.
+        """
+        entry = self._queries.get(normalize_sql(sql))
+        if entry == None:
+            raise LookupError('The sales cube cannot answer this query')
+
+        name, args = entry
+        rows = getattr(self, name)(*args, *(params or ()))
+        return [rows, len(rows)]
+
+    def check(self):
+        """
+        Bump the warehouse version if another process has loaded the
+        warehouse since the last check, which drops the cached results
+        and makes the next query load the cube again. The stamp is read
+        at most every CUBE_STAMP_INTERVAL seconds.
+        """
+        with self._lock:
+            self._check_stamp()
+
+    def _check_stamp(self):
+        now = time.monotonic()
+        if self._checked_at != None and now - self._checked_at < CUBE_STAMP_INTERVAL:
+            return
+
+        with pooled_connection(self.config_file) as conn:
+            if conn == None:
+                return
+
+            version = warehouse_version()
+            stamp = _load_stamp(conn)
+
+        # A load by this process has bumped the version already.
+        if self._checked_at != None and stamp != self._stamp and version == self._stamp_version:
+            bump_warehouse_version()
+
+        self._stamp = stamp
+        self._stamp_version = warehouse_version()
+        self._checked_at = now
+
+    def _load(self):
+        """
+        Return the cube's arrays, loading them if the warehouse has
+        changed since they were.
+        """
+        with self._lock:
+            self._check_stamp()
+            if self._data != None and self._version == warehouse_version():
+                return self._data
+
+            with pooled_connection(self.config_file) as conn:
+                if conn == None:
+                    raise Exception(f'Could not connect with {self.config_file}')
+
+                # Read the version first, a bump while loading
+                # makes the next query load again.
+                version = warehouse_version()
+                self._data = _CubeData(conn)
+                self._version = version
+
+            return self._data
+
+    def employee_sales(self, period, first_name, last_name):
+        data = self._load()
+        names = [i for i, (first, last, _) in enumerate(data.rep_names)
+                 if first == first_name and last == last_name]
+        selected = np.isin(data.rep, names)
+
+        groups, sums = data.rollup(selected, [(data.rep, len(data.rep_names))], period)
+        rows = [data.rep_names[rep] + times + (revenue,)
+                for rep, times, revenue in zip(groups[0], data.times(groups, period),
+                                               _revenue(sums))]
+
+        return _sorted(rows, (0, 1, 2, 4, 3))
+
+    def employee_sales_location(self, period, country, city = 'All'):
+        data = self._load()
+        selected = data.in_location(country, city) & (data.rep >= 0)
+
+        groups, sums = data.rollup(selected, [(data.place, len(data.places)),
+                                              (data.rep, len(data.rep_names))], period)
+        rows = [data.places[place] + data.rep_names[rep] + times + (revenue,)
+                for place, rep, times, revenue in zip(groups[0], groups[1],
+                                                      data.times(groups, period),
+                                                      _revenue(sums))]
+
+        return _sorted(rows, (0, 1, 2, 3, 4, 6, 5))
+
+    def product_line_sales(self, period, product_line):
+        data = self._load()
+        selected = data.line == data.line_code(product_line)
+
+        groups, sums = data.rollup(selected, [(data.line, len(data.line_names))], period)
+        rows = [(data.line_names[line],) + times + sales
+                for line, times, sales in zip(groups[0], data.times(groups, period),
+                                              _sales(sums))]
+
+        return _sorted(rows, (0, 2, 1))
+
+    def product_line_sales_location(self, period, country, city = 'All'):
+        data = self._load()
+        selected = data.in_location(country, city) & (data.line >= 0)
+
+        groups, sums = data.rollup(selected, [(data.place, len(data.places)),
+                                              (data.line, len(data.line_names))], period)
+        rows = [data.places[place] + (data.line_names[line],) + times + sales
+                for place, line, times, sales in zip(groups[0], groups[1],
+                                                     data.times(groups, period),
+                                                     _sales(sums))]
+
+        return _sorted(rows, (0, 1, 2, 4, 3))
+
+    def product_line_share(self, country, year):
+        data = self._load()
+        selected = (data.in_location(country, 'All') & (data.line >= 0)
+                    & (data.year == int(year) - data.first_year))
+
+        groups, sums = data.rollup(selected, [(data.line, len(data.line_names))], None)
+        rows = [(country, data.line_names[line]) + times + sales
+                for line, times, sales in zip(groups[0], data.times(groups, None),
+                                              _sales(sums))]
+
+        return _sorted(rows, (0, 1, 2))
+
+class _CubeData:
+    """
+    One load of the cube. Codes of -1 mark fact rows whose dimension
+    row is missing, which the SQL joins would drop.
+    """
+
+    def __init__(self, conn):
+        facts = read_frame(conn, CUBE_FACTS)
+        reps = read_frame(conn, CUBE_REPS)
+        customers = read_frame(conn, CUBE_CUSTOMERS)
+        lines = read_frame(conn, CUBE_PRODUCT_LINES)
+
+        # Sales reps are grouped by name, as the queries do.
+        self.rep_names = list(dict.fromkeys(_tuples(reps[['firstName', 'lastName', 'managerName']])))
+        name_codes = {name: i for i, name in enumerate(self.rep_names)}
+        self.rep = _encode(facts['salesRepEmployeeNumber'],
+                           {number: name_codes[name] for number, name in
+                            zip(reps['employeeNumber'], _tuples(reps[['firstName', 'lastName', 'managerName']]))})
+
+        # A place is a (country, city) pair.
+        self.places = list(dict.fromkeys(_tuples(customers[['country', 'city']])))
+        place_codes = {place: i for i, place in enumerate(self.places)}
+        self.place = _encode(facts['customerNumber'],
+                             {number: place_codes[place] for number, place in
+                              zip(customers['customerNumber'], _tuples(customers[['country', 'city']]))})
+
+        self.countries = list(dict.fromkeys(country for country, _ in self.places))
+        place_country = np.array([self.countries.index(country) for country, _ in self.places] + [-1])
+        self.country = place_country[self.place]
+
+        self.line_names = list(lines['productLineName'])
+        self.line = _encode(facts['productLineID'],
+                            {line: i for i, line in enumerate(lines['productLineID'])})
+
+        keys = facts['calendar_key'].to_numpy(dtype=np.int64)
+        year = keys // 10000
+        month = keys // 100 % 100
+        self.first_year = int(year.min()) if len(keys) else 0
+        self.year = year - self.first_year
+        self.years = int(self.year.max()) + 1 if len(keys) else 1
+        self.period = {'month': self.year * 12 + month - 1,
+                       'qtr': self.year * 4 + (month - 1) // 3}
+
+        self.measures = {
+            'quantity': facts['quantityOrdered'].to_numpy(dtype=np.float64),
+            'price': facts['priceEach'].to_numpy(dtype=np.float64),
+        }
+        self.measures['revenue'] = self.measures['quantity'] * self.measures['price']
+
+    def line_code(self, name):
+        return self.line_names.index(name) if name in self.line_names else -2
+
+    def in_location(self, country, city):
+        """
+        Select the fact rows of one city, or of every city of country
+        if city is 'All'.
+        """
+        if city != 'All':
+            code = self.places.index((country, city)) if (country, city) in self.places else -2
+            return self.place == code
+
+        code = self.countries.index(country) if country in self.countries else -2
+        return self.country == code
+
+    def rollup(self, selected, dimensions, period):
+        """
+        Sum the measures of the selected fact rows by dimensions, a
+        list of (code array, number of codes), and the period codes,
+        or the year if period is None. Return the codes of each group,
+        one array per dimension and one for the period, and a dict of
+        the sums by group, with the row count as 'count'.
+        """
+        times = self.period[period] if period != None else self.year
+        dimensions = dimensions + [(times, self.years * PERIOD_CODES.get(period, 1))]
+        sizes = [size for _, size in dimensions]
+
+        key = np.zeros(np.count_nonzero(selected), dtype=np.int64)
+        for codes, size in dimensions:
+            key = key * size + codes[selected]
+
+        total = int(np.prod(sizes))
+        if total <= DENSE_GROUPS:
+            counts = np.bincount(key, minlength=total)
+            groups = np.flatnonzero(counts)
+            sums = {name: np.bincount(key, weights=values[selected], minlength=total)[groups]
+                    for name, values in self.measures.items()}
+            sums['count'] = counts[groups]
+        else:
+            groups, key = np.unique(key, return_inverse=True)
+            sums = {name: np.bincount(key, weights=values[selected])
+                    for name, values in self.measures.items()}
+            sums['count'] = np.bincount(key)
+
+        return [codes.tolist() for codes in np.unravel_index(groups, sizes)], sums
+
+    def times(self, groups, period):
+        """
+        Return (period, year) of each group of rollup, or (year,)
+        if period is None.
+        """
+        if period == None:
+            return [(self.first_year + code,) for code in groups[-1]]
+
+        per_year = PERIOD_CODES[period]
+        return [(code % per_year + 1, self.first_year + code // per_year) for code in groups[-1]]
+
+def _load_stamp(conn):
+    try:
+        cursor = conn.cursor()
+        cursor.execute(CUBE_STAMP)
+        stamp = cursor.fetchall()[0][0]
+        cursor.close()
+        return stamp
+    except Error:
+        return None
+
+def _tuples(frame):
+    return [tuple(None if pd.isna(value) else value for value in row)
+            for row in frame.itertuples(index=False, name=None)]
+
+def _encode(values, codes):
+    """
+    Return the codes of values as an array, -1 for unknown values.
+    """
+    return values.map(codes).fillna(-1).to_numpy(dtype=np.int64)
+
+def round_cents(values):
+    """
+    Round amounts to cents half up, as SQL ROUND(x, 2) does, where
+    NumPy and pandas round half to even.
+    """
+    return np.floor(np.asarray(values, dtype=np.float64) * 100 + 0.5) / 100
+
+def average_price(price_sums, line_counts):
+    """
+    Return sales_queries.AVERAGE_PRICE of sums of prices and their
+    line counts. The quotient is taken to the 6 decimals MySQL
+    divides the decimal sums to, and then rounded half up to cents,
+    in integers so that no float error moves a price across a half.
+    """
+    cents = np.rint(np.asarray(price_sums, dtype=np.float64) * 100).astype(np.int64)
+    counts = np.asarray(line_counts, dtype=np.int64)
+    micros = (2 * cents * 10000 + counts) // (2 * counts)
+    return ((micros + 5000) // 10000) / 100
+
+def _revenue(sums):
+    return round_cents(sums['revenue']).tolist()
+
+def _sales(sums):
+    """
+    Return (quantity, average price, revenue) of each group.
+    """
+    return zip(np.rint(sums['quantity']).astype(np.int64).tolist(),
+               average_price(sums['price'], sums['count']).tolist(),
+               _revenue(sums))
+
+def _sorted(rows, order):
+    """
+    Sort rows by the columns at the positions in order, with None
+    first as the SQL ORDER BY does.
+    """
+    return sorted(rows, key=lambda row: tuple((row[i] is not None, row[i]) for i in order))
@@ -0,0 +1,276 @@
+"""
+SQL for the dashboard queries of the Employees and ProductLines dialogs.
+Every function returns a (sql, params) pair for do_query. Values chosen
+by the user are passed as bind parameters, so each query has a fixed
+statement text that the server prepares once per connection.
+
+Sales are read from the monthly aggregate tables the ETL maintains,
+where one answers the query, and from the shippedorders fact table
+otherwise. Quarters and years are rolled up from the months.
+"""
+
+# Calendar columns a table can be grouped by.
+PERIODS = ('month', 'qtr')
+
+# Monthly aggregate tables, smallest first, with the columns
+# they are grouped by besides the month.
+AGGREGATES = (
+    ('sales_productline_month', ('productLineID',)),
+    ('sales_salesrep_month', ('salesRepEmployeeNumber',)),
+    ('sales_location_month', ('country', 'city', 'productLineID')),
+)
+
+# Average price of the order lines of a rollup. SQLite divides integers
+# as integers, and stores whole decimal sums as integers.
+AVERAGE_PRICE = 'ROUND(sum(ag.priceEachSum) / (1.0 * sum(ag.lineCount)), 2)'
+
+def _aggregate(*columns):
+    """
+    Return the smallest aggregate table grouped by all of columns,
+    or None if only the fact table has them.
+    """
+    for table, grain in AGGREGATES:
+        if set(columns) <= set(grain):
+            return table
+
+    return None
+
+def _period(period):
+    """
+    Column names cannot be bound, so only allow known ones.
+    """
+    if period not in PERIODS:
+        raise ValueError(f'Unknown period {period}, expected one of {PERIODS}')
+
+    return period
+
+def dialog_queries():
+    """
+    Return a dict from the SQL of every dashboard query to the name of
+    the function below that builds it and the arguments its text
+    depends on: the period and whether one city or all are chosen. The
+    bound parameters of a query follow those arguments. Engines that
+    answer the dashboards without SQL look their queries up here.
+    """
+    queries = {}
+
+    def add(query, name, *args):
+        queries[query[0]] = (name, args)
+
+    add(menus(), 'menus')
+    add(employees_menu(), 'employees_menu')
+    add(countries_menu(), 'countries_menu')
+    add(cities_menu(None), 'cities_menu')
+    add(locations(), 'locations')
+    add(product_lines_menu(), 'product_lines_menu')
+    add(years_menu(), 'years_menu')
+    add(product_line_share(None, 0), 'product_line_share')
+
+    for period in PERIODS:
+        add(employee_sales(None, None, period), 'employee_sales', period)
+        add(product_line_sales(None, period), 'product_line_sales', period)
+
+        # One city or all of them give different SQL.
+        for city in ('All', None):
+            add(employee_sales_location(None, city, period), 'employee_sales_location', period)
+            add(product_line_sales_location(None, city, period), 'product_line_sales_location', period)
+
+    return queries
+
+# The menus loaded by menus(), in their order in its result.
+MENUS = ('countries', 'employees', 'product_lines', 'years')
+
+def menus():
+    """
+    The employees, countries, product lines and years menus in one
+    query, so the dialogs fill them with one round trip. Each row is
+    (menu, value, second value, sort key). split_menus gives the rows
+    of each menu as its own query would.
+    """
+    sql = """
+        SELECT 'employees', firstName, lastName, NULL FROM pinnacle_wh.salesrepemployee
+        UNION ALL
+        SELECT DISTINCT 'countries', country, NULL, NULL FROM customers
+        UNION ALL
+        SELECT 'product_lines', productLineName, NULL, productLineID FROM productline
+        UNION ALL
+        SELECT DISTINCT 'years', year, NULL, NULL FROM calendar
+        ORDER BY 1, 4, 2, 3
+        """
+    return sql, None
+
+def split_menus(rows):
+    """
+    Return a dict of the rows of each menu in MENUS from the rows of
+    menus(), as lists of tuples.
+    """
+    split = {menu: [] for menu in MENUS}
+    for menu, value, second, _ in rows:
+        if menu == 'employees':
+            split[menu].append((value, second))
+        elif menu == 'years':
+            split[menu].append((int(value),))
+        else:
+            split[menu].append((value,))
+
+    return split
+
+def employees_menu():
+    sql = """
+        SELECT firstName, lastName FROM pinnacle_wh.salesrepemployee
+        ORDER BY firstName, lastName
+        """
+    return sql, None
+
+def countries_menu():
+    sql = """
+        SELECT distinct country FROM customers
+        ORDER BY country
+        """
+    return sql, None
+
+def cities_menu(country):
+    sql = """
+        SELECT distinct city FROM customers
+        WHERE country = %s ORDER BY city
+        """
+    return sql, (country,)
+
+def locations():
+    """
+    The cities of every country with their number of customers,
+    for the city menus of both dialogs.
+    """
+    sql = """
+        SELECT country, city, count(*) FROM customers
+        WHERE country IS NOT NULL AND city IS NOT NULL
+        GROUP BY country, city
+        ORDER BY country, city
+        """
+    return sql, None
+
+def product_lines_menu():
+    sql = """
+        SELECT productLineName FROM productline
+        """
+    return sql, None
+
+def years_menu():
+    sql = """
+        SELECT distinct year FROM calendar
+        """
+    return sql, None
+
+def employee_sales(first_name, last_name, period):
+    """
+    Monthly or quarterly revenue of one sales rep.
+    """
+    period = _period(period)
+
+    aggregate = _aggregate('salesRepEmployeeNumber')
+
+    sql = ( """
+        SELECT sa.firstName, sa.lastName, sa.managerName, ag."""+ period +""", ag.year, sum(ag.revenue)
+        FROM """+ aggregate +""" ag
+        JOIN salesrepemployee sa ON sa.employeeNumber = ag.salesRepEmployeeNumber
+        WHERE sa.firstName = %s
+        AND sa.lastName = %s
+        GROUP BY sa.firstName, sa.lastName, sa.managerName, ag."""+ period +""", ag.year
+        ORDER BY sa.firstName, sa.lastName, ag.year, ag."""+ period +"""
+        """
+          )
+    return sql, (first_name, last_name)
+
+def employee_sales_location(country, city, period):
+    """
+    Monthly or quarterly revenue per sales rep for the customers
+    in one city, or in every city of a country if city is 'All'.
+    No aggregate is grouped by both location and sales rep, so this
+    one reads the fact table.
+    """
+    period = _period(period)
+
+    params = (country,)
+    city_filter = ''
+    if city != 'All':
+        city_filter = 'AND cu.city = %s'
+        params = (country, city)
+
+    sql = ( """
+        SELECT cu.country, cu.city, sa.firstName, sa.lastName, sa.managerName, ca."""+ period +""", ca.year, sum(sh.quantityOrdered*sh.priceEach)
+        FROM shippedorders sh
+        JOIN salesrepemployee sa ON sa.employeeNumber = sh.salesRepEmployeeNumber
+        JOIN calendar ca ON ca.calendar_key = sh.calendar_key
+        JOIN customers cu on cu.customerNumber = sh.customerNumber
+        WHERE cu.country = %s
+        """ + city_filter + """
+        GROUP BY cu.country, cu.city, sa.firstName, sa.lastName, sa.managerName, ca."""+ period +""", ca.year
+        ORDER BY cu.country, cu.city, sa.firstName, sa.lastName, ca.year, ca."""+ period +"""
+        """
+        )
+    return sql, params
+
+def product_line_sales(product_line, period):
+    """
+    Monthly or quarterly quantity, average price and revenue
+    of one product line.
+    """
+    period = _period(period)
+
+    aggregate = _aggregate('productLineID')
+
+    sql = ( """
+        SELECT pl.productLineName, ag."""+ period +""", ag.year, sum(ag.quantityOrdered), """+ AVERAGE_PRICE +""", sum(ag.revenue)
+        FROM pinnacle_wh."""+ aggregate +""" ag
+        JOIN pinnacle_wh.productline pl ON pl.productLineID = ag.productLineID
+        WHERE pl.productLineName = %s
+        GROUP BY pl.productLineName, ag."""+ period +""", ag.year
+        ORDER BY pl.productLineName, ag.year, ag."""+ period +"""
+        """
+          )
+    return sql, (product_line,)
+
+def product_line_sales_location(country, city, period):
+    """
+    Monthly or quarterly sales per product line for the customers
+    in one city, or in every city of a country if city is 'All'.
+    """
+    period = _period(period)
+
+    aggregate = _aggregate('country', 'city', 'productLineID')
+
+    params = (country,)
+    city_filter = ''
+    if city != 'All':
+        city_filter = 'AND ag.city = %s'
+        params = (country, city)
+
+    sql = ( """
+        SELECT ag.country, ag.city, pl.productLineName, ag."""+ period +""", ag.year, sum(ag.quantityOrdered), """+ AVERAGE_PRICE +""", sum(ag.revenue)
+        FROM pinnacle_wh."""+ aggregate +""" ag
+        JOIN pinnacle_wh.productline pl ON pl.productLineID = ag.productLineID
+        WHERE ag.country = %s
+        """ + city_filter + """
+        GROUP BY ag.country, ag.city, pl.productLineName, ag."""+ period +""", ag.year
+        ORDER BY ag.country, ag.city, pl.productLineName, ag.year, ag."""+ period +"""
+        """
+          )
+    return sql, params
+
+def product_line_share(country, year):
+    """
+    Yearly sales per product line in one country, for the pie chart.
+    """
+    aggregate = _aggregate('country', 'productLineID')
+
+    sql = ( """
+        SELECT ag.country, pl.productLineName, ag.year, sum(ag.quantityOrdered), """+ AVERAGE_PRICE +""", sum(ag.revenue)
+        FROM pinnacle_wh."""+ aggregate +""" ag
+        JOIN pinnacle_wh.productline pl ON pl.productLineID = ag.productLineID
+        WHERE ag.country = %s
+        AND ag.year = %s
+        GROUP BY ag.country, pl.productLineName, ag.year
+        ORDER BY ag.country, pl.productLineName, ag.year
+        """
+          )
+    return sql, (country, int(year))
@@ -0,0 +1,275 @@
+"""
+Batch sales reports without the dialogs.
+
+    python sales_report.py --output reports --format csv json --charts png svg
+
+Runs the queries of EmployeesDialog and ProductLinesDialog for every
+sales rep, product line, country, city and year of the menus, monthly
+and quarterly, and writes each result as a table under the output
+directory, one subdirectory per report. The charts the dialogs draw are
+rendered to image files with the Agg backend in a pool of worker
+processes while the main process runs the queries; each worker keeps
+one figure per chart type and updates it in place (charts.py).
+
+By default the queries are answered from the sales cube, as in the
+application; --mode server runs them on the database.
+"""
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import re
+import time
+from decimal import Decimal
+
+import sales_queries
+from charts import period_labels
+from locations import location_hierarchy
+from mydbutils import do_query, set_query_mode, QUERY_MODES
+
+# Default directory the reports are written to.
+REPORT_DIR = 'reports'
+
+TABLE_FORMATS = ('csv', 'json')
+CHART_FORMATS = ('png', 'svg')
+PERIODS = ('month', 'qtr')
+
+# Charts sent to a worker process at a time.
+CHART_BATCH = 16
+
+# Figure size in inches of each chart type.
+CHART_SIZES = {'line': (10, 7), 'pie': (7, 7)}
+
+# Table columns, as the dialogs head them.
+PERIOD_COLUMNS = {'month': 'Month', 'qtr': 'Quarter'}
+SALES_COLUMNS = ['Quantity', 'Average Price Each ($000)', 'Total Sales ($000)']
+
+def employee_reports(menus, hierarchy, periods):
+    """
+    Yield (report, name, columns, query, chart) for the sales of every
+    sales rep and location of the employees dialog. chart is None or
+    (type, title, line label, period, label column, year column,
+    value column). The label column is the period of line charts,
+    whose labels are built with charts.period_labels.
+    """
+    for period in periods:
+        columns = [PERIOD_COLUMNS[period], 'Year End']
+
+        for first_name, last_name in menus['employees']:
+            yield ('employee_sales', f'{first_name} {last_name} {period}',
+                   ['First Name', 'Last Name', 'Manager Name'] + columns + ['Revenue ($000)'],
+                   sales_queries.employee_sales(first_name, last_name, period),
+                   ('line', f'Sales Performance Of {first_name} {last_name}',
+                    'Revenue Made ($000)', period, 3, 4, 5))
+
+        for country, city in _locations(hierarchy):
+            yield ('employee_sales_location', f'{country} {city} {period}',
+                   ['Country', 'City', 'First Name', 'Last Name', 'Manager Name'] + columns
+                   + ['Revenue ($000)'],
+                   sales_queries.employee_sales_location(country, city, period), None)
+
+def product_line_reports(menus, hierarchy, periods):
+    """
+    Yield the reports of the product lines dialog as employee_reports
+    does, with a pie chart of every country and year.
+    """
+    for period in periods:
+        columns = [PERIOD_COLUMNS[period], 'Year End']
+
+        for product_line, in menus['product_lines']:
+            yield ('product_line_sales', f'{product_line} {period}',
+                   ['Product Line'] + columns + SALES_COLUMNS,
+                   sales_queries.product_line_sales(product_line, period),
+                   ('line', f'Sales Of {product_line}', 'Quantity Sold', period, 1, 2, 3))
+
+        for country, city in _locations(hierarchy):
+            yield ('product_line_sales_location', f'{country} {city} {period}',
+                   ['Country', 'City', 'Product Line'] + columns + SALES_COLUMNS,
+                   sales_queries.product_line_sales_location(country, city, period), None)
+
+    for country in hierarchy:
+        for year, in menus['years']:
+            yield ('product_line_share', f'{country} {year}',
+                   ['Country', 'Product Line', 'Year'] + SALES_COLUMNS,
+                   sales_queries.product_line_share(country, str(year)),
+                   ('pie', f'Pie Chart Of {year} Total Sales ($000) Per Product Line In {country}',
+                    None, None, 1, None, 5))
+
+def _locations(hierarchy):
+    """
+    Yield (country, city) of every location of the city menus: each
+    country as a whole ('All') and each of its cities.
+    """
+    for country, cities in hierarchy.items():
+        yield country, 'All'
+        for city, _ in cities:
+            yield country, city
+
+def build_reports(output = REPORT_DIR, table_formats = TABLE_FORMATS, chart_formats = CHART_FORMATS,
+                  periods = PERIODS, workers = None, config_file = 'pinnacle_wh.ini'):
+    """
+    Write every report under output and return the number of tables
+    and charts written. workers is the number of chart processes,
+    None for one per CPU and 0 to draw the charts in this process.
+    """
+    menus = sales_queries.split_menus(do_query(*sales_queries.menus(), config_file=config_file)[0])
+    hierarchy = location_hierarchy(config_file)
+
+    reports = list(employee_reports(menus, hierarchy, periods)) + \
+              list(product_line_reports(menus, hierarchy, periods))
+
+    tables = 0
+    names = set()
+    batch = []
+    pending = []
+
+    with _chart_pool(workers) as pool:
+        for report, name, columns, query, chart in reports:
+            rows, _ = do_query(*query, config_file=config_file)
+
+            path = os.path.join(output, report, _file_name(name, report, names))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            for table_format in table_formats:
+                _write_table(f'{path}.{table_format}', columns, rows, table_format)
+                tables += 1
+
+            if chart != None and chart_formats and rows:
+                batch.append(_chart_job(chart, rows, [f'{path}.{chart_format}'
+                                                      for chart_format in chart_formats]))
+
+            # Charts are drawn while the next queries run.
+            if len(batch) == CHART_BATCH:
+                pending.append(_submit(pool, batch))
+                batch = []
+
+        if batch:
+            pending.append(_submit(pool, batch))
+
+        charts = sum(future.result() for future in pending)
+
+    return tables, charts
+
+def _chart_job(chart, rows, paths):
+    kind, title, label, period, label_column, year_column, value_column = chart
+
+    labels = [row[label_column] for row in rows]
+    if period != None:
+        labels = period_labels(labels, [row[year_column] for row in rows], period)
+
+    values = [float(row[value_column] or 0) for row in rows]
+    return kind, title, label, labels, values, paths
+
+def _chart_pool(workers):
+    if workers == 0:
+        return _InProcess()
+
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+def _submit(pool, batch):
+    return pool.submit(render_charts, list(batch))
+
+class _InProcess:
+    """
+    A stand-in for the process pool that draws the charts right away.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def submit(self, function, *args):
+        future = concurrent.futures.Future()
+        future.set_result(function(*args))
+        return future
+
+# Charts of a worker process by (type, line label), kept between jobs.
+_charts = {}
+
+def render_charts(jobs):
+    """
+    Draw each (type, title, line label, labels, values, paths) job and
+    save it to its paths. Return the number of files written.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from charts import LineChart, PieChart
+
+    written = 0
+    for kind, title, label, labels, values, paths in jobs:
+        chart = _charts.get((kind, label))
+        if chart == None:
+            figure = Figure(figsize=CHART_SIZES[kind])
+            FigureCanvasAgg(figure)
+            chart = LineChart(figure, label) if kind == 'line' else PieChart(figure)
+            figure.subplots_adjust(bottom=0.15)
+            _charts[(kind, label)] = chart
+
+        chart.update(title, labels, values)
+        for path in paths:
+            chart.save(path)
+            written += 1
+
+    return written
+
+def _file_name(name, report, names):
+    """
+    Return name made safe as a file name, numbered if another name of
+    report, such as one differing only in spaces, gives the same one.
+    """
+    base = re.sub(r'[^\w.-]+', '_', name).strip('_')
+
+    file_name = base
+    number = 1
+    while (report, file_name) in names:
+        number += 1
+        file_name = f'{base}_{number}'
+
+    names.add((report, file_name))
+    return file_name
+
+def _write_table(path, columns, rows, table_format):
+    with open(path, 'w', newline='') as fd:
+        if table_format == 'csv':
+            writer = csv.writer(fd)
+            writer.writerow(columns)
+            writer.writerows(rows)
+        else:
+            json.dump([dict(zip(columns, row)) for row in rows], fd, default=_json_value, indent=1)
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+
+    return str(value)
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the sales reports of the dialogs for every selection.')
+    parser.add_argument('--config', default='pinnacle_wh.ini', help='pinnacle_wh config')
+    parser.add_argument('--output', default=REPORT_DIR, help='directory the reports are written to')
+    parser.add_argument('--format', nargs='*', default=['csv'], choices=TABLE_FORMATS,
+                        help='table formats')
+    parser.add_argument('--charts', nargs='*', default=['png'], choices=CHART_FORMATS,
+                        help='chart formats, none to skip the charts')
+    parser.add_argument('--period', nargs='*', default=list(PERIODS), choices=PERIODS,
+                        help='monthly and/or quarterly sales')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='chart processes, 0 to draw them in this process')
+    parser.add_argument('--mode', default='cube', choices=QUERY_MODES,
+                        help='where the queries are answered')
+    parser.add_argument('--snapshot-dir', default=None, help='snapshot directory of --mode local')
+    args = parser.parse_args()
+
+    if args.mode != 'server':
+        set_query_mode(args.mode, args.snapshot_dir, args.config)
+
+    start = time.perf_counter()
+    tables, charts = build_reports(args.output, args.format, args.charts, args.period,
+                                   args.workers, args.config)
+    print(f'{tables} tables and {charts} charts written to {args.output} '
+          f'in {time.perf_counter() - start:.1f} s')
+
+if __name__ == '__main__':
+    main()
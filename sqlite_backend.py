@@ -0,0 +1,261 @@
+"""
+An in-process SQLite stand-in for the MySQL server.
+
+Select it in a config file with:
+
+    [mysql]
+    backend = sqlite
+    database = pinnacle_wh
+    path = pinnacle_wh.sqlite
+    attach = pinnacle_db:pinnacle_db.sqlite
+
+database is the schema name the SQL uses for this connection, path is
+the database file (or :memory: for an in-memory database shared by the
+connections of this process) and attach lists the other schemas that
+cross-schema names such as pinnacle_db.orders refer to.
+
+SQLiteConnection and SQLiteCursor follow the parts of the
+mysql.connector interface that mydbutils and Pinnacle_wh use, and
+translate the MySQL dialect of the project's SQL as it is executed.
+"""
+import calendar
+import datetime
+import functools
+import re
+import sqlite3
+import threading
+
+# Seconds a connection waits for another one's write lock.
+BUSY_TIMEOUT = 60
+
+# In-memory databases are dropped with their last connection, so one
+# connection per database is kept open for the life of the process.
+_memory_anchors = {}
+_memory_lock = threading.Lock()
+
+def _database_uri(name, path):
+    if path == ':memory:':
+        uri = f'file:{name}?mode=memory&cache=shared'
+
+        with _memory_lock:
+            if uri not in _memory_anchors:
+                _memory_anchors[uri] = sqlite3.connect(uri, uri=True)
+
+        return uri
+
+    return 'file:' + path
+
+def _parse_attach(attach):
+    """
+    Parse 'name:path, name:path' into a list of (name, path).
+    """
+    schemas = []
+    for item in attach.split(','):
+        if item.strip():
+            name, path = item.split(':', 1)
+            schemas.append((name.strip(), path.strip()))
+
+    return schemas
+
+class SQLiteConnection:
+    """
+    A SQLite connection that looks like a MySQLConnection.
+    """
+
+    def __init__(self, config):
+        self.database = config.get('database', 'main')
+        path = config.get('path', ':memory:')
+
+        self._conn = sqlite3.connect(_database_uri(self.database, path),
+                                     uri=True, timeout=BUSY_TIMEOUT,
+                                     check_same_thread=False)
+
+        for name, attached_path in _parse_attach(config.get('attach', '')):
+            self._conn.execute('ATTACH DATABASE ? AS ' + name,
+                               (_database_uri(name, attached_path),))
+
+        _register_functions(self._conn)
+        self._closed = False
+
+    # Warnings are a MySQL feature, SQLite raises errors instead.
+    warning_count = 0
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def cursor(self, buffered=None, prepared=False, **kwargs):
+        # sqlite3 caches compiled statements per connection by itself,
+        # so prepared cursors need no special handling.
+        return SQLiteCursor(self)
+
+    def is_connected(self):
+        return not self._closed
+
+    def consume_results(self):
+        pass
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        if not self._closed:
+            self._conn.close()
+            self._closed = True
+
+class SQLiteCursor:
+    """
+    A sqlite3 cursor that accepts MySQL-flavoured SQL and %s parameters.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection._conn.cursor()
+        self._fetched = 0
+
+    @property
+    def rowcount(self):
+        # sqlite3 reports -1 for queries, MySQL the rows fetched so far.
+        if self._cursor.rowcount == -1:
+            return self._fetched
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, sql, params=None, multi=False):
+        self._fetched = 0
+        sql = translate(sql, self._connection.database)
+
+        if params == None:
+            self._cursor.execute(sql)
+        else:
+            self._cursor.execute(sql, tuple(params))
+
+    def executemany(self, sql, seq_params):
+        self._fetched = 0
+        sql = translate(sql, self._connection.database)
+        self._cursor.executemany(sql, seq_params)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row != None:
+            self._fetched += 1
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._cursor.fetchmany(size)
+        self._fetched += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._fetched += len(rows)
+        return rows
+
+    def close(self):
+        self._cursor.close()
+
+# String literals and everything in between. Backtick identifiers
+# are left in the code, SQLite accepts them as they are.
+_LITERALS = re.compile(r"""('(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")""", re.S)
+_BACKSLASH_ESCAPES = {'0': '\0', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+_AUTO_INCREMENT = re.compile(r'\bINT(?:EGER)?\b((?:\s+NOT\s+NULL)?)\s+AUTO_INCREMENT\b', re.I)
+_INDEX_CLAUSE = re.compile(r',\s*(UNIQUE\s+)?KEY\s+`?\w+`?\s*(\([^)]*\))', re.I)
+_PLACEHOLDER = re.compile(r'%s')
+_CREATE_INDEX = re.compile(r'\b(CREATE\s+(?:UNIQUE\s+)?INDEX\s+)(`?\w+`?)\s+ON\s+(`?\w+`?)\.', re.I)
+_ANALYZE_TABLE = re.compile(r'\bANALYZE\s+TABLE\b', re.I)
+_UNQUALIFIED_DDL = re.compile(r'\b((?:DROP|ALTER)\s+(?:TABLE|INDEX)\s+(?:IF\s+EXISTS\s+)?)(`\w+`|\w+)(?![\w`]|\s*\.)', re.I)
+
+def _sqlite_literal(literal):
+    """
+    Rewrite a MySQL quoted string, which may use backslash escapes,
+    as a SQLite single quoted string.
+    """
+    quote = literal[0]
+    body = literal[1:-1].replace(quote + quote, quote)
+    body = re.sub(r'\\(.)', lambda m: _BACKSLASH_ESCAPES.get(m.group(1), m.group(1)),
+                  body, flags=re.S)
+
+    return "'" + body.replace("'", "''") + "'"
+
+def _translate_code(code, database):
+    code = _PLACEHOLDER.sub('?', code)
+    code = re.sub(r'\b' + re.escape(database) + r'\.', 'main.', code)
+    code = _AUTO_INCREMENT.sub(r'INTEGER\1', code)
+
+    # SQLite looks for unqualified names in the attached schemas too,
+    # MySQL only in the connection's own one. Keep DROP and ALTER
+    # from reaching into another schema.
+    code = _UNQUALIFIED_DDL.sub(r'\1main.\2', code)
+
+    # MySQL qualifies the table of an index, SQLite the index itself.
+    code = _CREATE_INDEX.sub(r'\1\3.\2 ON ', code)
+    code = _ANALYZE_TABLE.sub('ANALYZE', code)
+
+    # Indexes cannot be declared inside CREATE TABLE,
+    # unique ones become table constraints.
+    code = _INDEX_CLAUSE.sub(lambda m: ', UNIQUE ' + m.group(2) if m.group(1) else '', code)
+
+    return code
+
+@functools.lru_cache(maxsize=512)
+def translate(sql, database):
+    """
+    Translate a MySQL statement to SQLite. Names qualified with this
+    connection's own schema are pointed at the main database.
+    """
+    parts = _LITERALS.split(sql)
+
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            parts[i] = _translate_code(part, database)
+        else:
+            parts[i] = _sqlite_literal(part)
+
+    return ''.join(parts)
+
+def _date(value):
+    if value == None:
+        return None
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+def _date_function(part):
+    def function(value):
+        date = _date(value)
+        return None if date == None else part(date)
+    return function
+
+def _concat(*values):
+    # As in MySQL, the result is NULL if any argument is NULL.
+    if any(value == None for value in values):
+        return None
+    return ''.join(str(value) for value in values)
+
+_FUNCTIONS = {
+    'dayname': _date_function(lambda d: calendar.day_name[d.weekday()]),
+    'day': _date_function(lambda d: d.day),
+    'dayofmonth': _date_function(lambda d: d.day),
+    'month': _date_function(lambda d: d.month),
+    'quarter': _date_function(lambda d: (d.month - 1) // 3 + 1),
+    'year': _date_function(lambda d: d.year),
+}
+
+def _register_functions(conn):
+    """
+    Add the MySQL date and string functions the ETL uses.
+    """
+    for name, function in _FUNCTIONS.items():
+        conn.create_function(name, 1, function, deterministic=True)
+
+    conn.create_function('concat', -1, _concat, deterministic=True)
@@ -0,0 +1,106 @@
+"""
+Fixtures building the pinnacle_db and pinnacle_wh databases on SQLite
+from the synthetic data of benchmark.py.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import benchmark
+from etl_log import RunLog
+from mydbutils import close_pools, insert_csv, pooled_connection, set_query_mode
+from Pinnacle_wh import AGGREGATES, perform_ETL_warehouse
+
+# Order lines of the test databases.
+ORDER_LINES = 3000
+
+def load_warehouse(db_config, wh_config, incremental = False, engine = 'sql'):
+    """
+    Run perform_ETL_warehouse without writing the run log file.
+    """
+    return perform_ETL_warehouse(db_config, wh_config, incremental, None, engine,
+                                 RunLog('warehouse', path=None))
+
+def fetch(config_file, sql):
+    with pooled_connection(config_file) as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+def warehouse_rows(wh_config, tables = ('shippedorders',) + tuple(AGGREGATES)):
+    """
+    Return the sorted rows of each of tables by table name, with
+    product line names for their IDs, which differ between loads, and
+    numbers rounded past the order in which SQLite added them up.
+    """
+    lines = dict(fetch(wh_config, "SELECT productLineID, productLineName FROM productline"))
+    contents = {}
+
+    for table in tables:
+        with pooled_connection(wh_config) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT * FROM {table}")
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+            cursor.close()
+
+        line = columns.index('productLineID') if 'productLineID' in columns else None
+        contents[table] = sorted(
+            tuple(lines[value] if i == line else _value(value) for i, value in enumerate(row))
+            for row in rows)
+
+    return contents
+
+def _value(value):
+    return f'{float(value):.6f}' if isinstance(value, (int, float)) else str(value)
+
+def _build(workdir):
+    """
+    Create and fill pinnacle_db in workdir, load the warehouse in full
+    and return the paths of the two configs.
+    """
+    db_config, wh_config = benchmark._write_sqlite_configs(workdir)
+    csv_file = os.path.join(workdir, 'orderdetails.csv')
+
+    benchmark._create_schema(db_config)
+    benchmark.generate_data(db_config, ORDER_LINES, csv_file)
+    insert_csv('INSERT INTO orderdetails VALUES (%s, %s, %s, %s)', csv_file, db_config, 10000,
+               RunLog('insert', path=None))
+    load_warehouse(db_config, wh_config)
+    return db_config, wh_config
+
+@pytest.fixture(autouse=True)
+def _server_mode():
+    yield
+    set_query_mode('server')
+
+@pytest.fixture(scope='session')
+def warehouse(tmp_path_factory):
+    """
+    (db_config, wh_config) of loaded databases shared by the tests that
+    only read them.
+    """
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(benchmark, 'SCHEMA_FILE', os.path.join(ROOT, benchmark.SCHEMA_FILE))
+        configs = _build(str(tmp_path_factory.mktemp('warehouse')))
+
+    yield configs
+    close_pools()
+
+@pytest.fixture
+def fresh_warehouse(tmp_path, monkeypatch):
+    """
+    (db_config, wh_config) of loaded databases of one test, which may
+    change them.
+    """
+    monkeypatch.setattr(benchmark, 'SCHEMA_FILE', os.path.join(ROOT, benchmark.SCHEMA_FILE))
+    configs = _build(str(tmp_path))
+
+    yield configs
+    close_pools()
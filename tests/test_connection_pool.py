@@ -0,0 +1,54 @@
+"""
+Connections of a closed pool are closed instead of kept idle.
+"""
+import mydbutils
+
+class FakeConnection:
+    in_transaction = False
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def _pool(monkeypatch, tmp_path):
+    config_file = tmp_path / 'test.ini'
+    config_file.write_text('[mysql]\nbackend = sqlite\ndatabase = test\n'
+                           f'path = {tmp_path / "test.sqlite"}\n')
+    monkeypatch.setattr(mydbutils, '_connect', lambda config: FakeConnection())
+    return mydbutils.ConnectionPool(str(config_file), 'mysql')
+
+def test_release_keeps_connection(monkeypatch, tmp_path):
+    pool = _pool(monkeypatch, tmp_path)
+    conn = pool.get_connection()
+    pool.release(conn)
+
+    assert not conn.closed
+    assert pool.get_connection() is conn
+
+def test_close_closes_idle_and_checked_out(monkeypatch, tmp_path):
+    pool = _pool(monkeypatch, tmp_path)
+    idle = pool.get_connection()
+    checked_out = pool.get_connection()
+    pool.release(idle)
+
+    pool.close()
+    assert idle.closed
+    assert not checked_out.closed
+
+    pool.release(checked_out)
+    assert checked_out.closed
+
+    later = pool.get_connection()
+    pool.release(later)
+    assert later.closed
+
+def test_close_pools_replaces_pools(tmp_path):
+    config_file = tmp_path / 'test.ini'
+    config_file.write_text('[mysql]\nbackend = sqlite\ndatabase = test\n'
+                           f'path = {tmp_path / "test.sqlite"}\n')
+    pool = mydbutils.get_pool(str(config_file))
+
+    mydbutils.close_pools()
+    assert mydbutils.get_pool(str(config_file)) is not pool
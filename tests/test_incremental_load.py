@@ -0,0 +1,50 @@
+"""
+An incremental load after changes to the operational data has to leave
+the warehouse as a full load of the same data would.
+"""
+from conftest import fetch, load_warehouse, warehouse_rows
+from mydbutils import pooled_connection
+
+def _execute(config_file, *statements):
+    with pooled_connection(config_file) as conn:
+        cursor = conn.cursor()
+        for sql, params in statements:
+            cursor.execute(sql, params)
+        conn.commit()
+        cursor.close()
+
+def test_incremental_load_matches_full_load(fresh_warehouse):
+    db_config, wh_config = fresh_warehouse
+
+    customer, rep = fetch(db_config, """
+        SELECT o.customerNumber, c.salesRepEmployeeNumber FROM orders o
+        JOIN customers c ON c.customerNumber = o.customerNumber
+        WHERE o.status = 'Shipped' ORDER BY o.orderNumber LIMIT 1""")[0]
+    other_rep = fetch(db_config, f"""
+        SELECT min(employeeNumber) FROM employees
+        WHERE jobTitle = 'Sales Rep' AND employeeNumber <> {rep}""")[0][0]
+    product, line = fetch(db_config, """
+        SELECT productCode, productLine FROM products
+        WHERE productCode IN (SELECT productCode FROM orderdetails)
+        ORDER BY productCode LIMIT 1""")[0]
+    last_shipped = fetch(db_config, "SELECT max(shippedDate) FROM orders")[0][0]
+
+    # The customer moves to another city and sales rep, the product to
+    # another line, and the customer orders the product again.
+    _execute(db_config,
+             ("UPDATE customers SET city = %s, country = %s, salesRepEmployeeNumber = %s "
+              "WHERE customerNumber = %s", ('Oslo', 'Norway', other_rep, customer)),
+             ("UPDATE products SET productLine = %s WHERE productCode = %s",
+              ('Ships' if line != 'Ships' else 'Planes', product)),
+             ("INSERT INTO orders VALUES (%s, %s, %s, %s, %s, %s)",
+              (999999, last_shipped, last_shipped, last_shipped, 'Shipped', customer)),
+             ("INSERT INTO orderdetails VALUES (%s, %s, %s, %s)", (999999, product, 30, 99.99)))
+
+    load_warehouse(db_config, wh_config, incremental=True)
+    incremental = warehouse_rows(wh_config)
+
+    load_warehouse(db_config, wh_config)
+    full = warehouse_rows(wh_config)
+
+    for table in full:
+        assert incremental[table] == full[table], table
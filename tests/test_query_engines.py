@@ -0,0 +1,57 @@
+"""
+The engines that answer the dashboard queries without the database
+server have to return what the server does, and the frames ETL engine
+has to load what the SQL one does.
+"""
+import pytest
+
+import benchmark
+from conftest import load_warehouse, warehouse_rows
+from mydbutils import do_query, set_query_mode
+from Pinnacle_wh import AGGREGATES
+from warehouse_snapshot import export_snapshot
+
+def _rows(query, wh_config):
+    """
+    Return the rows of query with every number to the cent, as the
+    dialogs show them, so integer and float sums of the same amounts
+    compare equal.
+    """
+    rows, _ = do_query(*query, config_file=wh_config)
+    return [tuple(f'{float(value):.2f}' if isinstance(value, (int, float)) else value
+                  for value in row) for row in rows]
+
+def _results(wh_config):
+    return [(name, query, _rows(query, wh_config))
+            for name, query in benchmark._dialog_queries(wh_config)]
+
+@pytest.fixture(scope='module')
+def server_results(warehouse):
+    return _results(warehouse[1])
+
+def test_cube_matches_server(warehouse, server_results):
+    wh_config = warehouse[1]
+    set_query_mode('cube', None, wh_config)
+
+    for name, query, rows in server_results:
+        assert _rows(query, wh_config) == rows, (name, query[1])
+
+def test_local_matches_server(warehouse, server_results, tmp_path):
+    wh_config = warehouse[1]
+    export_snapshot(wh_config, str(tmp_path))
+    set_query_mode('local', str(tmp_path), wh_config)
+
+    for name, query, rows in server_results:
+        assert _rows(query, wh_config) == rows, (name, query[1])
+
+def test_frames_load_matches_sql_load(fresh_warehouse):
+    db_config, wh_config = fresh_warehouse
+    tables = ('calendar', 'salesrepemployee', 'products', 'customers', 'shippedorders') \
+             + tuple(AGGREGATES)
+    sql = warehouse_rows(wh_config, tables)
+
+    load_warehouse(db_config, wh_config, engine='frames')
+    frames = warehouse_rows(wh_config, tables)
+
+    for table in tables:
+        assert frames[table] == sql[table], table
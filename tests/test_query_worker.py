@@ -0,0 +1,24 @@
+"""
+A query worker has to report back even when its query fails, or the
+dialog keeps the busy cursor and its widgets disabled.
+"""
+import QueryWorker
+
+def _run(query):
+    worker = QueryWorker.QueryWorker(7, query)
+    results = []
+    worker.signals.finished.connect(lambda ticket, rows: results.append((ticket, rows)))
+    worker.run()
+    return results
+
+def test_finished_with_rows(monkeypatch):
+    monkeypatch.setattr(QueryWorker, 'do_query_cached', lambda sql, params: ([(1,)], None))
+    assert _run(('SELECT 1', None)) == [(7, [(1,)])]
+
+def test_finished_without_rows_on_error(monkeypatch, capsys):
+    def fail(sql, params):
+        raise RuntimeError('server gone')
+
+    monkeypatch.setattr(QueryWorker, 'do_query_cached', fail)
+    assert _run(('SELECT 1', None)) == [(7, [])]
+    assert 'server gone' in capsys.readouterr().out
@@ -0,0 +1,58 @@
+"""
+Splitting SQL scripts into statements with iter_sql_statements.
+"""
+import io
+
+import pytest
+
+from mydbutils import iter_sql_statements
+
+def _statements(script):
+    return list(iter_sql_statements(io.StringIO(script)))
+
+@pytest.mark.parametrize('script, statements', [
+    ("SELECT 1; SELECT 2;", ["SELECT 1", "SELECT 2"]),
+    ("SELECT 1;SELECT 2;SELECT 3", ["SELECT 1", "SELECT 2", "SELECT 3"]),
+    ("SELECT 1;\nSELECT\n  2", ["SELECT 1", "SELECT\n  2"]),
+    (";;\n  ;\n", []),
+])
+def test_statements(script, statements):
+    assert _statements(script) == statements
+
+@pytest.mark.parametrize('script, statements', [
+    ("INSERT INTO t VALUES ('a;b', \"c;d\", `e;f`);",
+     ["INSERT INTO t VALUES ('a;b', \"c;d\", `e;f`)"]),
+    ("INSERT INTO t VALUES ('it''s; ok');", ["INSERT INTO t VALUES ('it''s; ok')"]),
+    ("INSERT INTO t VALUES ('back\\\\slash\\'; quote');",
+     ["INSERT INTO t VALUES ('back\\\\slash\\'; quote')"]),
+    ("INSERT INTO t VALUES ('multi\nline; text');\nSELECT 2;",
+     ["INSERT INTO t VALUES ('multi\nline; text')", "SELECT 2"]),
+])
+def test_quotes(script, statements):
+    assert _statements(script) == statements
+
+@pytest.mark.parametrize('script, statements', [
+    ("SELECT 1; -- comment; here\nSELECT 2; # another; one\n", ["SELECT 1", "SELECT 2"]),
+    ("SELECT 1 /* block; comment */ + 1;", ["SELECT 1 /* block; comment */ + 1"]),
+    ("/*!40101 SET x = 1 */;", ["/*!40101 SET x = 1 */"]),
+    ("SELECT /* a\n; b */ 1;", ["SELECT /* a\n; b */ 1"]),
+    # Without a space after it, -- is two minus signs.
+    ("SELECT 1 --1;\n", ["SELECT 1 --1"]),
+])
+def test_comments(script, statements):
+    assert _statements(script) == statements
+
+def test_delimiter():
+    script = ("DELIMITER //\n"
+              "CREATE PROCEDURE p() BEGIN SELECT 1; SELECT 2; END//\n"
+              "DELIMITER ;\n"
+              "SELECT 3;")
+
+    assert _statements(script) == ["CREATE PROCEDURE p() BEGIN SELECT 1; SELECT 2; END",
+                                   "SELECT 3"]
+
+def test_long_statement():
+    values = ',\n'.join(f"({i}, 'name; {i}')" for i in range(20000))
+    script = f"INSERT INTO t VALUES\n{values};\nSELECT 1;"
+
+    assert _statements(script) == [f"INSERT INTO t VALUES\n{values}", "SELECT 1"]
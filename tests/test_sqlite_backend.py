@@ -0,0 +1,26 @@
+"""
+Translating the MySQL statements of the application to SQLite.
+"""
+import pytest
+
+from sqlite_backend import translate
+
+@pytest.mark.parametrize('sql, translated', [
+    # Placeholders, and the connection's own schema is the main database.
+    ("SELECT * FROM pinnacle_db.orders WHERE a = %s", "SELECT * FROM main.orders WHERE a = ?"),
+    ("SELECT * FROM pinnacle_wh.calendar", "SELECT * FROM pinnacle_wh.calendar"),
+    # Strings are rewritten as SQLite strings and left alone otherwise.
+    ("SELECT 'it\\'s %s pinnacle_db.x', \"dq\"", "SELECT 'it''s %s pinnacle_db.x', 'dq'"),
+    ("SELECT 'a\\nb', 'c''d'", "SELECT 'a\nb', 'c''d'"),
+    # DDL.
+    ("CREATE TABLE t (id INT NOT NULL AUTO_INCREMENT, name VARCHAR(5), PRIMARY KEY(id), "
+     "KEY name (name), UNIQUE KEY u (name))",
+     "CREATE TABLE t (id INTEGER NOT NULL, name VARCHAR(5), PRIMARY KEY(id), UNIQUE (name))"),
+    ("CREATE INDEX idx ON pinnacle_wh.t (a)", "CREATE INDEX pinnacle_wh.idx ON t (a)"),
+    ("DROP TABLE IF EXISTS t", "DROP TABLE IF EXISTS main.t"),
+    ("ALTER TABLE `t` RENAME TO u", "ALTER TABLE main.`t` RENAME TO u"),
+    ("DROP TABLE pinnacle_wh.t", "DROP TABLE pinnacle_wh.t"),
+    ("ANALYZE TABLE t", "ANALYZE t"),
+])
+def test_translate(sql, translated):
+    assert translate(sql, 'pinnacle_db') == translated
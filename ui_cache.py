@@ -0,0 +1,70 @@
+"""
+Qt Designer forms compiled to Python once.
+
+uic.loadUi parses a .ui file and builds the form from the XML every time
+a window is created. load_ui compiles the file with uic.compileUi into
+UI_CACHE_DIR next to it, again only when the .ui file has changed since,
+and builds the window from the compiled module.
+"""
+import importlib.util
+import os
+import xml.etree.ElementTree as ElementTree
+
+from PyQt5 import uic, QtWidgets
+
+# Directory, next to the .ui files, the compiled forms are kept in.
+UI_CACHE_DIR = '__uicache__'
+
+def load_ui(filename):
+    """
+    Return the top-level widget of a .ui file with its child widgets
+    as attributes, as uic.loadUi does. Fall back to uic.loadUi if the
+    form cannot be compiled to the cache.
+    """
+    try:
+        module = _compiled_form(filename)
+    except OSError as e:
+        print(f'Could not compile {filename}')
+        print(e)
+
+        return uic.loadUi(filename)
+
+    widget = getattr(QtWidgets, module.WIDGET_CLASS)()
+    form = getattr(module, module.FORM_CLASS)()
+    form.setupUi(widget)
+
+    for name, value in vars(form).items():
+        setattr(widget, name, value)
+
+    return widget
+
+def _compiled_form(filename):
+    """
+    Return the module compiled from a .ui file, compiling it first if
+    it is missing or older than the file.
+    """
+    directory, name = os.path.split(os.path.abspath(filename))
+    cache_dir = os.path.join(directory, UI_CACHE_DIR)
+    compiled = os.path.join(cache_dir, 'ui_' + os.path.splitext(name)[0] + '.py')
+
+    if (not os.path.exists(compiled)
+            or os.path.getmtime(compiled) < os.path.getmtime(filename)):
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Which widget to create and which class sets it up, so loading
+        # a compiled form does not parse the XML again.
+        root = ElementTree.parse(filename).getroot()
+        form_class = 'Ui_' + root.findtext('class')
+        widget_class = root.find('widget').get('class')
+
+        partial = compiled + '.partial'
+        with open(partial, 'w') as fd:
+            uic.compileUi(filename, fd)
+            fd.write(f'\nFORM_CLASS = {form_class!r}\nWIDGET_CLASS = {widget_class!r}\n')
+        os.replace(partial, compiled)
+
+    spec = importlib.util.spec_from_file_location('ui_' + os.path.splitext(name)[0], compiled)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
@@ -0,0 +1,345 @@
+"""
+Parquet snapshots of the warehouse star schema.
+
+    python warehouse_snapshot.py --config pinnacle_wh.ini --directory snapshots
+
+export_snapshot writes the fact table and its dimensions to one
+zstd-compressed Parquet file per table, in a directory of their own
+under the snapshot directory, and points the LATEST file there once
+every table is written. perform_ETL_warehouse(snapshot_dir=...) exports
+one after each run.
+
+LocalWarehouse answers the dialog queries of sales_queries from the
+newest snapshot with pandas, without a database server. It is used by
+mydbutils.set_query_mode('local').
+"""
+import argparse
+import datetime
+import os
+import shutil
+import threading
+from decimal import Decimal
+
+import pandas as pd
+
+import sales_queries
+from etl_frames import read_frame, frame_rows
+from mydbutils import pooled_connection, normalize_sql, bump_warehouse_version
+from sales_cube import average_price, round_cents
+import etl_log
+
+# Default directory the snapshots are written to.
+SNAPSHOT_DIR = 'snapshots'
+
+# Snapshots kept besides the newest one.
+SNAPSHOTS_KEPT = 3
+
+# Parquet compression codec.
+COMPRESSION = 'zstd'
+
+# The star schema: the fact table and its dimensions.
+SNAPSHOT_TABLES = ('calendar', 'salesrepemployee', 'productline', 'products',
+                   'customers', 'shippedorders')
+
+# File naming the newest complete snapshot.
+LATEST = 'LATEST'
+
+def export_snapshot(config_file = 'pinnacle_wh.ini', directory = SNAPSHOT_DIR, keep = SNAPSHOTS_KEPT):
+    """
+    Export SNAPSHOT_TABLES from the warehouse to a new snapshot under
+    directory and make it the latest one. Decimal columns are written
+    as doubles. All but the keep newest older snapshots are removed.
+    Return the path of the snapshot.
+    """
+    name = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    path = os.path.join(directory, name)
+
+    # Readers only see the snapshot once every table is written.
+    partial = path + '.partial'
+    os.makedirs(partial)
+
+    try:
+        with pooled_connection(config_file) as conn:
+            if conn == None:
+                raise Exception(f'Could not connect with {config_file}')
+
+            for table in SNAPSHOT_TABLES:
+                frame = _decimals_to_float(read_frame(conn, f'SELECT * FROM {table}'))
+                frame.to_parquet(os.path.join(partial, table + '.parquet'),
+                                 compression=COMPRESSION, index=False)
+                etl_log.add(rows = len(frame))
+    except Exception:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+
+    os.rename(partial, path)
+
+    latest = os.path.join(directory, LATEST)
+    with open(latest + '.partial', 'w') as fd:
+        fd.write(name + '\n')
+    os.replace(latest + '.partial', latest)
+
+    _remove_old_snapshots(directory, name, keep)
+
+    return path
+
+def _decimals_to_float(frame):
+    for column in frame.columns:
+        values = frame[column].dropna()
+        if len(values) and isinstance(values.iloc[0], Decimal):
+            frame[column] = frame[column].astype(float)
+
+    return frame
+
+def _remove_old_snapshots(directory, newest, keep):
+    names = sorted(name for name in os.listdir(directory)
+                   if name != newest and os.path.isdir(os.path.join(directory, name))
+                   and not name.endswith('.partial'))
+
+    for name in names[:max(len(names) - keep, 0)]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+def latest_snapshot(directory = SNAPSHOT_DIR):
+    """
+    Return the path of the newest snapshot under directory, or None.
+    """
+    try:
+        with open(os.path.join(directory, LATEST)) as fd:
+            name = fd.read().strip()
+    except FileNotFoundError:
+        return None
+
+    return os.path.join(directory, name)
+
+class LocalWarehouse:
+    """
+    The dialog queries, answered from the newest snapshot in directory.
+    The snapshot is loaded on the first query and again once a newer
+    one is exported, which also invalidates the cached query results.
+    """
+
+    def __init__(self, directory = SNAPSHOT_DIR):
+        self.directory = directory
+        self._queries = {normalize_sql(sql): entry
+                         for sql, entry in sales_queries.dialog_queries().items()}
+        self._path = None
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def query(self, sql, params = None):
+        """
+        Answer a query of sales_queries and return [rows, count] as
+        do_query does. Raise LookupError for any other query.
+        """
+        entry = self._queries.get(normalize_sql(sql))
+        if entry == None:
+            raise LookupError('The warehouse snapshot cannot answer this query')
+
+        method, args = entry
+        frame = getattr(self, method)(*args, *(params or ()))
+
+        rows = frame_rows(frame)
+        return [rows, len(rows)]
+
+    def check(self):
+        """
+        Bump the warehouse version if a newer snapshot has been exported
+        since the tables were loaded, which drops the cached results and
+        makes the next query load it.
+        """
+        path = latest_snapshot(self.directory)
+
+        with self._lock:
+            if self._path != None and path != self._path:
+                self._path = None
+                bump_warehouse_version()
+
+    def _load(self):
+        """
+        Return the tables of the newest snapshot, loading it if needed.
+        """
+        path = latest_snapshot(self.directory)
+        if path == None:
+            raise Exception(f'No warehouse snapshot in {self.directory}')
+
+        with self._lock:
+            if path != self._path:
+                tables = {table: pd.read_parquet(os.path.join(path, table + '.parquet'))
+                          for table in SNAPSHOT_TABLES}
+                _denormalize(tables)
+
+                self._tables = tables
+                if self._path != None:
+                    bump_warehouse_version()
+                self._path = path
+
+            return self._tables
+
+    def menus(self):
+        menus = {'countries': self.countries_menu(), 'employees': self.employees_menu(),
+                 'product_lines': self.product_lines_menu(), 'years': self.years_menu()}
+
+        # (menu, value, second value, sort key) as sales_queries.menus().
+        rows = [(menu,) + row + (None,) * (3 - len(row))
+                for menu in sales_queries.MENUS for row in frame_rows(menus[menu])]
+        return pd.DataFrame(rows)
+
+    def employees_menu(self):
+        reps = self._load()['salesrepemployee']
+        return reps[['firstName', 'lastName']].sort_values(['firstName', 'lastName'])
+
+    def countries_menu(self):
+        customers = self._load()['customers']
+        return pd.DataFrame({'country': sorted(customers['country'].dropna().unique())})
+
+    def cities_menu(self, country):
+        customers = self._load()['customers']
+        cities = customers.loc[customers['country'] == country, 'city'].dropna().unique()
+        return pd.DataFrame({'city': sorted(cities)})
+
+    def locations(self):
+        customers = self._load()['customers'].dropna(subset=['country', 'city'])
+        return (customers.groupby(['country', 'city']).size()
+                .reset_index().sort_values(['country', 'city']))
+
+    def product_lines_menu(self):
+        return self._load()['productline'][['productLineName']]
+
+    def years_menu(self):
+        calendar = self._load()['calendar']
+        return pd.DataFrame({'year': calendar['year'].unique()})
+
+    def employee_sales(self, period, first_name, last_name):
+        tables = self._load()
+        reps = tables['salesrepemployee']
+        reps = reps[(reps['firstName'] == first_name) & (reps['lastName'] == last_name)]
+
+        facts = tables['shippedorders']
+        sums = _rollup(facts, facts['salesRepEmployeeNumber'].isin(reps['employeeNumber']),
+                       ['salesRepEmployeeNumber'], period)
+
+        return _sales(_with_reps(sums, reps), ['firstName', 'lastName', 'managerName'],
+                      period, prices = False)
+
+    def employee_sales_location(self, period, country, city = 'All'):
+        tables = self._load()
+        facts = tables['shippedorders']
+        sums = _rollup(facts, _in_location(facts, country, city),
+                       ['country', 'city', 'salesRepEmployeeNumber'], period)
+
+        return _sales(_with_reps(sums, tables['salesrepemployee']),
+                      ['country', 'city', 'firstName', 'lastName', 'managerName'],
+                      period, prices = False)
+
+    def product_line_sales(self, period, product_line):
+        facts = self._load()['shippedorders']
+        sums = _rollup(facts, facts['productLineName'] == product_line,
+                       ['productLineName'], period)
+
+        return _sales(sums, ['productLineName'], period)
+
+    def product_line_sales_location(self, period, country, city = 'All'):
+        facts = self._load()['shippedorders']
+        sums = _rollup(facts, _in_location(facts, country, city),
+                       ['country', 'city', 'productLineName'], period)
+
+        return _sales(sums, ['country', 'city', 'productLineName'], period)
+
+    def product_line_share(self, country, year):
+        facts = self._load()['shippedorders']
+        selected = _in_location(facts, country, 'All') & (facts['year'] == int(year))
+        sums = _rollup(facts, selected, ['country', 'productLineName'], None)
+
+        return _sales(sums, ['country', 'productLineName'], None)
+
+def _denormalize(tables):
+    """
+    Add the calendar columns, the revenue and the names the queries
+    filter and group by to the fact rows. The names are categoricals,
+    so comparing and grouping them works on integer codes.
+    """
+    facts = tables['shippedorders'].drop(columns=['orderNumber', 'productCode'])
+    tables['shippedorders'] = facts
+
+    # The calendar columns follow from the key, YYYYMMDD.
+    facts['year'] = facts['calendar_key'] // 10000
+    facts['month'] = facts['calendar_key'] // 100 % 100
+    facts['qtr'] = (facts['month'] - 1) // 3 + 1
+    facts['revenue'] = facts['quantityOrdered'] * facts['priceEach']
+
+    customers = tables['customers'].set_index('customerNumber')
+    lines = tables['productline'].set_index('productLineID')
+    for column, key, dimension in (('country', 'customerNumber', customers),
+                                   ('city', 'customerNumber', customers),
+                                   ('productLineName', 'productLineID', lines)):
+        facts[column] = facts[key].map(dimension[column]).astype('category')
+
+def _in_location(facts, country, city):
+    """
+    Select the fact rows of one city, or of every city of country
+    if city is 'All'.
+    """
+    selected = facts['country'] == country
+    if city != 'All':
+        selected &= facts['city'] == city
+
+    return selected
+
+def _with_reps(sums, reps):
+    return sums.merge(reps[['employeeNumber', 'firstName', 'lastName', 'managerName']],
+                      left_on='salesRepEmployeeNumber', right_on='employeeNumber')
+
+def _period_keys(period):
+    return ([period] if period != None else []) + ['year']
+
+def _rollup(facts, selected, columns, period):
+    """
+    Sum the selected fact rows by columns, the period (or none) and the
+    year, with priceEach the sum of the prices and lineCount the number
+    of rows. The sums can be added up again, so grouping by keys first
+    and joining names to the far fewer sums is exact.
+    """
+    keys = columns + _period_keys(period)
+
+    # Only copy the columns the sums need.
+    facts = facts.loc[selected, keys + ['quantityOrdered', 'priceEach', 'revenue']]
+
+    grouped = facts.groupby(keys, observed=True, sort=False)
+
+    sums = grouped.sum()
+    sums['lineCount'] = grouped.size()
+    return sums.reset_index()
+
+def _sales(sums, columns, period, prices = True):
+    """
+    Add up sums of _rollup by columns, the period (or none) and the
+    year into the columns of the SQL query: the quantity and the
+    average price if prices is true, then the revenue. Rows are sorted
+    by columns, the year and the period as the SQL orders them.
+    """
+    keys = columns + _period_keys(period)
+    order = columns + ['year'] + ([period] if period != None else [])
+
+    sales = sums.groupby(keys, dropna=False, observed=True, sort=False)[
+        ['quantityOrdered', 'priceEach', 'lineCount', 'revenue']].sum().reset_index()
+    # Rounded half up as the SQL ROUND, not half to even as pandas.
+    sales['price'] = average_price(sales['priceEach'], sales['lineCount'])
+    sales['revenue'] = round_cents(sales['revenue'])
+    sales = sales.sort_values(order)
+
+    values = ['quantityOrdered', 'price', 'revenue'] if prices else ['revenue']
+    return sales[keys + values]
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a Parquet snapshot of the warehouse.')
+    parser.add_argument('--config', default='pinnacle_wh.ini', help='pinnacle_wh config')
+    parser.add_argument('--directory', default=SNAPSHOT_DIR,
+                        help='directory the snapshots are written to')
+    parser.add_argument('--keep', type=int, default=SNAPSHOTS_KEPT,
+                        help='older snapshots to keep')
+    args = parser.parse_args()
+
+    print(export_snapshot(args.config, args.directory, args.keep))
+
+if __name__ == '__main__':
+    main()